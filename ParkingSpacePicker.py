@@ -1,7 +1,12 @@
+import time
+
 import cv2
 import pickle
+import numpy as np
 
 width, height = 107, 48
+saveDelay = 1.0  # seconds after the last edit before CarParkPos is written
+dragThreshold = 5  # pixels the mouse must move before a click becomes a drag
 
 try:
     with open('CarParkPos', 'rb') as f:
@@ -9,25 +14,136 @@ try:
 except:
     posList = []
 
+# Load the lot image once; fall back to a blank canvas so layouts can still be edited
+baseImg = cv2.imread('carParkImg.png')
+if baseImg is None:
+    baseImg = np.full((720, 1280, 3), 40, np.uint8)
+
+selected = set()
+undoStack = []
+redoStack = []
+dragStart = None
+dragRect = None
+slotsRender = None  # lot image with every slot drawn, rebuilt only when slots change
+dirty = True
+redraw = True
+saveDue = None
+
+
+def edit(newList):
+    """Apply a layout change with undo history and a debounced save"""
+    global posList, dirty, saveDue
+    undoStack.append(list(posList))
+    redoStack.clear()
+    posList = newList
+    selected.clear()
+    dirty = True
+    saveDue = time.time() + saveDelay
+
+
+def undo():
+    global posList, dirty, saveDue
+    if undoStack:
+        redoStack.append(posList)
+        posList = undoStack.pop()
+        selected.clear()
+        dirty = True
+        saveDue = time.time() + saveDelay
+
+
+def redo():
+    global posList, dirty, saveDue
+    if redoStack:
+        undoStack.append(posList)
+        posList = redoStack.pop()
+        selected.clear()
+        dirty = True
+        saveDue = time.time() + saveDelay
+
+
+def save():
+    global saveDue
+    with open('CarParkPos', 'wb') as f:
+        pickle.dump(posList, f)
+    saveDue = None
+
+
+def slotsInRect(x1, y1, x2, y2):
+    """Indices of slots that overlap the rectangle"""
+    x1, x2 = sorted((x1, x2))
+    y1, y2 = sorted((y1, y2))
+    return {i for i, (x, y) in enumerate(posList)
+            if x < x2 and x + width > x1 and y < y2 and y + height > y1}
+
 
 def mouseClick(events, x, y, flags, params):
+    global dragStart, dragRect, dirty, redraw
     if events == cv2.EVENT_LBUTTONDOWN:
-        posList.append((x, y))
-    if events == cv2.EVENT_RBUTTONDOWN:
+        dragStart = (x, y)
+        dragRect = None
+    elif events == cv2.EVENT_MOUSEMOVE and dragStart is not None:
+        if dragRect or abs(x - dragStart[0]) > dragThreshold or abs(y - dragStart[1]) > dragThreshold:
+            dragRect = (dragStart[0], dragStart[1], x, y)
+            redraw = True
+    elif events == cv2.EVENT_LBUTTONUP and dragStart is not None:
+        if dragRect:
+            # Rubber-band select; shift adds to the current selection
+            if not flags & cv2.EVENT_FLAG_SHIFTKEY:
+                selected.clear()
+            selected.update(slotsInRect(*dragRect))
+            dirty = True
+        else:
+            edit(posList + [dragStart])
+        dragStart = None
+        dragRect = None
+        redraw = True
+    elif events == cv2.EVENT_RBUTTONDOWN:
+        remaining = [pos for pos in posList
+                     if not (pos[0] < x < pos[0] + width and pos[1] < y < pos[1] + height)]
+        if len(remaining) != len(posList):
+            edit(remaining)
+
+
+def render():
+    """Redraw the cached slot layer if slots changed, then add the rubber band on top"""
+    global slotsRender, dirty, redraw
+    if dirty:
+        slotsRender = baseImg.copy()
         for i, pos in enumerate(posList):
-            x1, y1 = pos
-            if x1 < x < x1 + width and y1 < y < y1 + height:
-                posList.pop(i)
+            color = (0, 255, 255) if i in selected else (255, 0, 255)
+            cv2.rectangle(slotsRender, pos, (pos[0] + width, pos[1] + height), color, 2)
+        dirty = False
+    img = slotsRender
+    if dragRect:
+        img = slotsRender.copy()
+        cv2.rectangle(img, dragRect[:2], dragRect[2:], (255, 255, 0), 1)
+    cv2.imshow("Image", img)
+    redraw = False
 
-    with open('CarParkPos', 'wb') as f:
-        pickle.dump(posList, f)
 
+cv2.namedWindow("Image")
+cv2.setMouseCallback("Image", mouseClick)
 
+# Keys: z undo, y redo, d delete selection, Esc clear selection, q quit
 while True:
-    img = cv2.imread('carParkImg.png')
-    for pos in posList:
-        cv2.rectangle(img, pos, (pos[0] + width, pos[1] + height), (255, 0, 255), 2)
+    if dirty or redraw:
+        render()
+    if saveDue is not None and time.time() >= saveDue:
+        save()
 
-    cv2.imshow("Image", img)
-    cv2.setMouseCallback("Image", mouseClick)
-    cv2.waitKey(1)
\ No newline at end of file
+    key = cv2.waitKey(15) & 0xFF
+    if key == ord('z'):
+        undo()
+    elif key == ord('y'):
+        redo()
+    elif key in (ord('d'), 8, 127) and selected:
+        edit([pos for i, pos in enumerate(posList) if i not in selected])
+    elif key == 27 and selected:
+        selected.clear()
+        dirty = True
+    elif key == ord('q') or cv2.getWindowProperty("Image", cv2.WND_PROP_VISIBLE) < 1:
+        break
+
+if saveDue is not None:
+    save()
+cv2.destroyAllWindows()
@@ -0,0 +1,105 @@
+"""
+Admission control for the frame processing endpoints
+A fixed number of requests run the pipeline at once and a bounded number wait;
+anything beyond that is turned away immediately so latency stays predictable
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Rejected(Exception):
+    """The request was not admitted; retry_after is a hint in whole seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded worker slots with a bounded, time-limited wait queue"""
+
+    def __init__(self, workers=4, queue_size=8, queue_timeout=2.0):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._service_time = 0.0  # moving average of seconds per request
+        self._wait_total = 0.0
+
+    def acquire(self, weight=1):
+        """Take weight worker slots, waiting in the queue if needed; raises Rejected
+
+        A request that runs several frames at once (a batch) needs all its
+        slots free together and takes as many places in the queue while it waits.
+        """
+        if not 1 <= weight <= self.workers:
+            raise ValueError(f'weight must be between 1 and {self.workers}')
+        with self._cond:
+            if self.active + weight > self.workers and self.waiting + weight > self.queue_size:
+                self.rejected += 1
+                raise Rejected('Queue full', self.retry_after(weight))
+            start = time.monotonic()
+            if self.active + weight > self.workers:
+                deadline = start + self.queue_timeout
+                self.waiting += weight
+                self.peak_waiting = max(self.peak_waiting, self.waiting)
+                try:
+                    while self.active + weight > self.workers:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            raise Rejected('Timed out waiting for a worker', self.retry_after(weight))
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= weight
+            self.active += weight
+            self.admitted += 1
+            self._wait_total += time.monotonic() - start
+        return time.monotonic()
+
+    def release(self, started, weight=1):
+        with self._cond:
+            self.active -= weight
+            elapsed = time.monotonic() - started
+            self._service_time = elapsed if not self._service_time else 0.9 * self._service_time + 0.1 * elapsed
+            # Waiters need different numbers of slots, so let each check again
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, weight=1):
+        started = self.acquire(weight)
+        try:
+            yield
+        finally:
+            self.release(started, weight)
+
+    def retry_after(self, weight=1):
+        """Seconds until the current queue should have drained"""
+        backlog = self.active + self.waiting + weight
+        return max(1, math.ceil(backlog * self._service_time / self.workers))
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'queue_timeout_s': self.queue_timeout,
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'peak_queue_depth': self.peak_waiting,
+                'admitted': self.admitted,
+                'rejected_queue_full': self.rejected,
+                'rejected_timeout': self.timed_out,
+                'mean_service_ms': round(self._service_time * 1000, 2),
+                'mean_wait_ms': round(self._wait_total / self.admitted * 1000, 2) if self.admitted else 0.0
+            }
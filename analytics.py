@@ -0,0 +1,108 @@
+"""
+Incremental per-slot analytics: dwell time, turnover and utilisation
+Only slots whose state flipped are touched on each frame
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+class SlotAnalytics:
+    """Running statistics for one stream's slots"""
+
+    def __init__(self, num_slots, started=None):
+        self.num_slots = num_slots
+        self.started = time.time() if started is None else started
+        self.state = np.zeros(num_slots, bool)
+        self.since = np.full(num_slots, self.started)
+        self.occupied_seconds = np.zeros(num_slots)
+        self.turnover = np.zeros(num_slots, np.int64)
+        self.dwell_total = np.zeros(num_slots)
+        self.dwell_count = np.zeros(num_slots, np.int64)
+        self.arrival_seen = np.zeros(num_slots, bool)  # dwell is only known when the arrival was seen
+        self.occupied_now = 0
+        self.peak_occupied = 0
+        self.peak_time = self.started
+        self.frames = 0
+        self._lock = threading.Lock()
+
+    def update(self, states, timestamp=None):
+        """Feed one frame of per-slot occupied flags"""
+        timestamp = time.time() if timestamp is None else timestamp
+        states = np.asarray(states, dtype=bool)
+        with self._lock:
+            self.frames += 1
+            if self.frames == 1:
+                # Cars already parked at start are the initial state, not arrivals
+                self.state[:] = states
+                self.occupied_now = self.peak_occupied = int(states.sum())
+                self.peak_time = timestamp
+                return
+
+            changed = np.flatnonzero(states != self.state)
+            if len(changed):
+                arrived = changed[states[changed]]
+                left = changed[~states[changed]]
+
+                dwell = timestamp - self.since[left]
+                self.occupied_seconds[left] += dwell
+                seen = self.arrival_seen[left]
+                self.dwell_total[left[seen]] += dwell[seen]
+                self.dwell_count[left[seen]] += 1
+                self.turnover[arrived] += 1
+                self.arrival_seen[changed] = states[changed]
+
+                self.since[changed] = timestamp
+                self.state[changed] = states[changed]
+                self.occupied_now += len(arrived) - len(left)
+
+            if self.occupied_now > self.peak_occupied:
+                self.peak_occupied = self.occupied_now
+                self.peak_time = timestamp
+
+    def summary(self, now=None):
+        """Current statistics, including the open occupancy of occupied slots"""
+        now = time.time() if now is None else now
+        with self._lock:
+            open_dwell = np.where(self.state, now - self.since, 0.0)
+            occupied_seconds = self.occupied_seconds + open_dwell
+            elapsed = max(now - self.started, 1e-9)
+            mean_dwell = np.divide(self.dwell_total, self.dwell_count,
+                                   out=np.zeros(self.num_slots), where=self.dwell_count > 0)
+            return {
+                'frames': self.frames,
+                'elapsed_seconds': round(elapsed, 3),
+                'lot': {
+                    'occupied_now': self.occupied_now,
+                    'peak_occupied': self.peak_occupied,
+                    'peak_time': self.peak_time,
+                    'utilisation': round(float(occupied_seconds.sum() / elapsed / max(self.num_slots, 1)), 4),
+                    'turnover': int(self.turnover.sum())
+                },
+                'slots': {
+                    'occupied': self.state.tolist(),
+                    'current_dwell_seconds': np.round(open_dwell, 3).tolist(),
+                    'mean_dwell_seconds': np.round(mean_dwell, 3).tolist(),
+                    'turnover': self.turnover.tolist(),
+                    'utilisation': np.round(occupied_seconds / elapsed, 4).tolist()
+                }
+            }
+
+
+class AnalyticsStore:
+    """Per-stream analytics; statistics restart when a stream's slot count changes"""
+
+    def __init__(self):
+        self.streams = {}
+
+    def update(self, stream_id, states, timestamp=None):
+        analytics = self.streams.get(stream_id)
+        if analytics is None or analytics.num_slots != len(states):
+            analytics = SlotAnalytics(len(states), timestamp)
+            self.streams[stream_id] = analytics
+        analytics.update(states, timestamp)
+
+    def get(self, stream_id):
+        return self.streams.get(stream_id)
@@ -1,14 +1,16 @@
 from flask import Flask, render_template, request, jsonify, send_file
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import cv2
 import pickle
-import numpy as np
-import base64
 import io
 import os
-import threading
-import time
+import itertools
 from werkzeug.utils import secure_filename
+from detectors import get_detector
+from lots import CompiledLayout
+from overlay import check_parking_space
+from rooms import DEFAULT_QUALITY, RoomBroadcaster
+from stream import StreamController
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'
@@ -16,9 +18,13 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 
 # Global variables
 posList = []
-cap = None
-is_processing = False
 width, height = 107, 48
+detector = get_detector()  # chosen per stream with /api/start_detection
+layout_cache = None
+
+# Subscribers join a room per stream and quality tier (see rooms.py)
+STREAM_ID = 'default'
+broadcaster = RoomBroadcaster(socketio)
 
 # Load existing parking positions
 def load_parking_positions():
@@ -33,87 +39,37 @@ def save_parking_positions():
     with open('CarParkPos', 'wb') as f:
         pickle.dump(posList, f)
 
-def put_text_rect(img, text, pos, scale=1, thickness=2, offset=0, colorR=(255, 255, 255)):
-    """Simple text rendering function to replace cvzone"""
-    x, y = pos
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    font_scale = scale
-    color = colorR
-    thickness = thickness
-    
-    # Get text size
-    (text_width, text_height), baseline = cv2.getTextSize(text, font, font_scale, thickness)
-    
-    # Draw rectangle background
-    cv2.rectangle(img, (x - offset, y - text_height - offset), 
-                 (x + text_width + offset, y + offset), color, -1)
-    
-    # Draw text
-    cv2.putText(img, text, (x, y), font, font_scale, (0, 0, 0), thickness)
-
-def check_parking_space(img_pro, img):
-    global posList
-    space_counter = 0
-    
-    for pos in posList:
-        x, y = pos
-        img_crop = img_pro[y:y + height, x:x + width]
-        count = cv2.countNonZero(img_crop)
-        
-        if count < 900:
-            color = (0, 255, 0)
-            thickness = 5
-            space_counter += 1
-        else:
-            color = (0, 0, 255)
-            thickness = 2
-        
-        cv2.rectangle(img, pos, (pos[0] + width, pos[1] + height), color, thickness)
-        put_text_rect(img, str(count), (x, y + height - 3), scale=1,
-                      thickness=2, offset=0, colorR=color)
-    
-    put_text_rect(img, f'Free: {space_counter}/{len(posList)}', (100, 50), scale=3,
-                  thickness=5, offset=20, colorR=(0, 200, 0))
-    
-    return img, space_counter, len(posList)
-
-def process_video():
-    global cap, is_processing, posList
-    
-    if cap is None:
-        return
-    
-    while is_processing:
-        if cap.get(cv2.CAP_PROP_POS_FRAMES) == cap.get(cv2.CAP_PROP_FRAME_COUNT):
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        
-        success, img = cap.read()
-        if not success:
-            break
-            
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        img_blur = cv2.GaussianBlur(img_gray, (3, 3), 1)
-        img_threshold = cv2.adaptiveThreshold(img_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                           cv2.THRESH_BINARY_INV, 25, 16)
-        img_median = cv2.medianBlur(img_threshold, 5)
-        kernel = np.ones((3, 3), np.uint8)
-        img_dilate = cv2.dilate(img_median, kernel, iterations=1)
-        
-        processed_img, free_spaces, total_spaces = check_parking_space(img_dilate, img.copy())
-        
-        # Convert image to base64 for sending to frontend
-        _, buffer = cv2.imencode('.jpg', processed_img)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        # Send data to frontend
-        socketio.emit('detection_result', {
-            'image': img_base64,
-            'free_spaces': free_spaces,
-            'total_spaces': total_spaces,
-            'occupied_spaces': total_spaces - free_spaces
-        })
-        
-        time.sleep(0.1)  # Control frame rate
+def slot_layout():
+    """Compiled slot geometry for detectors that work per slot (rebuilt when posList changes)"""
+    global layout_cache
+    key = tuple(tuple(pos) for pos in posList)
+    if layout_cache is None or layout_cache[0] != key:
+        layout_cache = (key, CompiledLayout('default', key, {'slot_width': width, 'slot_height': height},
+                                            version=hash(key)))
+    return layout_cache[1]
+
+frame_seq = itertools.count(1)
+
+def detect_frame(img):
+    layout = slot_layout()
+    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    img_dilate = detector.mask(img_gray, layout)
+    
+    processed_img, free_spaces, total_spaces, _ = check_parking_space(img_dilate, img.copy(), layout)
+    result = {
+        'free_spaces': free_spaces,
+        'total_spaces': total_spaces,
+        'occupied_spaces': total_spaces - free_spaces
+    }
+    
+    # Each room that is due gets the frame encoded for its tier, as binary
+    broadcaster.publish(STREAM_ID, processed_img, result, next(frame_seq))
+    return result
+
+# Detection stream with deadline-based pacing; its watchdog restarts the
+# capture when no frame is processed for MAX_FRAME_AGE seconds
+stream = StreamController(detect_frame, target_fps=float(os.environ.get('TARGET_FPS', 10)),
+                          max_frame_age=float(os.environ.get('MAX_FRAME_AGE', 5)))
 
 @app.route('/')
 def index():
@@ -121,8 +77,6 @@ def index():
 
 @app.route('/api/upload', methods=['POST'])
 def upload_video():
-    global cap, is_processing
-    
     if 'video' not in request.files:
         return jsonify({'error': 'No video file provided'}), 400
     
@@ -139,49 +93,55 @@ def upload_video():
         
         file.save(filepath)
         
-        # Stop current processing if running
-        if is_processing:
-            is_processing = False
-            if cap:
-                cap.release()
+        probe = cv2.VideoCapture(filepath)
+        total_frames = int(probe.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = probe.get(cv2.CAP_PROP_FPS)
+        probe.release()
         
-        # Load new video
-        cap = cv2.VideoCapture(filepath)
+        # Load new video; stops current processing and releases the old capture
+        stream.swap_source(cv2.VideoCapture(filepath), factory=lambda: cv2.VideoCapture(filepath))
         
         return jsonify({
             'message': 'Video uploaded successfully',
             'filename': filename,
-            'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
-            'fps': cap.get(cv2.CAP_PROP_FPS)
+            'total_frames': total_frames,
+            'fps': fps
         })
 
 @app.route('/api/start_detection', methods=['POST'])
 def start_detection():
-    global is_processing, cap
+    """Start the stream; an optional JSON body {"detector": "adaptive"|"integral"|"background"} picks the backend"""
+    global detector
     
-    if cap is None:
+    if not stream.has_source:
         return jsonify({'error': 'No video loaded'}), 400
     
     if not posList:
         return jsonify({'error': 'No parking spaces defined'}), 400
     
-    if not is_processing:
-        is_processing = True
-        thread = threading.Thread(target=process_video)
-        thread.daemon = True
-        thread.start()
-        
+    name = (request.get_json(silent=True) or {}).get('detector')
+    if name:
+        try:
+            detector = get_detector(name)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    if stream.start():
         return jsonify({'message': 'Detection started'})
     
     return jsonify({'message': 'Detection already running'})
 
 @app.route('/api/stop_detection', methods=['POST'])
 def stop_detection():
-    global is_processing
-    
-    is_processing = False
+    stream.stop()
     return jsonify({'message': 'Detection stopped'})
 
+@app.route('/api/stream_stats', methods=['GET'])
+def get_stream_stats():
+    """Achieved FPS, lag and dropped frames of the detection loop"""
+    return jsonify(dict(stream.scheduler.stats(), running=stream.running, detector=detector.name,
+                        rooms=broadcaster.stats()))
+
 @app.route('/api/parking_spaces', methods=['GET'])
 def get_parking_spaces():
     return jsonify({
@@ -220,14 +180,47 @@ def remove_parking_space(index):
     
     return jsonify({'error': 'Invalid index'}), 400
 
+@app.route('/health')
+def health_check():
+    """Liveness; with deep=1 also readiness of the detection stream (503 when stalled)"""
+    if request.args.get('deep') != '1':
+        return jsonify({'status': 'healthy', 'parking_spaces': len(posList)})
+    
+    streams = {STREAM_ID: stream.health()}
+    healthy = all(s['healthy'] for s in streams.values())
+    return jsonify({
+        'status': 'healthy' if healthy else 'unhealthy',
+        'parking_spaces': len(posList),
+        'streams': streams
+    }), 200 if healthy else 503
+
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
-    emit('status', {'message': 'Connected to server'})
+    _, room = broadcaster.subscribe(request.sid, STREAM_ID, DEFAULT_QUALITY)
+    join_room(room)
+    emit('status', {'message': 'Connected to server', 'room': room})
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Switch to another stream/quality room: {"stream": "default", "quality": "thumbnail"|"preview"|"full"}"""
+    data = data or {}
+    stream = data.get('stream', STREAM_ID)
+    if stream != STREAM_ID:
+        return {'error': 'Unknown stream'}
+    try:
+        old, room = broadcaster.subscribe(request.sid, stream, data.get('quality', DEFAULT_QUALITY))
+    except ValueError as e:
+        return {'error': str(e)}
+    if old and old != room:
+        leave_room(old)
+    join_room(room)
+    return {'room': room, 'max_fps': broadcaster.rates[data.get('quality', DEFAULT_QUALITY)]}
 
 @socketio.on('disconnect')
 def handle_disconnect():
     print('Client disconnected')
+    broadcaster.unsubscribe(request.sid)
 
 if __name__ == '__main__':
     load_parking_positions()
@@ -1,116 +1,203 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, send_file
 import cv2
 import pickle
-import numpy as np
 import base64
+import atexit
+import hmac
+import io
 import os
 import threading
 import time
 from werkzeug.utils import secure_filename
+from detectors import DETECTORS, get_detector
+from lots import CompiledLayout
+from overlay import check_parking_space
+from stream import StreamController
+from history import HistoryStore
+from analytics import AnalyticsStore
+from frame_encoding import FORMATS, FrameEncoder, encode_frame
+from capture import RingCapture
+from scrub import VideoScrubber
+from export import EXPORT_EXTENSION, ExportJob
+from state import LeaseKeeper, SharedResultChannel, get_state
+from zones import ZoneIndex, load_zones, parse_zones, save_zones
+from profiling import SORT_KEYS, Profiler, capture_limits
 
 app = Flask(__name__)
 
-# Global variables
+# Slot layout, desired stream state, stream ownership and the latest result live
+# in a state backend: in this process by default, or in SQLite (STATE_BACKEND=
+# sqlite:///state.db) so several gunicorn workers agree; see state.py
+STREAM_ID = 'default'
+state = get_state(os.environ.get('STATE_BACKEND'))
+sync_lock = threading.RLock()
+video_key = None  # (source, uploaded) this worker's stream was last set up for
+
+# Global variables (posList mirrors the backend's layout, see sync_positions)
 posList = []
-cap = None
-is_processing = False
+positions_version = None
 width, height = 107, 48
-latest_result = None
+capture_mode = os.environ.get('CAPTURE_MODE', 'inline')  # 'inline' or 'shm'
+detector = get_detector()  # chosen per stream with /api/start_detection
+layout_cache = None
+
+# Per-stream occupancy history (ring buffer, rollups and on-disk log)
+history = HistoryStore(os.environ.get('HISTORY_DIR', 'history'))
+
+# Per-stream dwell time, turnover and utilisation
+analytics = AnalyticsStore()
+
+# Frames are encoded on demand, once per sequence number and profile
+frame_encoder = FrameEncoder()
+
+# Random access into the uploaded video for /api/frame_at; it has its own
+# detector so scrubbing does not disturb the live stream's background model
+scrubber = None
+scrub_detector = None
+scrub_cache_bytes = int(os.environ.get('SCRUB_CACHE_BYTES', 256 * 1024 * 1024))
+
+# Annotated exports of the uploaded video, rendered by worker processes (see export.py)
+video_path = None
+export_jobs = {}
+export_dir = os.environ.get('EXPORT_DIR', 'exports')
+max_export_jobs = 10
+
+# Named zones and points of the lot (zones.py); the index is rebuilt when the
+# layout or ZONES_FILE changes and follows the latest result's slot states
+zones_file = os.environ.get('ZONES_FILE', 'zones.json')
+zone_index = None
+zone_key = None
+zone_lock = threading.Lock()
 
-# Load existing parking positions
+# On-demand profiling of the stream's next frames (profiling.py); admin routes
+# require the X-Admin-Token header when ADMIN_TOKEN is set
+profiler = Profiler()
+admin_token = os.environ.get('ADMIN_TOKEN')
+
+# Load existing parking positions (into the backend, unless a worker already did)
 def load_parking_positions():
-    global posList
     try:
         with open('CarParkPos', 'rb') as f:
-            posList = pickle.load(f)
+            saved = pickle.load(f)
     except:
-        posList = []
-
-def save_parking_positions():
-    with open('CarParkPos', 'wb') as f:
-        pickle.dump(posList, f)
-
-def put_text_rect(img, text, pos, scale=1, thickness=2, offset=0, colorR=(255, 255, 255)):
-    """Simple text rendering function"""
-    x, y = pos
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    font_scale = scale
-    color = colorR
-    thickness = thickness
-    
-    # Get text size
-    (text_width, text_height), baseline = cv2.getTextSize(text, font, font_scale, thickness)
-    
-    # Draw rectangle background
-    cv2.rectangle(img, (x - offset, y - text_height - offset), 
-                 (x + text_width + offset, y + offset), color, -1)
-    
-    # Draw text
-    cv2.putText(img, text, (x, y), font, font_scale, (0, 0, 0), thickness)
-
-def check_parking_space(img_pro, img):
-    global posList
-    space_counter = 0
-    
-    for pos in posList:
-        x, y = pos
-        img_crop = img_pro[y:y + height, x:x + width]
-        count = cv2.countNonZero(img_crop)
-        
-        if count < 900:
-            color = (0, 255, 0)
-            thickness = 5
-            space_counter += 1
-        else:
-            color = (0, 0, 255)
-            thickness = 2
-        
-        cv2.rectangle(img, pos, (pos[0] + width, pos[1] + height), color, thickness)
-        put_text_rect(img, str(count), (x, y + height - 3), scale=1,
-                      thickness=2, offset=0, colorR=color)
-    
-    put_text_rect(img, f'Free: {space_counter}/{len(posList)}', (100, 50), scale=3,
-                  thickness=5, offset=20, colorR=(0, 200, 0))
-    
-    return img, space_counter, len(posList)
+        saved = []
+    state.modify_positions('default', lambda current: current or saved)
+    sync_positions()
 
-def process_video():
-    global cap, is_processing, posList, latest_result
-    
-    if cap is None:
-        return
+def save_parking_positions(positions):
+    # Written to a temporary file first so concurrent workers never leave a torn file
+    tmp = f'CarParkPos.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(positions, f)
+    os.replace(tmp, 'CarParkPos')
+
+def sync_positions():
+    """Reload posList when another worker (or this one) changed the layout"""
+    global posList, positions_version
+    version = state.positions_version('default')
+    if version != positions_version:
+        version, positions = state.positions('default')
+        posList, positions_version = positions or [], version
+
+def slot_layout():
+    """Compiled slot geometry for detectors that work per slot (rebuilt when posList changes)"""
+    global layout_cache
+    key = tuple(tuple(pos) for pos in posList)
+    if layout_cache is None or layout_cache[0] != key:
+        layout_cache = (key, CompiledLayout('default', key, {'slot_width': width, 'slot_height': height},
+                                            version=hash(key)))
+    return layout_cache[1]
+
+def annotate_frame(img, frame_detector):
+    """Detect and draw the slots on a copy of one frame"""
+    layout = slot_layout()
+    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    img_dilate = frame_detector.mask(img_gray, layout)
+    processed_img, free_spaces, total_spaces, occupied = check_parking_space(img_dilate, img.copy(), layout)
+    return processed_img, free_spaces, total_spaces, occupied.tolist()
+
+def detect_frame(img):
+    """Run detection on one video frame and build the result payload"""
+    processed_img, free_spaces, total_spaces, occupied = annotate_frame(img, detector)
+    history.record('default', occupied)
+    analytics.update('default', occupied)
     
-    while is_processing:
-        if cap.get(cv2.CAP_PROP_POS_FRAMES) == cap.get(cv2.CAP_PROP_FRAME_COUNT):
-            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        
-        success, img = cap.read()
-        if not success:
-            break
-            
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        img_blur = cv2.GaussianBlur(img_gray, (3, 3), 1)
-        img_threshold = cv2.adaptiveThreshold(img_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                           cv2.THRESH_BINARY_INV, 25, 16)
-        img_median = cv2.medianBlur(img_threshold, 5)
-        kernel = np.ones((3, 3), np.uint8)
-        img_dilate = cv2.dilate(img_median, kernel, iterations=1)
-        
-        processed_img, free_spaces, total_spaces = check_parking_space(img_dilate, img.copy())
+    # Encoding is deferred until a viewer requests the frame
+    return {
+        'frame': processed_img,
+        'free_spaces': free_spaces,
+        'total_spaces': total_spaces,
+        'occupied_spaces': total_spaces - free_spaces,
+        'occupied': occupied
+    }
+
+# Detection stream; the worker thread owns the capture and publishes snapshots
+# (restarted by its watchdog when no frame is published for MAX_FRAME_AGE seconds).
+# With a shared backend only the worker holding the stream's lease runs it; the
+# others serve the results it publishes to the backend
+stream = StreamController(detect_frame, channel=SharedResultChannel(state, STREAM_ID) if state.shared else None,
+                          target_fps=float(os.environ.get('TARGET_FPS', 10)),
+                          max_frame_age=float(os.environ.get('MAX_FRAME_AGE', 5)))
+
+def open_capture(filepath):
+    """Open an uploaded video for the stream (also used by the watchdog to reopen it)"""
+    if capture_mode == 'shm':
+        # Decode in a separate capture process feeding a shared-memory ring
+        return RingCapture(filepath)
+    return cv2.VideoCapture(filepath)
+
+def sync_stream(owns=None):
+    """Bring this worker's video, detector and layout in line with the backend
+
+    Only the owner of the stream (always this worker with the local backend)
+    runs the detector; every other worker keeps its stream stopped.
+    """
+    global video_key, video_path, scrubber, detector
+    if owns is None:
+        owns = keeper.owns if keeper is not None else True
+    with sync_lock:
+        sync_positions()
+        desired = state.stream(STREAM_ID)
         
-        # Convert image to base64 for sending to frontend
-        _, buffer = cv2.imencode('.jpg', processed_img)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
+        key = (desired['source'], desired['uploaded'])
+        if key != video_key:
+            # A new upload; stops current processing and releases the old capture
+            video_key = key
+            path = desired['source']
+            stream.swap_source(None, factory=(lambda: open_capture(path)) if path else None)
+            video_path = path
+            old_scrubber, scrubber = scrubber, None
+            if old_scrubber is not None:
+                old_scrubber.close()
         
-        # Store result for polling
-        latest_result = {
-            'image': img_base64,
-            'free_spaces': free_spaces,
-            'total_spaces': total_spaces,
-            'occupied_spaces': total_spaces - free_spaces
-        }
+        if desired['detector'] and desired['detector'] != detector.name:
+            detector = get_detector(desired['detector'])
         
-        time.sleep(0.1)  # Control frame rate
+        if owns and desired['running'] and video_path and posList:
+            if not stream.wanted:
+                stream.start()
+        elif stream.wanted:
+            stream.stop()
+
+# Claim on the stream, renewed in the background; a worker that dies loses it
+# after STATE_LEASE_TTL seconds and another worker takes the detector over
+keeper = None
+if state.shared:
+    lease_ttl = float(os.environ.get('STATE_LEASE_TTL', 5))
+    keeper = LeaseKeeper(state, STREAM_ID, sync_stream, ttl=lease_ttl, interval=lease_ttl / 5)
+    atexit.register(keeper.close)
+
+load_parking_positions()
+
+@app.before_request
+def sync_worker():
+    # The keeper starts on the first request of each worker process, so a
+    # gunicorn master that imported the app (--preload) never owns the stream
+    if keeper is not None and keeper.pid != os.getpid():
+        with sync_lock:
+            if keeper.pid != os.getpid():
+                keeper.start()
+    sync_stream()
 
 @app.route('/')
 def index():
@@ -118,8 +205,7 @@ def index():
 
 @app.route('/api/upload', methods=['POST'])
 def upload_video():
-    global cap, is_processing
-    
+    global scrubber
     if 'video' not in request.files:
         return jsonify({'error': 'No video file provided'}), 400
     
@@ -136,57 +222,415 @@ def upload_video():
         
         file.save(filepath)
         
-        # Stop current processing if running
-        if is_processing:
-            is_processing = False
-            if cap:
-                cap.release()
+        probe = cv2.VideoCapture(filepath)
+        total_frames = int(probe.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = probe.get(cv2.CAP_PROP_FPS)
+        probe.release()
         
-        # Load new video
-        cap = cv2.VideoCapture(filepath)
+        # Every worker switches to the new video on its next request; this one now
+        state.update_stream(STREAM_ID, source=filepath, uploaded=time.time(), running=False)
+        sync_stream()
+        
+        # Seek index is built in the background; frame_at works meanwhile
+        with sync_lock:
+            if scrubber is None:
+                scrubber = VideoScrubber(filepath, scrub_cache_bytes)
         
         return jsonify({
             'message': 'Video uploaded successfully',
             'filename': filename,
-            'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
-            'fps': cap.get(cv2.CAP_PROP_FPS)
+            'total_frames': total_frames,
+            'fps': fps
         })
 
 @app.route('/api/start_detection', methods=['POST'])
 def start_detection():
-    global is_processing, cap
-    
-    if cap is None:
+    """Start the stream; an optional JSON body {"detector": "adaptive"|"integral"|"background"} picks the backend"""
+    if video_path is None:
         return jsonify({'error': 'No video loaded'}), 400
     
     if not posList:
         return jsonify({'error': 'No parking spaces defined'}), 400
     
-    if not is_processing:
-        is_processing = True
-        thread = threading.Thread(target=process_video)
-        thread.daemon = True
-        thread.start()
-        
+    changes = {'running': True}
+    name = (request.get_json(silent=True) or {}).get('detector')
+    if name:
+        if name not in DETECTORS:
+            return jsonify({'error': f"Unknown detector '{name}' (choose from {', '.join(DETECTORS)})"}), 400
+        changes['detector'] = name
+    
+    previous = state.update_stream(STREAM_ID, **changes)
+    if not previous['running']:
+        state.update_stream(STREAM_ID, started=time.time())
+    # Applied here if this worker owns the stream, otherwise by the owner within a second
+    if keeper is not None:
+        keeper.tick()
+    else:
+        sync_stream()
+    
+    if not previous['running']:
         return jsonify({'message': 'Detection started'})
     
     return jsonify({'message': 'Detection already running'})
 
 @app.route('/api/stop_detection', methods=['POST'])
 def stop_detection():
-    global is_processing
-    
-    is_processing = False
+    state.update_stream(STREAM_ID, running=False)
+    sync_stream()
     return jsonify({'message': 'Detection stopped'})
 
 @app.route('/api/get_result', methods=['GET'])
 def get_result():
-    """Get latest detection result"""
-    global latest_result
-    if latest_result:
-        return jsonify(latest_result)
-    else:
+    """Get latest detection result; image=0 skips the frame, profile/format pick the encoding"""
+    image = request.args.get('image', '1') != '0'
+    snapshot = stream.channel.latest(frame=image)
+    if not snapshot:
         return jsonify({'error': 'No result available'})
+    if image and 'frame' not in snapshot.result:
+        # Another worker runs the stream and has not published a frame yet
+        return jsonify({'error': 'No frame available yet'})
+    
+    result = {key: value for key, value in snapshot.result.items() if key != 'frame'}
+    result['seq'] = snapshot.seq
+    index = current_zones()
+    if index.rects:
+        result['zones'] = {zone: counts for zone, counts in index.counts().items() if zone is not None}
+    if image:
+        fmt = request.args.get('format', 'jpeg')
+        try:
+            data = frame_encoder.get(snapshot.seq, snapshot.result['frame'],
+                                     request.args.get('profile', 'full'), fmt)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        result['image'] = base64.b64encode(data).decode('utf-8')
+        result['image_format'] = fmt
+    return jsonify(result)
+
+@app.route('/api/stream_stats', methods=['GET'])
+def get_stream_stats():
+    """Achieved FPS, lag and dropped frames of the detection stream"""
+    return jsonify(dict(stream.scheduler.stats(), running=stream.running, detector=detector.name,
+                        scrub=scrubber.stats() if scrubber else None, capture=stream.source_stats()))
+
+@app.route('/api/frame_at', methods=['GET'])
+def get_frame_at():
+    """Annotated frame and occupancy t seconds into the uploaded video (image/profile/format as get_result)"""
+    global scrubber, scrub_detector
+    if video_path is None:
+        return jsonify({'error': 'No video loaded'}), 400
+    
+    with sync_lock:
+        if scrubber is None:
+            scrubber = VideoScrubber(video_path, scrub_cache_bytes)
+    
+    try:
+        t = float(request.args['t'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Missing or invalid t (seconds)'}), 400
+    
+    try:
+        frame_index, timestamp, img = scrubber.frame_at(t)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if scrub_detector is None or scrub_detector.name != detector.name:
+        scrub_detector = get_detector(detector.name)
+    processed_img, free_spaces, total_spaces, _ = annotate_frame(img, scrub_detector)
+    
+    result = {
+        't': t,
+        'frame_index': frame_index,
+        'timestamp': round(timestamp, 3),
+        'free_spaces': free_spaces,
+        'total_spaces': total_spaces,
+        'occupied_spaces': total_spaces - free_spaces
+    }
+    if request.args.get('image', '1') != '0':
+        fmt = request.args.get('format', 'jpeg')
+        try:
+            data = encode_frame(processed_img, request.args.get('profile', 'full'), fmt)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        result['image'] = base64.b64encode(data).decode('utf-8')
+        result['image_format'] = fmt
+    return jsonify(result)
+
+@app.route('/api/frame', methods=['GET'])
+def get_frame():
+    """Latest annotated frame as a binary image (profile=thumbnail|preview|full, format=jpeg|webp)"""
+    snapshot = stream.channel.latest()
+    if not snapshot:
+        return jsonify({'error': 'No result available'}), 404
+    if 'frame' not in snapshot.result:
+        return jsonify({'error': 'No frame available yet'}), 404
+    
+    fmt = request.args.get('format', 'jpeg')
+    try:
+        data = frame_encoder.get(snapshot.seq, snapshot.result['frame'],
+                                 request.args.get('profile', 'full'), fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = Response(data, mimetype=FORMATS[fmt][2])
+    response.headers['X-Frame-Seq'] = str(snapshot.seq)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+def not_stream_owner():
+    # History, analytics, profiles and export jobs live in the worker that runs
+    # the stream; other workers point the client at it instead of answering 404
+    if keeper is not None and not keeper.owns:
+        return jsonify({'error': 'This worker does not run the stream',
+                        'owner': state.lease_owner(STREAM_ID)}), 409
+    return None
+
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    """Occupancy history for a time range, raw or rolled up per minute/hour"""
+    conflict = not_stream_owner()
+    if conflict:
+        return conflict
+    stream_history = history.get(request.args.get('stream', 'default'))
+    if stream_history is None:
+        return jsonify({'error': 'No history available'}), 404
+    
+    try:
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - 3600))
+        slot = request.args.get('slot', type=int)
+        resolution = request.args.get('resolution', 'minute')
+        points = stream_history.query(start, end, slot=slot, resolution=resolution)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'start': start,
+        'end': end,
+        'resolution': resolution,
+        'total_spaces': stream_history.num_slots,
+        'points': points
+    })
+
+@app.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    """Per-slot dwell time, turnover and utilisation plus lot peaks"""
+    conflict = not_stream_owner()
+    if conflict:
+        return conflict
+    stream_analytics = analytics.get(request.args.get('stream', 'default'))
+    if stream_analytics is None:
+        return jsonify({'error': 'No analytics available'}), 404
+    return jsonify(stream_analytics.summary())
+
+@app.route('/api/export', methods=['POST'])
+def start_export():
+    """Render the uploaded video with overlays to a new file in the background
+
+    Optional JSON: detector, workers and segments (default: CPU count) and
+    verify (also render serially and compare every frame). Jobs run on the
+    worker that runs the stream, so they can be polled there.
+    """
+    conflict = not_stream_owner()
+    if conflict:
+        return conflict
+    if video_path is None:
+        return jsonify({'error': 'No video loaded'}), 400
+    
+    if not posList:
+        return jsonify({'error': 'No parking spaces defined'}), 400
+    
+    if any(not job.done for job in export_jobs.values()):
+        return jsonify({'error': 'An export is already running'}), 409
+    
+    data = request.get_json(silent=True) or {}
+    name = data.get('detector')
+    if name is not None and name not in DETECTORS:
+        return jsonify({'error': f"Unknown detector '{name}' (choose from {', '.join(DETECTORS)})"}), 400
+    try:
+        workers = int(data['workers']) if data.get('workers') else None
+        segments = int(data['segments']) if data.get('segments') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'workers and segments must be integers'}), 400
+    
+    os.makedirs(export_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    output = os.path.join(export_dir, f'{stem}-annotated-{int(time.time())}{EXPORT_EXTENSION}')
+    job = ExportJob(video_path, output, posList, {'slot_width': width, 'slot_height': height},
+                    detector=name, workers=workers, segments=segments, verify=bool(data.get('verify')))
+    
+    # Keep the most recent jobs only
+    for old_id in list(export_jobs)[:max(0, len(export_jobs) - max_export_jobs + 1)]:
+        del export_jobs[old_id]
+    export_jobs[job.id] = job.start()
+    return jsonify({'message': 'Export started', 'job_id': job.id}), 202
+
+@app.route('/api/export/<job_id>', methods=['GET'])
+def get_export(job_id):
+    """Progress of an export job"""
+    conflict = not_stream_owner()
+    if conflict:
+        return conflict
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown export job'}), 404
+    return jsonify(job.status())
+
+@app.route('/api/export/<job_id>/download', methods=['GET'])
+def download_export(job_id):
+    conflict = not_stream_owner()
+    if conflict:
+        return conflict
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown export job'}), 404
+    if job.state != 'done':
+        return jsonify({'error': f'Export is {job.state}'}), 409
+    return send_file(os.path.abspath(job.output), as_attachment=True)
+
+def zones_file_key():
+    try:
+        stat = os.stat(zones_file)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+def current_zones():
+    """Zone index of the current layout, brought up to the latest result's slot states"""
+    global zone_index, zone_key
+    with zone_lock:
+        key = (positions_version, zones_file_key())
+        if zone_index is None or zone_key != key:
+            zone_index = ZoneIndex(posList, width, height, load_zones(zones_file))
+            zone_key = key
+        index = zone_index
+    
+    # Only slots that flipped since the last result are touched
+    snapshot = stream.channel.latest(frame=False)
+    if snapshot is not None and snapshot.seq != index.seq:
+        occupied = snapshot.result.get('occupied')
+        if occupied is not None and len(occupied) == len(index):
+            index.update(occupied, snapshot.seq)
+    return index
+
+@app.route('/api/zones', methods=['GET'])
+def get_zones():
+    """Zones and points with free/occupied counts for each zone and the whole lot"""
+    index = current_zones()
+    counts = index.counts()
+    return jsonify({
+        'seq': index.seq,
+        'lot': counts[None],
+        'zones': {zone: dict(counts[zone], rects=rects) for zone, rects in index.rects.items()},
+        'points': index.points
+    })
+
+@app.route('/api/zones', methods=['PUT'])
+def set_zones():
+    """Replace the zones and points: {"zones": {name: [[x1, y1, x2, y2], ...]}, "points": {name: [x, y]}}"""
+    try:
+        definition = parse_zones(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    save_zones(zones_file, definition)
+    return get_zones()
+
+@app.route('/api/slots', methods=['GET'])
+def get_slots():
+    """One page of slots filtered by zone and state (free|occupied|all); pass next as after for the next page"""
+    index = current_zones()
+    if index.seq is None:
+        return jsonify({'error': 'No result available'}), 404
+    
+    try:
+        after = int(request.args.get('after', -1))
+        limit = min(max(int(request.args.get('limit', 50)), 1), 1000)
+        slots, cursor = index.slots(request.args.get('zone'), request.args.get('state', 'free'), after, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'seq': index.seq, 'slots': slots, 'next': cursor})
+
+@app.route('/api/slots/nearest', methods=['GET'])
+def get_nearest_slots():
+    """Free slots closest to a named point (point=entrance), optionally within a zone"""
+    index = current_zones()
+    if index.seq is None:
+        return jsonify({'error': 'No result available'}), 404
+    
+    try:
+        limit = min(max(int(request.args.get('limit', 1)), 1), 1000)
+        slots = index.nearest_free(request.args.get('point'), request.args.get('zone'), limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'seq': index.seq, 'slots': slots})
+
+def admin_denied():
+    if admin_token and not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return jsonify({'error': 'Admin token required'}), 403
+    return None
+
+@app.route('/api/admin/profile', methods=['POST'])
+def start_profile():
+    """Profile the next frames of a stream: JSON {"stream": "default", "frames": 100, "timeout": 60}"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    if data.get('stream', STREAM_ID) != STREAM_ID:
+        return jsonify({'error': 'Unknown stream'}), 404
+    conflict = not_stream_owner()
+    if conflict:
+        return conflict
+    try:
+        frames, timeout = capture_limits(data.get('frames'), data.get('timeout'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        capture = profiler.start(f'stream:{STREAM_ID}', frames, timeout, hooks=[(stream, 'capture')])
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'message': 'Profiling started', 'capture_id': capture.id, 'running': stream.running}), 202
+
+@app.route('/api/admin/profile/<capture_id>', methods=['GET'])
+def get_profile(capture_id):
+    """Progress and per-stage wall/CPU time of a capture"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    capture = profiler.get(capture_id)
+    if capture is None:
+        return jsonify({'error': 'Unknown capture'}), 404
+    return jsonify(capture.status())
+
+@app.route('/api/admin/profile/<capture_id>/report', methods=['GET'])
+def download_profile(capture_id):
+    """Finished capture as a text report (sort, limit) or format=pstats for snakeviz"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    capture = profiler.get(capture_id)
+    if capture is None:
+        return jsonify({'error': 'Unknown capture'}), 404
+    if capture.state == 'capturing':
+        return jsonify({'error': 'Capture is still running'}), 409
+    
+    if request.args.get('format') == 'pstats':
+        data = capture.pstats_bytes()
+        if data is None:
+            return jsonify({'error': 'No frames were captured'}), 404
+        return send_file(io.BytesIO(data), mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f'profile-{capture.id}.prof')
+    
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        return jsonify({'error': f"sort must be one of {', '.join(SORT_KEYS)}"}), 400
+    limit = request.args.get('limit', 50, type=int)
+    return send_file(io.BytesIO(capture.report(sort, limit).encode('utf-8')), mimetype='text/plain',
+                     as_attachment=True, download_name=f'profile-{capture.id}.txt')
 
 @app.route('/api/parking_spaces', methods=['GET'])
 def get_parking_spaces():
@@ -204,33 +648,78 @@ def add_parking_space():
     if x is None or y is None:
         return jsonify({'error': 'Missing coordinates'}), 400
     
-    posList.append((x, y))
-    save_parking_positions()
+    positions = state.modify_positions('default', lambda current: current + [(x, y)])
+    save_parking_positions(positions)
+    sync_positions()
     
     return jsonify({
         'message': 'Parking space added',
-        'total_spaces': len(posList)
+        'total_spaces': len(positions)
     })
 
 @app.route('/api/parking_spaces/<int:index>', methods=['DELETE'])
 def remove_parking_space(index):
-    global posList
+    def remove(current):
+        # Checked inside the update so two workers cannot both remove the last space
+        if not 0 <= index < len(current):
+            raise IndexError(index)
+        return current[:index] + current[index + 1:]
     
-    if 0 <= index < len(posList):
-        posList.pop(index)
-        save_parking_positions()
-        return jsonify({
-            'message': 'Parking space removed',
-            'total_spaces': len(posList)
-        })
+    try:
+        positions = state.modify_positions('default', remove)
+    except IndexError:
+        return jsonify({'error': 'Invalid index'}), 400
     
-    return jsonify({'error': 'Invalid index'}), 400
+    save_parking_positions(positions)
+    sync_positions()
+    return jsonify({
+        'message': 'Parking space removed',
+        'total_spaces': len(positions)
+    })
+
+def shared_stream_health():
+    """Health of a stream owned by another worker, judged by its published results"""
+    desired = state.stream(STREAM_ID)
+    owner = state.lease_owner(STREAM_ID)
+    seq, timestamp = state.result_info(STREAM_ID)
+    # Results from before the last start do not count
+    last = max(timestamp or 0, desired['started'] or 0)
+    age = time.time() - last if last else None
+    problem = None
+    if desired['running']:
+        if owner is None:
+            problem = 'No worker owns the stream'
+        elif age is not None and age > stream.max_frame_age:
+            problem = f'No frame published for {age:.1f}s'
+    return {
+        'healthy': problem is None,
+        'state': 'stopped' if not desired['running'] else 'running' if problem is None else 'unhealthy',
+        'owner': owner,
+        'seq': seq,
+        'frame_age_s': round(age, 3) if age is not None and desired['running'] else None,
+        'max_frame_age_s': stream.max_frame_age,
+        'problem': problem
+    }
 
 @app.route('/health')
 def health_check():
-    return jsonify({'status': 'healthy', 'parking_spaces': len(posList)})
+    """Liveness; with deep=1 also readiness of the detection stream (503 when stalled)"""
+    if request.args.get('deep') != '1':
+        return jsonify({'status': 'healthy', 'parking_spaces': len(posList)})
+    
+    if keeper is None:
+        streams = {'default': stream.health()}
+    elif keeper.owns:
+        streams = {'default': dict(stream.health(), owner=keeper.owner)}
+    else:
+        streams = {'default': shared_stream_health()}
+    healthy = all(s['healthy'] for s in streams.values())
+    return jsonify({
+        'status': 'healthy' if healthy else 'unhealthy',
+        'parking_spaces': len(posList),
+        'streams': streams
+    }), 200 if healthy else 503
 
 if __name__ == '__main__':
-    load_parking_positions()
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
\ No newline at end of file
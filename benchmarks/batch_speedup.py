@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Compare /api/process_frames against repeated /api/process_frame calls
+Reports the speedup of the batch route for each batch size; both routes are
+asked for the same output (overlays or counts only)
+"""
+
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import index
+
+
+def synthetic_frame(seed, size=(720, 1280)):
+    """Random noisy frame encoded as JPEG"""
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 255, (size[0], size[1], 3), dtype=np.uint8)
+    img = cv2.GaussianBlur(img, (5, 5), 0)
+    _, buffer = cv2.imencode('.jpg', img)
+    return buffer.tobytes()
+
+
+def time_single(client, frames, overlay):
+    start = time.perf_counter()
+    for frame in frames:
+        response = client.post(f'/api/process_frame?overlay={int(overlay)}',
+                               json={'frame': base64.b64encode(frame).decode('utf-8')})
+        assert response.status_code == 200, response.get_json()
+    return time.perf_counter() - start
+
+
+def time_batch(client, frames, overlay):
+    start = time.perf_counter()
+    response = client.post(f'/api/process_frames?overlay={int(overlay)}',
+                           data={'frames': [(io.BytesIO(f), f'{i}.jpg') for i, f in enumerate(frames)]},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1,2,4,8,16,32', help='Comma separated batch sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per batch size (best is kept)')
+    parser.add_argument('--no-overlay', action='store_true', help='Request counts only from both routes')
+    args = parser.parse_args()
+
+    client = index.app.test_client()
+    sizes = [int(s) for s in args.sizes.split(',')]
+    pool = [synthetic_frame(i) for i in range(max(sizes))]
+
+    print(f"Workers: {index.batch_workers}  Slots: {len(index.get_layout())}  "
+          f"Overlay: {'no' if args.no_overlay else 'yes'}")
+    print(f"{'batch':>6} {'single ms':>10} {'batch ms':>10} {'speedup':>8}")
+    for size in sizes:
+        frames = pool[:size]
+        single = min(time_single(client, frames, not args.no_overlay) for _ in range(args.repeat))
+        batch = min(time_batch(client, frames, not args.no_overlay) for _ in range(args.repeat))
+        print(f"{size:>6} {single * 1000:>10.1f} {batch * 1000:>10.1f} {single / batch:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Run consumer processes of different speeds against one shared-memory frame ring
+Checks the capture keeps the source's frame rate however slow a consumer is,
+and that every consumer reads the newest frame and skips the rest
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from capture import FrameReader, start_capture
+
+
+def synthetic_video(path, fps, frames=60, size=(720, 1280)):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (size[1], size[0]))
+    rng = np.random.default_rng(0)
+    for _ in range(frames):
+        frame = rng.integers(0, 255, (size[0] // 8, size[1] // 8, 3), dtype=np.uint8)
+        writer.write(cv2.resize(frame, (size[1], size[0])))
+    writer.release()
+
+
+def consume(name, work_ms, seconds, results):
+    """Read for the given time, pretending each frame takes work_ms to process"""
+    reader = FrameReader(name)
+    lag, wait_s, copy_s = [], 0.0, 0.0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        start = time.perf_counter()
+        seq, frame = reader.read(timeout=0.5)
+        if seq is None:
+            continue
+        wait_s += time.perf_counter() - start
+        # Frames published after the one handed out, i.e. how stale it already is
+        lag.append(reader.ring.write_seq - seq)
+        start = time.perf_counter()
+        frame.copy()
+        copy_s += time.perf_counter() - start
+        time.sleep(work_ms / 1000)
+    stats = reader.stats()
+    reader.close()
+    results.put((work_ms, stats, float(np.mean(lag)) if lag else 0.0,
+                 wait_s / max(stats['read'], 1) * 1000, copy_s / max(stats['read'], 1) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--video', default=None, help='Source video (default: a synthetic 720p clip)')
+    parser.add_argument('--fps', type=float, default=30.0, help='Frame rate of the synthetic clip')
+    parser.add_argument('--work-ms', type=float, nargs='+', default=[0.0, 50.0, 500.0],
+                        help='Per-frame processing time of each consumer')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--slots', type=int, default=8)
+    args = parser.parse_args()
+
+    video = args.video
+    if video is None:
+        video = os.path.join(tempfile.mkdtemp(), 'ring.avi')
+        synthetic_video(video, args.fps)
+
+    ring, process, stop = start_capture(video, args.slots)
+    results = mp.Queue()
+    consumers = [mp.Process(target=consume, args=(ring.name, work_ms, args.seconds, results))
+                 for work_ms in args.work_ms]
+    start_seq, start = ring.write_seq, time.perf_counter()
+    for consumer in consumers:
+        consumer.start()
+    rows = sorted(results.get() for _ in consumers)
+    captured = (ring.write_seq - start_seq) / (time.perf_counter() - start)
+    for consumer in consumers:
+        consumer.join()
+    stop.set()
+    process.join(5)
+    source_fps = ring.fps
+    ring.close()
+
+    print(f"Source {source_fps:.1f} fps, capture wrote {captured:.1f} fps into {args.slots} slots")
+    print(f"{'work ms':>8} {'read':>6} {'skipped':>8} {'torn':>5} {'lag frames':>11} {'wait ms':>8} {'copy ms':>8}")
+    for work_ms, stats, lag, wait_ms, copy_ms in rows:
+        print(f"{work_ms:>8.0f} {stats['read']:>6} {stats['skipped']:>8} {stats['torn']:>5} "
+              f"{lag:>11.2f} {wait_ms:>8.3f} {copy_ms:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
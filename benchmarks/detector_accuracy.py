@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Compare a detector backend with the adaptive chain on recorded footage
+Reports per-slot decision agreement, where the backends disagree, the
+threshold that would match best and the time each backend takes per frame
+"""
+
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detectors import DETECTORS, get_detector
+from lots import DEFAULT_CONFIG, CompiledLayout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--video', default='carPark.mp4', help='Recorded footage to replay')
+    parser.add_argument('--positions', default='CarParkPos', help='Pickled slot positions')
+    parser.add_argument('--candidate', default='integral', choices=sorted(DETECTORS),
+                        help='Backend to compare against the adaptive chain')
+    parser.add_argument('--threshold', type=int, default=DEFAULT_CONFIG['threshold'],
+                        help='Occupied when a slot has at least this many mask pixels')
+    parser.add_argument('--every', type=int, default=1, help='Compare every Nth frame')
+    parser.add_argument('--max-frames', type=int, default=0, help='Stop after N compared frames (0 = all)')
+    parser.add_argument('--report', default=None, help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    with open(args.positions, 'rb') as f:
+        positions = pickle.load(f)
+    layout = CompiledLayout('accuracy', positions, {'threshold': args.threshold}, version=0)
+    reference, candidate = get_detector('adaptive'), get_detector(args.candidate)
+
+    cap = cv2.VideoCapture(args.video)
+    ref_counts, cand_counts = [], []
+    ref_time = cand_time = 0.0
+    index = 0
+    while not args.max_frames or len(ref_counts) < args.max_frames:
+        success, img = cap.read()
+        if not success:
+            break
+        index += 1
+        if (index - 1) % args.every:
+            continue
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        start = time.perf_counter()
+        ref_mask = reference.mask(gray, layout)
+        ref_time += time.perf_counter() - start
+        start = time.perf_counter()
+        cand_mask = candidate.mask(gray, layout)
+        cand_time += time.perf_counter() - start
+
+        ref_counts.append(layout.count(ref_mask))
+        cand_counts.append(layout.count(cand_mask))
+    cap.release()
+
+    if not ref_counts:
+        sys.exit(f'No frames read from {args.video}')
+
+    ref_counts, cand_counts = np.array(ref_counts), np.array(cand_counts)
+    ref_occ = layout.occupied(ref_counts)
+    cand_occ = layout.occupied(cand_counts)
+    frames = len(ref_counts)
+    agree = ref_occ == cand_occ
+
+    # Candidate threshold that best reproduces the adaptive decisions
+    sweep = np.unique(np.append(np.percentile(cand_counts, np.linspace(0, 100, 201)).astype(int),
+                                args.threshold))
+    best = max(sweep, key=lambda t: ((cand_counts >= t) == ref_occ).mean())
+
+    per_slot = 1.0 - agree.mean(axis=0)
+    worst = np.argsort(per_slot)[::-1][:10]
+    report = {
+        'video': args.video,
+        'candidate': args.candidate,
+        'frames': frames,
+        'slots': len(layout),
+        'threshold': args.threshold,
+        'agreement': round(float(agree.mean()), 4),
+        'frames_all_agree': round(float(agree.all(axis=1).mean()), 4),
+        'occupied_only_adaptive': int((ref_occ & ~cand_occ).sum()),
+        'occupied_only_candidate': int((cand_occ & ~ref_occ).sum()),
+        'free_count_mean_abs_diff': round(float(np.abs(ref_occ.sum(1) - cand_occ.sum(1)).mean()), 3),
+        'best_candidate_threshold': int(best),
+        'agreement_at_best_threshold': round(float(((cand_counts >= best) == ref_occ).mean()), 4),
+        'worst_slots': [{'slot': int(i), 'disagreement': round(float(per_slot[i]), 4)}
+                        for i in worst if per_slot[i] > 0],
+        'adaptive_ms': round(ref_time / frames * 1000, 2),
+        'candidate_ms': round(cand_time / frames * 1000, 2)
+    }
+
+    print(f"{frames} frames x {len(layout)} slots, {args.candidate} vs adaptive at threshold {args.threshold}")
+    print(f"Slot decisions agree:   {report['agreement']:.2%} "
+          f"(all slots agree on {report['frames_all_agree']:.2%} of frames)")
+    print(f"Occupied only adaptive: {report['occupied_only_adaptive']}  "
+          f"only {args.candidate}: {report['occupied_only_candidate']}")
+    print(f"Best {args.candidate} threshold: {report['best_candidate_threshold']} "
+          f"({report['agreement_at_best_threshold']:.2%} agreement)")
+    for slot in report['worst_slots']:
+        print(f"  slot {slot['slot']:>3} disagrees on {slot['disagreement']:.2%} of frames")
+    print(f"Mask time per frame: adaptive {report['adaptive_ms']} ms, "
+          f"{args.candidate} {report['candidate_ms']} ms "
+          f"({report['adaptive_ms'] / max(report['candidate_ms'], 1e-6):.2f}x)")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
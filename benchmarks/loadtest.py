@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Local load test for app.py, app-render.py and index.py
+Starts the server on a free port, then runs N pollers of /api/get_result,
+M submitters to /api/process_frame and K Socket.IO subscribers against it
+"""
+
+import argparse
+import base64
+import http.client
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports the server file without running its __main__ block, then serves it
+# threaded on the requested port
+LAUNCHER = r'''
+import os, runpy, sys
+sys.path.insert(0, os.getcwd())
+module = runpy.run_path(sys.argv[1], run_name='loadtest_server')
+if 'load_parking_positions' in module:
+    module['load_parking_positions']()
+port = int(sys.argv[2])
+if 'socketio' in module:
+    module['socketio'].run(module['app'], host='127.0.0.1', port=port, allow_unsafe_werkzeug=True)
+else:
+    module['app'].run(host='127.0.0.1', port=port, threaded=True)
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def synthetic_frame(size=(720, 1280), seed=0):
+    rng = np.random.default_rng(seed)
+    img = cv2.resize(rng.integers(0, 255, (size[0] // 8, size[1] // 8, 3), dtype=np.uint8), (size[1], size[0]))
+    _, buffer = cv2.imencode('.jpg', img)
+    return buffer.tobytes()
+
+
+def synthetic_video(path, frames=50, size=(720, 1280)):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (size[1], size[0]))
+    rng = np.random.default_rng(0)
+    for _ in range(frames):
+        writer.write(cv2.resize(rng.integers(0, 255, (size[0] // 8, size[1] // 8, 3), dtype=np.uint8),
+                                (size[1], size[0])))
+    writer.release()
+
+
+class Recorder:
+    """Latency samples and error counts per operation"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds, ok=True):
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self, duration):
+        out = {}
+        for name, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+
+            def pct(p):
+                return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+            out[name] = {
+                'requests': len(samples),
+                'errors': self.errors.get(name, 0),
+                'throughput_rps': round(len(samples) / duration, 2),
+                'mean_ms': round(statistics.fmean(samples) * 1000, 2),
+                'p50_ms': round(pct(50), 2),
+                'p95_ms': round(pct(95), 2),
+                'p99_ms': round(pct(99), 2),
+                'max_ms': round(ordered[-1] * 1000, 2)
+            }
+        return out
+
+
+def request(conn, method, path, body=None, headers=None):
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    data = response.read()
+    return response.status, data
+
+
+def multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            request(conn, 'GET', '/api/parking_spaces')
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def supports(port, method, path):
+    """True if the server routes this endpoint (any status other than 404/405)"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    body, headers = (None, {}) if method == 'GET' else ('{}', {'Content-Type': 'application/json'})
+    status, _ = request(conn, method, path, body, headers)
+    return status not in (404, 405)
+
+
+def prepare_stream(port):
+    """Upload a synthetic video and start detection so pollers have results to read"""
+    path = os.path.join(tempfile.mkdtemp(), 'loadtest.avi')
+    synthetic_video(path)
+    with open(path, 'rb') as f:
+        body, headers = multipart('video', 'loadtest.avi', f.read())
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    status, _ = request(conn, 'POST', '/api/upload', body, headers)
+    if status == 200:
+        request(conn, 'POST', '/api/start_detection')
+    return status == 200
+
+
+def poller(port, deadline, recorder, query):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            status, _ = request(conn, 'GET', '/api/get_result' + query)
+            recorder.add('get_result', time.perf_counter() - start, status == 200)
+        except OSError:
+            recorder.add('get_result', time.perf_counter() - start, False)
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+
+def submitter(port, deadline, recorder, frame):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    body = json.dumps({'frame': base64.b64encode(frame).decode('utf-8')})
+    headers = {'Content-Type': 'application/json'}
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            status, data = request(conn, 'POST', '/api/process_frame', body, headers)
+            if status == 429:
+                # Shed by admission control; counted apart from real failures, then back off
+                recorder.add('process_frame_429', time.perf_counter() - start)
+                retry_after = json.loads(data).get('retry_after', 1)
+                time.sleep(max(0.0, min(retry_after, deadline - time.time())))
+            else:
+                recorder.add('process_frame', time.perf_counter() - start, status == 200)
+        except OSError:
+            recorder.add('process_frame', time.perf_counter() - start, False)
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+
+def subscriber(port, deadline, recorder, quality, delay):
+    import socketio
+    client = socketio.Client(reconnection=False)
+    last = [time.perf_counter()]
+
+    @client.on('detection_result')
+    def on_result(data):
+        now = time.perf_counter()
+        recorder.add(f'sio_{quality}_interval', now - last[0])
+        last[0] = now
+        # A slow viewer: hold the ack back (the return value is the ack)
+        if delay:
+            time.sleep(delay)
+        return True
+
+    start = time.perf_counter()
+    try:
+        client.connect(f'http://127.0.0.1:{port}', transports=['websocket'])
+    except socketio.exceptions.ConnectionError:
+        recorder.add('socketio_connect', time.perf_counter() - start, False)
+        return
+    recorder.add('socketio_connect', time.perf_counter() - start)
+    client.call('subscribe', {'stream': 'default', 'quality': quality})
+    last[0] = time.perf_counter()
+    client.sleep(max(0.0, deadline - time.time()))
+    client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--server', default='app.py', help='app.py, app-render.py or index.py')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds of load')
+    parser.add_argument('--pollers', type=int, default=8, help='Clients polling /api/get_result')
+    parser.add_argument('--submitters', type=int, default=2, help='Clients posting /api/process_frame')
+    parser.add_argument('--subscribers', type=int, default=0, help='Socket.IO detection_result subscribers')
+    parser.add_argument('--quality', default='preview', help='Room tier for subscribers (thumbnail, preview, full)')
+    parser.add_argument('--subscriber-delay', type=float, default=0.0,
+                        help='Seconds each subscriber takes to acknowledge a frame (simulates slow links)')
+    parser.add_argument('--poll-query', default='', help="Query string for pollers, e.g. '?image=0'")
+    parser.add_argument('--port', type=int, default=0, help='Port for the server (default: any free port)')
+    parser.add_argument('--report', default=None, help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    port = args.port or free_port()
+    server = subprocess.Popen([sys.executable, '-c', LAUNCHER, args.server, str(port)], cwd=ROOT,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_server(port):
+            sys.exit(f'{args.server} did not start on port {port}')
+
+        recorder = Recorder()
+        frame = synthetic_frame()
+        pollers, submitters, subscribers = args.pollers, args.submitters, args.subscribers
+        if pollers and not supports(port, 'GET', '/api/get_result'):
+            print(f'Warning: {args.server} has no /api/get_result, skipping pollers', file=sys.stderr)
+            pollers = 0
+        if submitters and not supports(port, 'POST', '/api/process_frame'):
+            print(f'Warning: {args.server} has no /api/process_frame, skipping submitters', file=sys.stderr)
+            submitters = 0
+        if subscribers and not supports(port, 'GET', '/socket.io/?EIO=4&transport=polling'):
+            print(f'Warning: {args.server} does not serve Socket.IO, skipping subscribers', file=sys.stderr)
+            subscribers = 0
+        if subscribers:
+            if importlib.util.find_spec('socketio') is None:
+                print('Warning: python-socketio client not installed, skipping subscribers', file=sys.stderr)
+                subscribers = 0
+
+        if (pollers or subscribers) and not prepare_stream(port):
+            print('Warning: could not start a detection stream', file=sys.stderr)
+
+        start = time.time()
+        deadline = start + args.duration
+        threads = ([threading.Thread(target=poller, args=(port, deadline, recorder, args.poll_query))
+                    for _ in range(pollers)] +
+                   [threading.Thread(target=submitter, args=(port, deadline, recorder, frame))
+                    for _ in range(submitters)] +
+                   [threading.Thread(target=subscriber,
+                                     args=(port, deadline, recorder, args.quality, args.subscriber_delay))
+                    for _ in range(subscribers)])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.time() - start
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    report = {
+        'server': args.server,
+        'duration_s': round(duration, 2),
+        'clients': {'pollers': pollers, 'submitters': submitters, 'subscribers': subscribers},
+        'cpu_count': os.cpu_count(),
+        'operations': recorder.report(duration)
+    }
+
+    print(f"{'operation':<24} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, stats in report['operations'].items():
+        print(f"{name:<24} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8.1f} "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Measure serverless cold start of index.py
+Each run is a fresh interpreter: import time, then first and second request latency
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import base64, json, time
+start = time.perf_counter()
+import index
+imported = time.perf_counter()
+client = index.app.test_client()
+frame = base64.b64encode(open(FRAME, 'rb').read()).decode('utf-8')
+if WARMUP:
+    client.get('/api/warmup')
+warmed = time.perf_counter()
+response = client.post('/api/process_frame', json={'frame': frame})
+first = time.perf_counter()
+assert response.status_code == 200, f'first request: {response.status_code} {response.get_data(as_text=True)}'
+response = client.post('/api/process_frame', json={'frame': frame})
+second = time.perf_counter()
+assert response.status_code == 200, f'second request: {response.status_code} {response.get_data(as_text=True)}'
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'warmup_ms': (warmed - imported) * 1000,
+    'first_request_ms': (first - warmed) * 1000,
+    'second_request_ms': (second - first) * 1000
+}))
+'''
+
+
+def synthetic_frame(path):
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(0)
+    img = cv2.resize(rng.integers(0, 255, (90, 160, 3), dtype=np.uint8), (1280, 720))
+    cv2.imwrite(path, img)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup', action='store_true', help='Call /api/warmup before the first request')
+    args = parser.parse_args()
+
+    frame_path = os.path.join(ROOT, 'benchmarks', '.startup_frame.jpg')
+    synthetic_frame(frame_path)
+    code = f'FRAME = {frame_path!r}\nWARMUP = {args.warmup}\n' + PROBE
+
+    runs = []
+    try:
+        for _ in range(args.runs):
+            probe = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+            if probe.returncode != 0:
+                # Timings of failed requests would say nothing about startup
+                sys.exit(f'Probe failed:\n{probe.stderr}')
+            runs.append(json.loads(probe.stdout.strip().splitlines()[-1]))
+    finally:
+        os.remove(frame_path)
+
+    print(f"{'metric':<20} {'median ms':>10} {'min ms':>10}")
+    for key in runs[0]:
+        values = [run[key] for run in runs]
+        print(f"{key:<20} {statistics.median(values):>10.1f} {min(values):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
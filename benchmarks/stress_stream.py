@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Stress the detection stream lifecycle in app.py
+Hammers /api/get_result, /api/upload, /api/start_detection and /api/stop_detection
+from several threads at once and checks every result is a consistent snapshot
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as server
+
+
+def synthetic_video(path, frames=30, size=(720, 1280)):
+    """Write a short noisy video for the uploader threads"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (size[1], size[0]))
+    rng = np.random.default_rng(0)
+    for _ in range(frames):
+        frame = rng.integers(0, 255, (size[0] // 8, size[1] // 8, 3), dtype=np.uint8)
+        writer.write(cv2.resize(frame, (size[1], size[0])))
+    writer.release()
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--uploaders', type=int, default=2)
+    parser.add_argument('--togglers', type=int, default=2)
+    args = parser.parse_args()
+
+    server.load_parking_positions()
+    server.app.config['TESTING'] = True
+    video = synthetic_video(os.path.join(tempfile.mkdtemp(), 'stress.avi'))
+
+    deadline = time.time() + args.seconds
+    errors = []
+    counts = {'get_result': 0, 'upload': 0, 'start': 0, 'stop': 0}
+    lock = threading.Lock()
+
+    def record(name, ok, detail=None):
+        with lock:
+            counts[name] += 1
+            if not ok:
+                errors.append(f'{name}: {detail}')
+
+    def reader():
+        client = server.app.test_client()
+        last_seq = 0
+        while time.time() < deadline:
+            data = client.get('/api/get_result').get_json()
+            if 'error' in data:
+                record('get_result', True)
+                continue
+            consistent = data['free_spaces'] + data['occupied_spaces'] == data['total_spaces']
+            record('get_result', consistent and data['seq'] >= last_seq, data.get('seq'))
+            last_seq = data['seq']
+
+    def uploader():
+        client = server.app.test_client()
+        while time.time() < deadline:
+            response = client.post('/api/upload', data={'video': (io.BytesIO(video), 'stress.avi')},
+                                   content_type='multipart/form-data')
+            record('upload', response.status_code == 200, response.status_code)
+
+    def toggler():
+        client = server.app.test_client()
+        while time.time() < deadline:
+            response = client.post('/api/start_detection')
+            record('start', response.status_code in (200, 400), response.status_code)
+            time.sleep(0.05)
+            response = client.post('/api/stop_detection')
+            record('stop', response.status_code == 200, response.status_code)
+
+    threads = ([threading.Thread(target=reader) for _ in range(args.readers)] +
+               [threading.Thread(target=uploader) for _ in range(args.uploaders)] +
+               [threading.Thread(target=toggler) for _ in range(args.togglers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.stream.close()
+
+    print(' '.join(f'{name}={count}' for name, count in counts.items()))
+    if errors:
+        print(f'{len(errors)} failures, first: {errors[0]}')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == "__main__":
+    main()
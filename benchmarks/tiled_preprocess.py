@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark banded preprocessing against the serial chain
+Checks the masks are bit-identical and reports the speedup per thread count
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import preprocess_serial, preprocess_tiled
+
+
+def best_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threads', default=None,
+                        help='Comma separated thread counts (default: powers of two up to the core count)')
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.threads:
+        counts = [int(n) for n in args.threads.split(',')]
+    else:
+        counts = sorted({2 ** i for i in range(cores.bit_length())} | {cores})
+
+    rng = np.random.default_rng(0)
+    img = cv2.GaussianBlur(rng.integers(0, 255, (args.height, args.width), dtype=np.uint8), (7, 7), 0)
+    reference = preprocess_serial(img)
+    serial = best_time(lambda: preprocess_serial(img), args.repeat)
+
+    print(f"Frame: {args.width}x{args.height}  Cores: {cores}  OpenCV threads: {cv2.getNumThreads()}")
+    print(f"{'threads':>7} {'ms':>8} {'speedup':>8}  identical")
+    print(f"{'serial':>7} {serial * 1000:>8.1f} {1.0:>7.2f}x  yes")
+    for count in counts:
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            identical = np.array_equal(preprocess_tiled(img, executor, count), reference)
+            elapsed = best_time(lambda: preprocess_tiled(img, executor, count), args.repeat)
+        print(f"{count:>7} {elapsed * 1000:>8.1f} {serial / elapsed:>7.2f}x  {'yes' if identical else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark zone index queries against scanning the whole lot
+Checks both give the same slots and reports microseconds per query and per update
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zones import ZoneIndex
+
+
+def per_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--slots', type=int, default=5000)
+    parser.add_argument('--zones', type=int, default=20)
+    parser.add_argument('--flip-rate', type=float, default=0.01, help='Fraction of slots changing per result')
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    columns = 100
+    positions = [(i % columns * 110, i // columns * 50) for i in range(args.slots)]
+    band = columns * 110 // args.zones
+    definition = {'zones': {f'z{i}': [[i * band, 0, (i + 1) * band, 10 ** 6]] for i in range(args.zones)},
+                  'points': {'entrance': [0, 0]}}
+    index = ZoneIndex(positions, 107, 48, definition)
+    centres = np.array(positions) + (53.5, 24)
+    distance = np.hypot(centres[:, 0], centres[:, 1])
+
+    rng = np.random.default_rng(0)
+    states = rng.random(args.slots) < 0.6
+    index.update(states, 0)
+
+    masks = [(centres[:, 0] >= rects[0][0]) & (centres[:, 0] < rects[0][2]) for rects in definition['zones'].values()]
+
+    def scan_free(zone):
+        x1, _, x2, _ = definition['zones'][zone][0]
+        inside = (centres[:, 0] >= x1) & (centres[:, 0] < x2)
+        return np.flatnonzero(inside & ~states)[:50].tolist()
+
+    def scan_nearest():
+        free = np.flatnonzero(~states)
+        return free[np.argsort(distance[free], kind='stable')[:5]].tolist()
+
+    identical = (scan_free('z3') == [s['slot'] for s in index.slots('z3', 'free', limit=50)[0]]
+                 and scan_nearest() == [s['slot'] for s in index.nearest_free('entrance', limit=5)])
+
+    flips = max(1, int(args.slots * args.flip_rate))
+
+    def next_result():
+        changed = rng.choice(args.slots, flips, replace=False)
+        states[changed] = ~states[changed]
+        index.update(states, 0)
+
+    print(f"Slots: {args.slots}  Zones: {args.zones}  Flips per result: {flips}  Same slots: {'yes' if identical else 'NO'}")
+    print(f"{'operation':<24} {'index us':>9} {'scan us':>9}")
+    print(f"{'zone counts':<24} {per_call(index.counts, args.repeat):>9.1f} "
+          f"{per_call(lambda: [int((~states & mask).sum()) for mask in masks], args.repeat):>9.1f}")
+    print(f"{'50 free slots in zone':<24} {per_call(lambda: index.slots('z3', 'free', limit=50), args.repeat):>9.1f} "
+          f"{per_call(lambda: scan_free('z3'), args.repeat):>9.1f}")
+    print(f"{'5 nearest free slots':<24} {per_call(lambda: index.nearest_free('entrance', limit=5), args.repeat):>9.1f} "
+          f"{per_call(scan_nearest, args.repeat):>9.1f}")
+    print(f"{'apply one result':<24} {per_call(next_result, max(1, args.repeat // 10)):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
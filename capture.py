@@ -0,0 +1,253 @@
+"""
+Capture process that decodes video into a shared-memory ring of frame slots
+Consumer processes attach by name and read frames zero-copy through NumPy views
+"""
+
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+MAGIC = 0x474E4952  # marks an initialised ring
+
+# Header layout (int64 words)
+H_MAGIC, H_SLOTS, H_HEIGHT, H_WIDTH, H_CHANNELS, H_WRITE_SEQ, H_CLOSED, H_FPS_MILLI = range(8)
+HEADER_FIXED = 8
+
+
+def _attach(name):
+    """Attach to an existing segment without letting this process unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # Python < 3.13 registers every attach with the resource tracker. Processes
+    # started by multiprocessing share the creator's tracker, where the extra
+    # registration is harmless; an unrelated process gets its own tracker, which
+    # would unlink the segment when it exits, so unregister there.
+    from multiprocessing import resource_tracker
+    own_tracker = getattr(resource_tracker._resource_tracker, '_fd', None) is None
+    shm = shared_memory.SharedMemory(name=name)
+    if own_tracker:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class FrameRing:
+    """Fixed-size frame slots plus a header of per-slot sequence numbers
+
+    A slot's sequence number is set to -1 while it is being written and to the
+    frame's sequence number afterwards, so readers can tell whether the frame
+    they looked at was overwritten underneath them.
+    """
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        words = np.ndarray((HEADER_FIXED,), np.int64, shm.buf)
+        if words[H_MAGIC] != MAGIC:
+            raise ValueError('Not an initialised frame ring')
+        self.slots = int(words[H_SLOTS])
+        self.shape = (int(words[H_HEIGHT]), int(words[H_WIDTH]), int(words[H_CHANNELS]))
+        self.header = np.ndarray((HEADER_FIXED + self.slots,), np.int64, shm.buf)
+        self.slot_seqs = self.header[HEADER_FIXED:]
+        offset = _frames_offset(self.slots)
+        self.frames = np.ndarray((self.slots,) + self.shape, np.uint8, shm.buf, offset)
+
+    @classmethod
+    def create(cls, shape, slots=8, name=None):
+        size = _frames_offset(slots) + slots * int(np.prod(shape))
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIXED + slots,), np.int64, shm.buf)
+        header[:] = -1
+        header[H_SLOTS] = slots
+        header[H_HEIGHT], header[H_WIDTH], header[H_CHANNELS] = shape
+        header[H_WRITE_SEQ] = 0
+        header[H_CLOSED] = 0
+        header[H_FPS_MILLI] = 0
+        header[H_MAGIC] = MAGIC
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach(name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_seq(self):
+        return int(self.header[H_WRITE_SEQ])
+
+    @property
+    def closed(self):
+        return bool(self.header[H_CLOSED])
+
+    @property
+    def fps(self):
+        return self.header[H_FPS_MILLI] / 1000.0
+
+    def write(self, frame):
+        """Copy a frame into the next slot (capture process only)"""
+        seq = self.write_seq + 1
+        i = seq % self.slots
+        self.slot_seqs[i] = -1
+        np.copyto(self.frames[i], frame)
+        self.slot_seqs[i] = seq
+        self.header[H_WRITE_SEQ] = seq
+        return seq
+
+    def close(self):
+        # Drop our views before closing the mapping
+        self.header = self.slot_seqs = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _frames_offset(slots):
+    header_bytes = (HEADER_FIXED + slots) * 8
+    return (header_bytes + 63) // 64 * 64
+
+
+class FrameReader:
+    """Consumer side of a frame ring
+
+    read() hands out a view into shared memory; check valid(seq) after using
+    it, or pass copy=True. Every read returns the newest frame, so a reader
+    slower than the capture skips the frames published in between (counted in
+    stats()) rather than working through stale ones, and the capture never waits.
+    """
+
+    def __init__(self, name):
+        self.ring = FrameRing.attach(name)
+        self.last_seq = 0
+        self.frames_read = 0
+        self.skipped = 0
+        self.torn = 0
+
+    def read(self, timeout=1.0, copy=False):
+        """Return (seq, frame) for the newest frame not read yet, or (None, None) on timeout/close"""
+        ring = self.ring
+        deadline = time.time() + timeout
+        while True:
+            write_seq = ring.write_seq
+            if write_seq > self.last_seq:
+                break
+            if ring.closed or time.time() >= deadline:
+                return None, None
+            time.sleep(0.001)
+
+        target = write_seq
+        self.skipped += target - self.last_seq - 1
+        i = target % ring.slots
+        frame = ring.frames[i]
+        if copy and ring.slot_seqs[i] == target:
+            frame = frame.copy()
+        if ring.slot_seqs[i] != target:
+            # Overwritten while we looked: the writer has lapped the ring, try its newest frame
+            self.torn += 1
+            self.last_seq = target
+            return self.read(max(0.0, deadline - time.time()), copy)
+        self.last_seq = target
+        self.frames_read += 1
+        return target, frame
+
+    def valid(self, seq):
+        """True if the slot holding seq has not been overwritten since it was read"""
+        return self.ring.slot_seqs[seq % self.ring.slots] == seq
+
+    def stats(self):
+        return {'written': self.ring.write_seq, 'read': self.frames_read, 'skipped': self.skipped,
+                'torn': self.torn}
+
+    def close(self):
+        self.ring.close()
+
+
+def _capture_loop(source, name, stop, loop):
+    ring = FrameRing.attach(name)
+    cap = cv2.VideoCapture(source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    ring.header[H_FPS_MILLI] = int(fps * 1000)
+    # Files are played at their own frame rate; live sources already deliver at theirs
+    interval = 1.0 / fps if fps > 0 and cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0 else 0.0
+    deadline = time.perf_counter()
+    try:
+        while not stop.is_set():
+            if interval:
+                delay = deadline - time.perf_counter()
+                if delay > 0 and stop.wait(delay):
+                    break
+                # A slow decode moves the schedule on rather than bursting to catch up
+                deadline = max(deadline, time.perf_counter() - interval) + interval
+            success, img = cap.read()
+            if not success:
+                if loop and cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+            if img.shape != ring.shape:
+                img = cv2.resize(img, (ring.shape[1], ring.shape[0]))
+            ring.write(img)
+    finally:
+        ring.header[H_CLOSED] = 1
+        cap.release()
+        ring.close()
+
+
+def start_capture(source, slots=8, loop=True):
+    """Create a ring sized for the source and start a capture process feeding it
+
+    Returns (ring, process, stop_event); the caller owns the ring and unlinks it
+    with ring.close() after stopping the process.
+    """
+    probe = cv2.VideoCapture(source)
+    success, img = probe.read()
+    probe.release()
+    if not success:
+        raise ValueError(f'Cannot read from {source}')
+
+    ring = FrameRing.create(img.shape, slots)
+    stop = mp.Event()
+    process = mp.Process(target=_capture_loop, args=(source, ring.name, stop, loop), daemon=True)
+    process.start()
+    return ring, process, stop
+
+
+class RingCapture:
+    """cv2.VideoCapture-like adapter so a detection stream can read from a ring"""
+
+    def __init__(self, source, slots=8):
+        self.ring, self.process, self.stop = start_capture(source, slots)
+        self.reader = FrameReader(self.ring.name)
+
+    def read(self):
+        seq, frame = self.reader.read(copy=True)
+        return seq is not None, frame
+
+    def grab(self):
+        # read() already jumps to the newest frame, so there is nothing to skip
+        return not self.ring.closed
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.ring.fps
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.reader.last_seq)
+        return -1.0
+
+    def set(self, prop, value):
+        return False
+
+    def stats(self):
+        return self.reader.stats()
+
+    def release(self):
+        self.stop.set()
+        self.process.join(5)
+        self.reader.close()
+        self.ring.close()
@@ -0,0 +1,221 @@
+"""
+Detector backends that turn a grayscale frame into the 0/255 occupancy mask
+'adaptive' is the original chain in pipeline.py; 'integral' thresholds against
+a box mean read from one integral image and uses a lighter cleanup;
+'background' marks pixels that differ from a learned empty-lot reference
+
+mask(img_gray, layout=None) takes the lots.CompiledLayout of the stream; only
+slot-aware backends use it. A stateful backend's mask depends on earlier frames
+"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from pipeline import HALO, kernel, preprocess, preprocess_serial
+
+DEFAULT_DETECTOR = os.environ.get('DETECTOR', 'adaptive')
+
+# Empty-lot image for the background detector (learned from frames when unset)
+BACKGROUND_IMAGE = os.environ.get('BACKGROUND_IMAGE')
+
+
+class AdaptiveDetector:
+    """GaussianBlur -> adaptiveThreshold (25x25 Gaussian) -> medianBlur 5 -> dilate"""
+
+    name = 'adaptive'
+    stateful = False
+
+    def mask(self, img_gray, layout=None):
+        return preprocess(img_gray)
+
+
+class IntegralDetector:
+    """Inverse threshold against the local block x block mean minus c
+
+    Every pixel's window sum is four lookups into one integral image of the
+    edge-padded frame, so the cost does not grow with the block size. A 3x3
+    median and 3x3 dilate replace the pre-blur, 5x5 median and dilate.
+    """
+
+    name = 'integral'
+    stateful = False
+
+    def __init__(self, block=15, c=16):
+        if block < 3 or block % 2 == 0:
+            raise ValueError('block must be an odd number >= 3')
+        self.block = block
+        self.c = c
+        # (pixel + c) * area per grey level, so the comparison needs no division
+        scaled = (np.arange(256, dtype=np.int64) + c) * block * block
+        self._lut32 = scaled.astype(np.int32)
+        self._lut64 = scaled.astype(np.float64)
+
+    def local_sums(self, img_gray):
+        """Sum of each pixel's block x block window (edges replicated)"""
+        b, r = self.block, self.block // 2
+        rows, cols = img_gray.shape
+        padded = cv2.copyMakeBorder(img_gray, r, r, r, r, cv2.BORDER_REPLICATE)
+        # int32 holds the whole-frame total up to about 8 megapixels
+        depth = cv2.CV_32S if padded.size * 255 < 2 ** 31 else cv2.CV_64F
+        ii = cv2.integral(padded, sdepth=depth)
+        sums = cv2.add(ii[b:b + rows, b:b + cols], ii[:rows, :cols])
+        cv2.subtract(sums, ii[:rows, b:b + cols], dst=sums)
+        cv2.subtract(sums, ii[b:b + rows, :cols], dst=sums)
+        return sums
+
+    def mask(self, img_gray, layout=None):
+        sums = self.local_sums(img_gray)
+        lut = self._lut32 if sums.dtype == np.int32 else self._lut64
+        # pixel <= mean - c  <=>  (pixel + c) * area <= window sum
+        mask = cv2.compare(sums, cv2.LUT(img_gray, lut), cv2.CMP_GE)
+        return cv2.dilate(cv2.medianBlur(mask, 3), kernel, iterations=1)
+
+
+class BackgroundDetector:
+    """Absolute difference against an empty-lot reference, no full-frame filtering
+
+    A slot's mask count is the number of its pixels that differ from the
+    reference by more than delta. The reference is an empty-lot image, or is
+    learned slot by slot: until a slot has been seen empty its mask comes from
+    the adaptive chain run on that slot's crop alone, and the first frame in
+    which it is empty becomes its reference. Every update_every frames the
+    slots that are currently empty are blended into the reference, so it
+    follows lighting drift without absorbing parked cars.
+
+    Without a layout the whole frame is used instead: the reference is the
+    median of the first learn_frames frames and unchanged pixels are blended in.
+    """
+
+    name = 'background'
+    stateful = True
+
+    def __init__(self, reference_image=BACKGROUND_IMAGE, delta=30, alpha=0.05,
+                 update_every=10, learn_frames=15):
+        self.delta = delta
+        self.alpha = alpha
+        self.update_every = update_every
+        self.learn_frames = learn_frames
+        self.reference = None  # uint8 frame compared against
+        self._average = None  # float32 running reference
+        self._complete = False  # reference covers every slot (image or learn())
+        self._known = set()  # slot positions with a learned reference
+        self._pending = {}  # slot position -> last adaptive mask while it has none
+        self._learning = []  # frames collected for the whole-frame median
+        self._frames = 0
+        self._lock = threading.Lock()
+        if reference_image:
+            img = cv2.imread(reference_image, cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                raise ValueError(f'Cannot read background image {reference_image}')
+            self.set_reference(img)
+
+    @property
+    def nbytes(self):
+        reference, average = self.reference, self._average
+        return sum(a.nbytes for a in (reference, average) if a is not None)
+
+    def set_reference(self, img_gray):
+        """Use an empty-lot frame as the reference for every slot"""
+        with self._lock:
+            self.reference = img_gray.copy()
+            self._average = img_gray.astype(np.float32)
+            self._complete = True
+            self._learning = []
+
+    def learn(self, frames):
+        """Use the per-pixel median of the given grayscale frames as the reference"""
+        self.set_reference(np.median(np.stack(frames), axis=0).astype(np.uint8))
+
+    def mask(self, img_gray, layout=None):
+        with self._lock:
+            self._prepare(img_gray, layout)
+            diff = cv2.absdiff(img_gray, self.reference)
+            _, mask = cv2.threshold(diff, self.delta, 255, cv2.THRESH_BINARY)
+            self._frames += 1
+            refresh = self._frames % self.update_every == 0
+            if layout is not None and not self._complete:
+                self._learn_slots(img_gray, mask, layout, refresh)
+            if refresh:
+                self._update(img_gray, mask, layout)
+        return mask
+
+    def _prepare(self, img_gray, layout):
+        reference = self.reference
+        if reference is not None and reference.shape != img_gray.shape and self._complete:
+            # Same lot at another resolution
+            size = (img_gray.shape[1], img_gray.shape[0])
+            self.reference = cv2.resize(reference, size, interpolation=cv2.INTER_AREA)
+            self._average = self.reference.astype(np.float32)
+        elif reference is None or reference.shape != img_gray.shape:
+            self.reference = img_gray.copy()
+            self._average = self.reference.astype(np.float32)
+            self._known = set()
+            self._pending = {}
+            self._learning = [] if layout is not None else [self.reference]
+        elif self._learning:
+            self._learning.append(img_gray.copy())
+            if len(self._learning) >= self.learn_frames:
+                self.reference = np.median(np.stack(self._learning), axis=0).astype(np.uint8)
+                self._average = self.reference.astype(np.float32)
+                self._learning = []
+
+    def _learn_slots(self, img_gray, mask, layout, refresh):
+        rows, cols = img_gray.shape
+        x1, y1, x2, y2 = (c.tolist() for c in layout.corners(img_gray.shape))
+        for pos, left, top, right, bottom in zip(layout.positions, x1, y1, x2, y2):
+            if pos in self._known or left >= right or top >= bottom:
+                continue
+            slot_mask = self._pending.get(pos)
+            if slot_mask is None or slot_mask.shape != (bottom - top, right - left) or refresh:
+                # HALO rows/columns of context make the crop match the whole-frame chain
+                crop_top, crop_left = max(0, top - HALO), max(0, left - HALO)
+                crop = preprocess_serial(img_gray[crop_top:min(rows, bottom + HALO),
+                                                  crop_left:min(cols, right + HALO)])
+                slot_mask = crop[top - crop_top:bottom - crop_top, left - crop_left:right - crop_left]
+                if cv2.countNonZero(slot_mask) < layout.threshold:
+                    self.reference[top:bottom, left:right] = img_gray[top:bottom, left:right]
+                    self._average[top:bottom, left:right] = img_gray[top:bottom, left:right]
+                    self._known.add(pos)
+                    self._pending.pop(pos, None)
+                else:
+                    self._pending[pos] = slot_mask
+            # Occupied since the stream started: keep the adaptive decision
+            mask[top:bottom, left:right] = slot_mask
+
+    def _update(self, img_gray, mask, layout):
+        if layout is None:
+            if not self._learning:
+                cv2.accumulateWeighted(img_gray, self._average, self.alpha, mask=cv2.bitwise_not(mask))
+                self.reference = cv2.convertScaleAbs(self._average)
+            return
+        counts = layout.count(mask).tolist()
+        x1, y1, x2, y2 = (c.tolist() for c in layout.corners(img_gray.shape))
+        for pos, count, left, top, right, bottom in zip(layout.positions, counts, x1, y1, x2, y2):
+            if count >= layout.threshold or not (self._complete or pos in self._known):
+                continue
+            average = self._average[top:bottom, left:right]
+            average *= 1.0 - self.alpha
+            average += self.alpha * img_gray[top:bottom, left:right]
+            self.reference[top:bottom, left:right] = np.rint(average)
+
+
+DETECTORS = {
+    AdaptiveDetector.name: AdaptiveDetector,
+    IntegralDetector.name: IntegralDetector,
+    BackgroundDetector.name: BackgroundDetector
+}
+
+
+def get_detector(name=None):
+    """New detector by name (default: DETECTOR env var or 'adaptive')
+
+    Each stream or lot gets its own instance since the background detector
+    keeps per-stream state.
+    """
+    name = name or DEFAULT_DETECTOR
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector '{name}' (choose from {', '.join(DETECTORS)})")
+    return DETECTORS[name]()
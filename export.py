@@ -0,0 +1,285 @@
+"""
+Annotated video export
+The video is cut into frame ranges that worker processes render in parallel
+(detection, slot overlay and occupancy counter on every frame) to part files,
+which are then joined in order into one output file
+"""
+
+import math
+import multiprocessing as mp
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from detectors import DEFAULT_DETECTOR, DETECTORS, get_detector
+from lots import CompiledLayout
+from overlay import check_parking_space
+
+EXPORT_FOURCC = os.environ.get('EXPORT_FOURCC', 'mp4v')
+EXPORT_EXTENSION = os.environ.get('EXPORT_EXTENSION', '.mp4')
+
+# Frames rendered per segment, one slot per segment (set in each worker)
+_progress = None
+
+
+def _init_worker(progress):
+    global _progress
+    _progress = progress
+    # Segments already use every core; stop OpenCV adding its own threads
+    cv2.setNumThreads(1)
+
+
+def annotate(img, detector, layout):
+    """Detect on one frame and draw slots, counts and the free counter on it, as the live view does"""
+    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return check_parking_space(detector.mask(img_gray, layout), img, layout)[0]
+
+
+def open_at(source, start):
+    """Capture positioned exactly at frame start; returns (capture, how it got there)
+
+    A seek is trusted only if the backend reports the requested position;
+    otherwise the file is read forward from the beginning.
+    """
+    cap = cv2.VideoCapture(source)
+    if start == 0:
+        return cap, 'start'
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return cap, 'seek'
+    cap.release()
+    cap = cv2.VideoCapture(source)
+    for _ in range(start):
+        if not cap.grab():
+            break
+    return cap, 'grab'
+
+
+def render_segment(task):
+    """Render frames [start, end) of the source to task['part'] (end None reads to the end)
+
+    Returns the frame count, how the start was reached and a CRC of every
+    annotated frame before encoding, for comparison with a serial render.
+    """
+    layout = CompiledLayout(task['lot_id'], task['positions'], task['config'], version=0)
+    detector = get_detector(task['detector'])
+    cap, positioned = open_at(task['source'], task['start'])
+    writer = None
+    if task['part']:
+        writer = cv2.VideoWriter(task['part'], cv2.VideoWriter_fourcc(*task['fourcc']),
+                                 task['fps'], task['size'])
+    digests = []
+    try:
+        end = task['end']
+        while end is None or task['start'] + len(digests) < end:
+            success, img = cap.read()
+            if not success:
+                break
+            img = annotate(img, detector, layout)
+            digests.append(zlib.crc32(img))
+            if writer is not None:
+                writer.write(img)
+            if _progress is not None:
+                _progress[task['index']] = len(digests)
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.release()
+    return {'index': task['index'], 'frames': len(digests), 'positioned': positioned, 'digests': digests}
+
+
+class ExportJob:
+    """One export of a video with overlays, rendered in segments by worker processes
+
+    Stateful detectors (the background model depends on every earlier frame)
+    are rendered as a single segment so the output matches a serial render.
+    Parts are joined with ffmpeg's concat demuxer (no re-encode) when ffmpeg
+    is installed, otherwise re-encoded into the output with OpenCV. With
+    verify, the whole video is rendered again serially in this process and
+    every frame compared.
+    """
+
+    def __init__(self, source, output, positions, config, detector=None, lot_id='default',
+                 workers=None, segments=None, verify=False, fourcc=EXPORT_FOURCC):
+        self.id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.output = output
+        self.positions = [tuple(pos) for pos in positions]
+        self.config = dict(config)
+        self.detector = detector
+        self.lot_id = lot_id
+        self.workers = workers or os.cpu_count() or 1
+        self.segments = segments or self.workers
+        self.verify = verify
+        self.fourcc = fourcc
+        self.fps = None
+        self.state = 'queued'
+        self.error = None
+        self.total_frames = 0
+        self.frames = 0
+        self.concat = None
+        self.verified = None
+        self.mismatches = None
+        self.started = None
+        self.finished = None
+        self._progress = None
+        self._ranges = []
+        self._results = []
+        self._thread = None
+
+    @property
+    def done(self):
+        return self.state in ('done', 'failed')
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        self.started = time.time()
+        try:
+            self._render()
+            self._join_parts()
+            if self.verify:
+                self._verify()
+            self.state = 'done'
+        except Exception as e:
+            self.state = 'failed'
+            self.error = f'{type(e).__name__}: {e}'
+        finally:
+            self._remove_parts()
+            self.finished = time.time()
+
+    def _render(self):
+        probe = cv2.VideoCapture(self.source)
+        if not probe.isOpened():
+            probe.release()
+            raise ValueError(f'Cannot open {self.source}')
+        self.fps = probe.get(cv2.CAP_PROP_FPS) or 25.0
+        size = (int(probe.get(cv2.CAP_PROP_FRAME_WIDTH)), int(probe.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.total_frames = int(probe.get(cv2.CAP_PROP_FRAME_COUNT))
+        probe.release()
+
+        segments = self.segments
+        if DETECTORS[self.detector or DEFAULT_DETECTOR].stateful or self.total_frames <= 0:
+            segments = 1
+        segments = max(1, min(segments, self.total_frames or 1))
+        length = math.ceil((self.total_frames or 1) / segments)
+        # The last range is open-ended in case the container's frame count is short
+        self._ranges = [(i * length, None if i == segments - 1 else (i + 1) * length) for i in range(segments)]
+
+        base, extension = os.path.splitext(self.output)
+        tasks = [{
+            'index': i, 'source': self.source, 'part': f'{base}.part{i}{extension}',
+            'start': start, 'end': end, 'lot_id': self.lot_id, 'positions': self.positions,
+            'config': self.config, 'detector': self.detector, 'fourcc': self.fourcc,
+            'fps': self.fps, 'size': size
+        } for i, (start, end) in enumerate(self._ranges)]
+
+        self.state = 'rendering'
+        self._progress = mp.Array('q', segments, lock=False)
+        with ProcessPoolExecutor(max_workers=min(self.workers, segments), initializer=_init_worker,
+                                 initargs=(self._progress,)) as pool:
+            self._results = sorted(pool.map(render_segment, tasks), key=lambda r: r['index'])
+        self.frames = sum(r['frames'] for r in self._results)
+
+        # Each segment must have rendered its whole range, or frames would be missing
+        for result, (start, end) in zip(self._results, self._ranges):
+            if end is not None and result['frames'] != end - start:
+                raise RuntimeError(f"Segment {result['index']} rendered {result['frames']} "
+                                   f"of {end - start} frames from frame {start}")
+
+    def _parts(self):
+        base, extension = os.path.splitext(self.output)
+        return [f'{base}.part{i}{extension}' for i in range(len(self._ranges))]
+
+    def _join_parts(self):
+        self.state = 'joining'
+        parts = [part for part in self._parts() if os.path.exists(part)]
+        ffmpeg = shutil.which('ffmpeg')
+        if len(parts) == 1:
+            os.replace(parts[0], self.output)
+            self.concat = 'rename'
+        elif ffmpeg:
+            listing = f'{os.path.splitext(self.output)[0]}.parts.txt'
+            with open(listing, 'w') as f:
+                f.writelines(f"file '{os.path.abspath(part)}'\n" for part in parts)
+            try:
+                subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                '-i', listing, '-c', 'copy', self.output], check=True)
+            finally:
+                os.remove(listing)
+            self.concat = 'ffmpeg'
+        else:
+            writer = None
+            try:
+                for part in parts:
+                    cap = cv2.VideoCapture(part)
+                    while True:
+                        success, img = cap.read()
+                        if not success:
+                            break
+                        if writer is None:
+                            writer = cv2.VideoWriter(self.output, cv2.VideoWriter_fourcc(*self.fourcc),
+                                                     self.fps, (img.shape[1], img.shape[0]))
+                        writer.write(img)
+                    cap.release()
+            finally:
+                if writer is not None:
+                    writer.release()
+            self.concat = 'reencode'
+
+    def _verify(self):
+        """Render serially and compare every annotated frame with the segments' output"""
+        self.state = 'verifying'
+        serial = render_segment({
+            'index': 0, 'source': self.source, 'part': None, 'start': 0, 'end': None,
+            'lot_id': self.lot_id, 'positions': self.positions, 'config': self.config,
+            'detector': self.detector, 'fourcc': self.fourcc, 'fps': self.fps, 'size': None
+        })['digests']
+        parallel = [digest for result in self._results for digest in result['digests']]
+        self.mismatches = sum(a != b for a, b in zip(serial, parallel)) + abs(len(serial) - len(parallel))
+        self.verified = self.mismatches == 0
+        if not self.verified:
+            raise RuntimeError(f'{self.mismatches} frames differ from a serial render')
+
+    def _remove_parts(self):
+        for part in self._parts():
+            if os.path.exists(part):
+                os.remove(part)
+
+    def status(self):
+        progress = self._progress
+        rendered = sum(progress) if progress is not None else 0
+        elapsed = (self.finished or time.time()) - self.started if self.started else 0.0
+        return {
+            'id': self.id,
+            'state': self.state,
+            'error': self.error,
+            'total_frames': self.total_frames,
+            'rendered_frames': rendered,
+            'progress': round(min(1.0, rendered / self.total_frames), 4) if self.total_frames else 0.0,
+            'segments': [
+                {'start': start, 'end': end, 'rendered': progress[i] if progress is not None else 0,
+                 'positioned': self._results[i]['positioned'] if i < len(self._results) else None}
+                for i, (start, end) in enumerate(self._ranges)
+            ],
+            'workers': self.workers,
+            'concat': self.concat,
+            'verified': self.verified,
+            'mismatched_frames': self.mismatches,
+            'elapsed_s': round(elapsed, 3),
+            'fps': round(rendered / elapsed, 2) if elapsed else 0.0,
+            'output': os.path.basename(self.output) if self.state == 'done' else None
+        }
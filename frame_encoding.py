@@ -0,0 +1,97 @@
+"""
+Lazy, memoized frame encoding with resolution/quality profiles
+Frames are only encoded when a viewer asks, once per (sequence, profile, format)
+"""
+
+import threading
+
+import cv2
+
+# name -> (max width or None for native, quality)
+PROFILES = {
+    'thumbnail': (320, 60),
+    'preview': (640, 75),
+    'full': (None, 95)
+}
+
+FORMATS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 'image/jpeg'),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 'image/webp')
+}
+
+
+def encode_frame(img, profile='full', fmt='jpeg'):
+    """Resize and encode one frame according to a profile"""
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown profile: {profile}')
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format: {fmt}')
+    max_width, quality = PROFILES[profile]
+    ext, quality_flag, _ = FORMATS[fmt]
+
+    if max_width and img.shape[1] > max_width:
+        scale = max_width / img.shape[1]
+        img = cv2.resize(img, (max_width, round(img.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+
+    success, buffer = cv2.imencode(ext, img, [quality_flag, quality])
+    if not success:
+        raise ValueError(f'Encoding to {fmt} failed')
+    return buffer.tobytes()
+
+
+class FrameEncoder:
+    """Per-sequence encode cache shared by every viewer
+
+    Concurrent requests for the same variant wait for a single encode instead
+    of each doing their own. Only the newest few sequence numbers are kept.
+    """
+
+    def __init__(self, keep=2):
+        self.keep = keep
+        self._cache = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.encodes = 0
+        self.hits = 0
+
+    def get(self, seq, img, profile='full', fmt='jpeg'):
+        key = (seq, profile, fmt)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self.hits += 1
+                return data
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight[key] = threading.Event()
+
+        if not owner:
+            event.wait()
+            with self._lock:
+                data = self._cache.get(key)
+                if data is not None:
+                    self.hits += 1
+                    return data
+            # The owner failed or the entry was evicted; encode directly
+            return encode_frame(img, profile, fmt)
+
+        try:
+            data = encode_frame(img, profile, fmt)
+            with self._lock:
+                self.encodes += 1
+                self._cache[key] = data
+                self._evict(seq)
+            return data
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _evict(self, newest):
+        for key in [k for k in self._cache if k[0] <= newest - self.keep]:
+            del self._cache[key]
+
+    def stats(self):
+        with self._lock:
+            return {'encodes': self.encodes, 'hits': self.hits, 'cached': len(self._cache)}
@@ -0,0 +1,318 @@
+"""
+Occupancy history: in-memory ring buffer of packed slot states, per-minute and
+per-hour rollups, and an append-only on-disk log that is compacted once its
+oldest records fall out of retention
+"""
+
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+LOG_MAGIC = b'OCC1'
+LOG_HEADER = len(LOG_MAGIC) + 4
+REPLAY_CHUNK_BYTES = 16 << 20
+RESOLUTIONS = {'minute': 60, 'hour': 3600}
+
+
+class Rollup:
+    """Fixed-size table of time buckets addressed by bucket_id % retention"""
+
+    def __init__(self, seconds, retention, num_slots):
+        self.seconds = seconds
+        self.retention = retention
+        self.bucket_ids = np.full(retention, -1, np.int64)
+        self.frames = np.zeros(retention, np.int32)
+        self.occupied = np.zeros((retention, num_slots), np.int32)
+        self.min_occupied = np.zeros(retention, np.int32)
+        self.max_occupied = np.zeros(retention, np.int32)
+
+    def add(self, timestamp, states):
+        bucket = int(timestamp // self.seconds)
+        i = bucket % self.retention
+        total = int(states.sum())
+        if self.bucket_ids[i] != bucket:
+            self.bucket_ids[i] = bucket
+            self.frames[i] = 0
+            self.occupied[i] = 0
+            self.min_occupied[i] = total
+            self.max_occupied[i] = total
+        self.frames[i] += 1
+        self.occupied[i] += states
+        self.min_occupied[i] = min(self.min_occupied[i], total)
+        self.max_occupied[i] = max(self.max_occupied[i], total)
+
+    def load(self, timestamps, states, newest):
+        """Add a chunk of time-ordered records (used when replaying the log)
+
+        Chunks must arrive oldest first; records in buckets that the bucket
+        holding newest (the last timestamp of the log) would overwrite are skipped.
+        """
+        buckets = (timestamps // self.seconds).astype(np.int64)
+        first = np.searchsorted(buckets, int(newest // self.seconds) - self.retention, side='right')
+        buckets, states = buckets[first:], states[first:]
+        if not len(buckets):
+            return
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+        ids = buckets[starts]
+        rows = ids % self.retention
+        totals = states.sum(axis=1, dtype=np.int32)
+        frames = np.diff(np.append(starts, len(buckets)))
+        occupied = np.add.reduceat(states, starts, axis=0, dtype=np.int32)
+        low = np.minimum.reduceat(totals, starts)
+        high = np.maximum.reduceat(totals, starts)
+        # The first bucket may already hold records from the previous chunk
+        same = self.bucket_ids[rows] == ids
+        self.frames[rows] = np.where(same, self.frames[rows] + frames, frames)
+        self.occupied[rows] = np.where(same[:, None], self.occupied[rows] + occupied, occupied)
+        self.min_occupied[rows] = np.where(same, np.minimum(self.min_occupied[rows], low), low)
+        self.max_occupied[rows] = np.where(same, np.maximum(self.max_occupied[rows], high), high)
+        self.bucket_ids[rows] = ids
+
+    def query(self, start, end, slot=None):
+        b0, b1 = int(start // self.seconds), int(end // self.seconds)
+        rows = np.flatnonzero((self.bucket_ids >= b0) & (self.bucket_ids <= b1))
+        rows = rows[np.argsort(self.bucket_ids[rows])]
+        frames = self.frames[rows]
+        occupied = self.occupied[rows]
+        lot = occupied.sum(axis=1) / np.maximum(frames, 1) / max(occupied.shape[1], 1)
+        points = []
+        for k, row in enumerate(rows):
+            point = {
+                't': int(self.bucket_ids[row] * self.seconds),
+                'frames': int(frames[k]),
+                'occupancy': round(float(lot[k]), 4),
+                'min_occupied': int(self.min_occupied[row]),
+                'max_occupied': int(self.max_occupied[row])
+            }
+            if slot is not None:
+                point['slot_occupancy'] = round(float(occupied[k, slot] / max(frames[k], 1)), 4)
+            points.append(point)
+        return points
+
+
+class OccupancyHistory:
+    """History of one stream's slot states
+
+    record() is O(slots / 8) plus two rollup updates and never touches the
+    disk; log records are handed to a background writer thread.
+    """
+
+    def __init__(self, num_slots, capacity=36000, log_path=None,
+                 minute_retention=7 * 24 * 60, hour_retention=90 * 24):
+        self.num_slots = num_slots
+        self.capacity = capacity
+        self.log_path = log_path
+        self.record_size = 8 + (num_slots + 7) // 8
+        self.timestamps = np.zeros(capacity, np.float64)
+        self.bits = np.zeros((capacity, (num_slots + 7) // 8), np.uint8)
+        self.head = 0
+        self.size = 0
+        self.rollups = {
+            'minute': Rollup(RESOLUTIONS['minute'], minute_retention, num_slots),
+            'hour': Rollup(RESOLUTIONS['hour'], hour_retention, num_slots)
+        }
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._log_lock = threading.Lock()
+        self._stop = threading.Event()
+        if log_path:
+            self._replay()
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    def record(self, states, timestamp=None):
+        """Store one frame's per-slot occupied flags"""
+        timestamp = time.time() if timestamp is None else timestamp
+        states = np.asarray(states, dtype=np.uint8)
+        packed = np.packbits(states)
+        with self._lock:
+            self._append(timestamp, packed, states)
+        if self.log_path:
+            self._pending.append(struct.pack('<d', timestamp) + packed.tobytes())
+
+    def _append(self, timestamp, packed, states):
+        self.timestamps[self.head] = timestamp
+        self.bits[self.head] = packed
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        for rollup in self.rollups.values():
+            rollup.add(timestamp, states)
+
+    def query(self, start, end, slot=None, resolution='minute', limit=2000):
+        """Return points between start and end (unix seconds)
+
+        resolution is 'raw' (ring buffer, evenly downsampled to limit points)
+        or one of the rollup names.
+        """
+        if slot is not None and not 0 <= slot < self.num_slots:
+            raise ValueError('Invalid slot')
+        if resolution != 'raw':
+            if resolution not in self.rollups:
+                raise ValueError(f'Unknown resolution: {resolution}')
+            with self._lock:
+                return self.rollups[resolution].query(start, end, slot)
+
+        with self._lock:
+            order = (self.head - self.size + np.arange(self.size)) % self.capacity
+            timestamps = self.timestamps[order]
+            lo, hi = np.searchsorted(timestamps, [start, end], side='left')
+            rows = order[lo:hi]
+            if len(rows) > limit:
+                rows = rows[np.linspace(0, len(rows) - 1, limit).astype(np.int64)]
+            timestamps = self.timestamps[rows]
+            states = np.unpackbits(self.bits[rows], axis=1)[:, :self.num_slots]
+
+        if slot is not None:
+            return [{'t': float(t), 'occupied': bool(s)} for t, s in zip(timestamps, states[:, slot])]
+        totals = states.sum(axis=1)
+        return [{'t': float(t), 'occupied': int(n)} for t, n in zip(timestamps, totals)]
+
+    def _replay(self):
+        """Rebuild the ring buffer and rollups from an existing log
+
+        The log is read in chunks of about REPLAY_CHUNK_BYTES of unpacked
+        states, starting at the oldest record the ring buffer or a rollup
+        still covers; the log is compacted first when enough records before
+        that have fallen out of retention.
+        """
+        if not os.path.exists(self.log_path):
+            with open(self.log_path, 'wb') as f:
+                f.write(LOG_MAGIC + struct.pack('<I', self.num_slots))
+            return
+        self.compact()
+        with open(self.log_path, 'rb') as f:
+            count = self._record_count(f)
+            if not count:
+                return
+            newest = self._timestamp_at(f, count - 1)
+            start = self._live_start(f, count, newest)
+            ring_start = max(0, count - self.capacity)
+            step = max(1, REPLAY_CHUNK_BYTES // max(self.num_slots, self.record_size))
+            f.seek(LOG_HEADER + start * self.record_size)
+            for first in range(start, count, step):
+                n = min(step, count - first)
+                records = np.frombuffer(f.read(n * self.record_size), np.uint8).reshape(n, self.record_size)
+                timestamps = records[:, :8].copy().view('<f8').ravel()
+                bits = records[:, 8:]
+                tail = max(0, ring_start - first)
+                if tail < n:
+                    kept = n - tail
+                    self.timestamps[self.size:self.size + kept] = timestamps[tail:]
+                    self.bits[self.size:self.size + kept] = bits[tail:]
+                    self.size += kept
+                states = np.unpackbits(bits, axis=1)[:, :self.num_slots]
+                for rollup in self.rollups.values():
+                    rollup.load(timestamps, states, newest)
+        self.head = self.size % self.capacity
+
+    def _record_count(self, f):
+        """Whole records in the log (a torn last record is ignored)"""
+        return max(0, os.fstat(f.fileno()).st_size - LOG_HEADER) // self.record_size
+
+    def _timestamp_at(self, f, i):
+        f.seek(LOG_HEADER + i * self.record_size)
+        return struct.unpack('<d', f.read(8))[0]
+
+    def _live_start(self, f, count, newest):
+        """Index of the oldest record still covered by the ring buffer or a rollup"""
+        cutoff = min((int(newest // rollup.seconds) - rollup.retention + 1) * rollup.seconds
+                     for rollup in self.rollups.values())
+        lo, hi = 0, max(0, count - self.capacity)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp_at(f, mid) < cutoff:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def compact(self, min_fraction=0.25):
+        """Drop log records no rollup or ring buffer covers any more
+
+        Only rewrites the log once at least min_fraction of it has expired;
+        returns the number of records dropped.
+        """
+        with self._log_lock:
+            with open(self.log_path, 'rb') as f:
+                count = self._record_count(f)
+                if not count:
+                    return 0
+                start = self._live_start(f, count, self._timestamp_at(f, count - 1))
+                if not start or start < count * min_fraction:
+                    return 0
+                tmp = f'{self.log_path}.{os.getpid()}.tmp'
+                with open(tmp, 'wb') as out:
+                    f.seek(0)
+                    out.write(f.read(LOG_HEADER))
+                    f.seek(LOG_HEADER + start * self.record_size)
+                    remaining = (count - start) * self.record_size
+                    while remaining:
+                        chunk = f.read(min(remaining, REPLAY_CHUNK_BYTES))
+                        out.write(chunk)
+                        remaining -= len(chunk)
+            # Replaced atomically so a crash never leaves a half-written log
+            os.replace(tmp, self.log_path)
+            return start
+
+    def _write_loop(self, interval=1.0, compact_every=3600):
+        last_compact = time.monotonic()
+        while not self._stop.wait(interval):
+            self.flush()
+            if time.monotonic() - last_compact >= compact_every:
+                last_compact = time.monotonic()
+                self.compact()
+
+    def close(self):
+        """Stop the writer thread and write out what it had not written yet"""
+        if not self.log_path:
+            return
+        self._stop.set()
+        self._writer.join()
+        self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        chunks = []
+        while self._pending:
+            chunks.append(self._pending.popleft())
+        with self._log_lock, open(self.log_path, 'ab') as f:
+            f.write(b''.join(chunks))
+
+
+class HistoryStore:
+    """Per-stream histories; a stream's log is rotated when its slot count changes"""
+
+    def __init__(self, directory='history', **options):
+        self.directory = directory
+        self.options = options
+        self.streams = {}
+        self._lock = threading.Lock()
+
+    def record(self, stream_id, states, timestamp=None):
+        history = self.streams.get(stream_id)
+        if history is None or history.num_slots != len(states):
+            history = self._open(stream_id, len(states))
+        history.record(states, timestamp)
+
+    def get(self, stream_id):
+        return self.streams.get(stream_id)
+
+    def _open(self, stream_id, num_slots):
+        with self._lock:
+            old = self.streams.get(stream_id)
+            if old is not None and old.num_slots == num_slots:
+                return old
+            if old is not None:
+                old.close()
+            log_path = None
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                log_path = os.path.join(self.directory, f'{stream_id}-{num_slots}.occ')
+            history = OccupancyHistory(num_slots, log_path=log_path, **self.options)
+            self.streams[stream_id] = history
+            return history
@@ -1,84 +1,176 @@
 from flask import Flask, render_template, request, jsonify, send_file
-import cv2
-import pickle
-import cvzone
-import numpy as np
 import base64
+import hmac
 import io
 import os
 import json
+import struct
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from werkzeug.utils import secure_filename
+from admission import AdmissionController, Rejected
+from metrics import StageMetrics
+from profiling import SORT_KEYS, Profiler, capture_limits
 
 app = Flask(__name__)
 
-# Global variables
-posList = []
-width, height = 107, 48
+# OpenCV and NumPy are imported on first use so a serverless cold start only
+# pays for Flask (see load_heavy_modules)
+cv2 = None
+np = None
+slot_overlay = None
 
-# Load existing parking positions
-def load_parking_positions():
-    global posList
-    try:
-        with open('CarParkPos', 'rb') as f:
-            posList = pickle.load(f)
-    except:
-        posList = []
-
-def save_parking_positions():
-    with open('CarParkPos', 'wb') as f:
-        pickle.dump(posList, f)
-
-def check_parking_space(img_pro, img):
-    global posList
-    space_counter = 0
-    
-    for pos in posList:
-        x, y = pos
-        img_crop = img_pro[y:y + height, x:x + width]
-        count = cv2.countNonZero(img_crop)
-        
-        if count < 900:
-            color = (0, 255, 0)
-            thickness = 5
-            space_counter += 1
-        else:
-            color = (0, 0, 255)
-            thickness = 2
-        
-        cv2.rectangle(img, pos, (pos[0] + width, pos[1] + height), color, thickness)
-        cvzone.putTextRect(img, str(count), (x, y + height - 3), scale=1,
-                          thickness=2, offset=0, colorR=color)
-    
-    cvzone.putTextRect(img, f'Free: {space_counter}/{len(posList)}', (100, 50), scale=3,
-                      thickness=5, offset=20, colorR=(0, 200, 0))
+# Lot layouts, loaded lazily and kept under an LRU memory budget (see lots.py)
+lot_registry = None
+lot_cache_bytes = int(os.environ.get('LOT_CACHE_BYTES', 64 * 1024 * 1024))
+DEFAULT_LOT = 'default'
+
+# Warm caches that survive between invocations of the same instance
+batch_executor = None
+
+# Worker pool for batch requests (OpenCV releases the GIL while it works)
+batch_workers = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 4))
+max_batch_size = int(os.environ.get('MAX_BATCH_SIZE', 64))
+
+# At most ADMISSION_WORKERS frames run the pipeline at once and ADMISSION_QUEUE
+# wait (for up to ADMISSION_TIMEOUT seconds); the rest get 429 straight away
+admission_workers = int(os.environ.get('ADMISSION_WORKERS', os.cpu_count() or 4))
+admission = AdmissionController(
+    workers=admission_workers,
+    queue_size=int(os.environ.get('ADMISSION_QUEUE', 2 * admission_workers)),
+    queue_timeout=float(os.environ.get('ADMISSION_TIMEOUT', 2.0))
+)
+
+# Last good result per lot, offered to rejected clients that ask for it
+last_results = {}
+
+# Per-stage timings of frame processing (see /api/metrics); every Nth grayscale
+# decode is repeated in colour so the time it saved can be reported
+frame_metrics = StageMetrics()
+decode_sample_every = int(os.environ.get('DECODE_SAMPLE_EVERY', 50))
+decode_counter = itertools.count()
+
+# On-demand profiling of the next /api/process_frame requests (profiling.py);
+# admin routes require the X-Admin-Token header when ADMIN_TOKEN is set
+profiler = Profiler()
+admin_token = os.environ.get('ADMIN_TOKEN')
+
+# Context pixels around each slot crop in a mosaic (default: the pipeline's HALO)
+mosaic_margin = int(os.environ['MOSAIC_MARGIN']) if os.environ.get('MOSAIC_MARGIN') else None
+
+def load_heavy_modules():
+    """Import OpenCV, NumPy and the lot registry (with its detectors) once per process"""
+    global cv2, np, slot_overlay, lot_registry
+    if lot_registry is None:
+        import cv2 as opencv
+        import numpy
+        import overlay
+        from lots import LotRegistry
+        cv2, np, slot_overlay = opencv, numpy, overlay
+        lot_registry = LotRegistry(os.environ.get('LOTS_DIR', 'lots'), lot_cache_bytes)
+
+def get_batch_executor():
+    global batch_executor
+    if batch_executor is None:
+        batch_executor = ThreadPoolExecutor(max_workers=batch_workers)
+    return batch_executor
+
+def get_layout(lot_id=DEFAULT_LOT):
+    """Compiled layout of a lot; reloaded only when its files change on disk"""
+    load_heavy_modules()
+    return lot_registry.get(lot_id)
+
+def warm_up():
+    """Import heavy modules, load the layout and run one dummy frame through the pipeline"""
+    start = time.perf_counter()
+    layout = get_layout()
+    img = np.zeros((layout.height * 2, layout.width * 2, 3), np.uint8)
+    _, buffer = cv2.imencode('.jpg', img)
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    slot_overlay.check_parking_space(layout.detector.mask(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), layout), img, layout)
+    return time.perf_counter() - start
+
+def decode_frame(img_bytes, overlay=True):
+    """Decode only what the request needs: (colour frame or None, grayscale frame)
+
+    Counts-only requests decode straight to grayscale and skip the colour
+    decode and conversion.
+    """
+    nparr = np.frombuffer(img_bytes, np.uint8)
+    if overlay:
+        with frame_metrics.stage('decode_color'):
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if img is None:
+                return None, None
+            img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return img, img_gray
     
-    return img, space_counter, len(posList)
+    with frame_metrics.stage('decode_gray'):
+        img_gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+    if img_gray is not None and decode_sample_every and next(decode_counter) % decode_sample_every == 0:
+        # Reference cost of the colour decode this request avoided
+        with frame_metrics.stage('decode_color'):
+            cv2.cvtColor(cv2.imdecode(nparr, cv2.IMREAD_COLOR), cv2.COLOR_BGR2GRAY)
+    return None, img_gray
 
-def process_frame(frame_data):
+def decode_savings(stages):
+    """Decode time saved per grayscale mode, against the mean colour decode + conversion"""
+    reference = stages.get('decode_color')
+    if reference is None:
+        return {}
+    savings = {}
+    for name, stats in stages.items():
+        if name.startswith('decode_gray'):
+            per_frame = reference['mean_wall_ms'] - stats['mean_wall_ms']
+            savings[name] = {
+                'frames': stats['count'],
+                'saved_ms_per_frame': round(per_frame, 3),
+                'saved_ms_total': round(per_frame * stats['count'], 3)
+            }
+    return savings
+
+def process_frame(frame_data, layout=None, overlay=True):
     """Process a single frame for parking detection"""
     try:
         # Decode base64 image
         img_bytes = base64.b64decode(frame_data)
-        nparr = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        return process_frame_bytes(img_bytes, overlay, layout)
+    except Exception as e:
+        print(f"Error processing frame: {e}")
+        return None
+
+def process_frame_bytes(img_bytes, overlay=True, layout=None):
+    """Run detection on one encoded frame; skip drawing and encoding when overlay is off"""
+    try:
+        load_heavy_modules()
+        layout = layout or get_layout()
+        img, img_gray = decode_frame(img_bytes, overlay)
         
-        if img is None:
+        if img_gray is None:
             return None
         
         # Process the image
-        img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        img_blur = cv2.GaussianBlur(img_gray, (3, 3), 1)
-        img_threshold = cv2.adaptiveThreshold(img_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                           cv2.THRESH_BINARY_INV, 25, 16)
-        img_median = cv2.medianBlur(img_threshold, 5)
-        kernel = np.ones((3, 3), np.uint8)
-        img_dilate = cv2.dilate(img_median, kernel, iterations=1)
+        with frame_metrics.stage('detect'):
+            img_dilate = layout.detector.mask(img_gray, layout)
+        
+        if not overlay:
+            with frame_metrics.stage('count'):
+                free_spaces = int((~layout.occupied(layout.count(img_dilate))).sum())
+            return {
+                'free_spaces': free_spaces,
+                'total_spaces': len(layout),
+                'occupied_spaces': len(layout) - free_spaces
+            }
         
-        processed_img, free_spaces, total_spaces = check_parking_space(img_dilate, img.copy())
+        with frame_metrics.stage('overlay'):
+            processed_img, free_spaces, total_spaces, _ = slot_overlay.check_parking_space(img_dilate, img.copy(), layout)
         
         # Convert back to base64
-        _, buffer = cv2.imencode('.jpg', processed_img)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
+        with frame_metrics.stage('encode'):
+            _, buffer = cv2.imencode('.jpg', processed_img)
+            img_base64 = base64.b64encode(buffer).decode('utf-8')
         
         return {
             'image': img_base64,
@@ -90,20 +182,103 @@ def process_frame(frame_data):
         print(f"Error processing frame: {e}")
         return None
 
+def process_mosaic_bytes(img_bytes, mosaic):
+    """Counts for an encoded mosaic of slot crops packed as mosaic describes; raises ValueError"""
+    load_heavy_modules()
+    with frame_metrics.stage('decode_mosaic'):
+        img_gray = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img_gray is None:
+        raise ValueError('Cannot decode mosaic')
+    if img_gray.shape != (mosaic.height, mosaic.width):
+        raise ValueError(f'Mosaic must be {mosaic.width}x{mosaic.height}, got {img_gray.shape[1]}x{img_gray.shape[0]}')
+    
+    layout = mosaic.layout
+    with frame_metrics.stage('detect'):
+        img_dilate = layout.detector.mask(img_gray, layout)
+    with frame_metrics.stage('count'):
+        counts = layout.count(img_dilate)
+        occupied = layout.occupied(counts)
+    free_spaces = int((~occupied).sum())
+    return {
+        'free_spaces': free_spaces,
+        'total_spaces': len(layout),
+        'occupied_spaces': len(layout) - free_spaces,
+        'counts': counts.tolist(),
+        'occupied': occupied.tolist(),
+        'version': mosaic.version
+    }
+
+def split_frame_batch(body):
+    """Split a binary batch: each frame is prefixed with its 4-byte big-endian length"""
+    frames = []
+    offset = 0
+    while offset < len(body):
+        if offset + 4 > len(body):
+            raise ValueError('Truncated frame length')
+        (size,) = struct.unpack_from('>I', body, offset)
+        offset += 4
+        if offset + size > len(body):
+            raise ValueError('Truncated frame data')
+        frames.append(body[offset:offset + size])
+        offset += size
+    return frames
+
+def read_frame_batch():
+    """Collect encoded frames from a multipart, binary or JSON batch request"""
+    if request.files:
+        return [f.read() for f in request.files.getlist('frames')]
+    if request.mimetype == 'application/octet-stream':
+        return split_frame_batch(request.get_data())
+    data = request.get_json(silent=True) or {}
+    return [base64.b64decode(frame) for frame in data.get('frames', [])]
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def lot_or_404(lot_id, create=False):
+    """Resolve a lot id to its layout, or an error response"""
+    load_heavy_modules()
+    try:
+        # Checked before loading so unknown lot names never enter the layout cache
+        if not create and not lot_registry.exists(lot_id):
+            return None, (jsonify({'error': 'Unknown lot'}), 404)
+        layout = get_layout(lot_id)
+    except ValueError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    return layout, None
+
+@app.route('/api/lots', methods=['GET'])
+def list_lots():
+    load_heavy_modules()
+    return jsonify({'lots': lot_registry.list_lots(), 'cache': lot_registry.stats()})
+
+@app.route('/api/lots/<lot_id>', methods=['PUT'])
+def configure_lot(lot_id):
+    """Create a lot or update its slot size, threshold and detector backend"""
+    load_heavy_modules()
+    try:
+        lot_registry.save_config(lot_id, request.get_json() or {})
+        layout = lot_registry.get(lot_id)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'lot': lot_id, 'config': layout.config, 'total_spaces': len(layout)})
+
 @app.route('/api/parking_spaces', methods=['GET'])
-def get_parking_spaces():
-    load_parking_positions()
+@app.route('/api/lots/<lot_id>/parking_spaces', methods=['GET'])
+def get_parking_spaces(lot_id=DEFAULT_LOT):
+    layout, error = lot_or_404(lot_id)
+    if error:
+        return error
     return jsonify({
-        'total_spaces': len(posList),
-        'positions': posList
+        'total_spaces': len(layout),
+        'positions': layout.positions,
+        'config': layout.config
     })
 
 @app.route('/api/parking_spaces', methods=['POST'])
-def add_parking_space():
+@app.route('/api/lots/<lot_id>/parking_spaces', methods=['POST'])
+def add_parking_space(lot_id=DEFAULT_LOT):
     data = request.get_json()
     x = data.get('x')
     y = data.get('y')
@@ -111,33 +286,53 @@ def add_parking_space():
     if x is None or y is None:
         return jsonify({'error': 'Missing coordinates'}), 400
     
-    load_parking_positions()
-    posList.append((x, y))
-    save_parking_positions()
+    layout, error = lot_or_404(lot_id, create=True)
+    if error:
+        return error
+    positions = layout.positions + [(x, y)]
+    lot_registry.save_positions(lot_id, positions)
     
     return jsonify({
         'message': 'Parking space added',
-        'total_spaces': len(posList)
+        'total_spaces': len(positions)
     })
 
 @app.route('/api/parking_spaces/<int:index>', methods=['DELETE'])
-def remove_parking_space(index):
-    global posList
+@app.route('/api/lots/<lot_id>/parking_spaces/<int:index>', methods=['DELETE'])
+def remove_parking_space(index, lot_id=DEFAULT_LOT):
+    layout, error = lot_or_404(lot_id)
+    if error:
+        return error
     
-    load_parking_positions()
-    if 0 <= index < len(posList):
-        posList.pop(index)
-        save_parking_positions()
+    if 0 <= index < len(layout):
+        positions = layout.positions[:index] + layout.positions[index + 1:]
+        lot_registry.save_positions(lot_id, positions)
         return jsonify({
             'message': 'Parking space removed',
-            'total_spaces': len(posList)
+            'total_spaces': len(positions)
         })
     
     return jsonify({'error': 'Invalid index'}), 400
 
 @app.route('/api/process_frame', methods=['POST'])
-def process_frame_endpoint():
-    """Process a single frame for parking detection"""
+@app.route('/api/lots/<lot_id>/process_frame', methods=['POST'])
+def process_frame_endpoint(lot_id=DEFAULT_LOT):
+    """Process a single frame for parking detection
+
+    Under overload the request is rejected with 429 and Retry-After before its
+    body is parsed; with ?stale=1 the response also carries the lot's last
+    result and its age.
+    """
+    try:
+        with admission.slot():
+            capture = profiler.active
+            if capture is None:
+                return handle_process_frame(lot_id)
+            return capture.run(handle_process_frame, lot_id)
+    except Rejected as e:
+        return busy_response(lot_id, e)
+
+def handle_process_frame(lot_id):
     try:
         data = request.get_json()
         frame_data = data.get('frame')
@@ -145,9 +340,14 @@ def process_frame_endpoint():
         if not frame_data:
             return jsonify({'error': 'No frame data provided'}), 400
         
-        result = process_frame(frame_data)
+        layout, error = lot_or_404(lot_id)
+        if error:
+            return error
+        overlay = request.args.get('overlay', '1').lower() not in ('0', 'false', 'no')
+        result = process_frame(frame_data, layout, overlay)
         
         if result:
+            last_results[lot_id] = (time.time(), result)
             return jsonify(result)
         else:
             return jsonify({'error': 'Failed to process frame'}), 500
@@ -155,6 +355,214 @@ def process_frame_endpoint():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def busy_response(lot_id, rejection):
+    body = {'error': f'Server busy: {rejection.reason}', 'retry_after': rejection.retry_after}
+    cached = last_results.get(lot_id) if request.args.get('stale') == '1' else None
+    if cached:
+        body['stale_result'] = cached[1]
+        body['stale_age_s'] = round(time.time() - cached[0], 3)
+    response = jsonify(body)
+    response.status_code = 429
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    return response
+
+@app.route('/api/layout', methods=['GET'])
+@app.route('/api/lots/<lot_id>/layout', methods=['GET'])
+def get_compiled_layout(lot_id=DEFAULT_LOT):
+    """Compiled slot layout, its version and how to pack slot crops into a mosaic"""
+    layout, error = lot_or_404(lot_id)
+    if error:
+        return error
+    response = jsonify({
+        'lot_id': lot_id,
+        'version': layout.version,
+        'slot_width': layout.width,
+        'slot_height': layout.height,
+        'threshold': layout.threshold,
+        'positions': layout.positions,
+        'mosaic': layout.mosaic(mosaic_margin).describe()
+    })
+    # The version changes whenever the layout does, so clients can revalidate cheaply
+    response.set_etag(str(layout.version))
+    return response.make_conditional(request)
+
+@app.route('/api/process_mosaic', methods=['POST'])
+@app.route('/api/lots/<lot_id>/process_mosaic', methods=['POST'])
+def process_mosaic_endpoint(lot_id=DEFAULT_LOT):
+    """Process a mosaic of slot crops packed as /api/layout describes
+
+    The body is the encoded mosaic with ?version=, or JSON {"mosaic": base64,
+    "version": n}. A version other than the layout's current one gets 409 and
+    the current version, so the client can fetch the layout and repack.
+    """
+    try:
+        with admission.slot():
+            return handle_process_mosaic(lot_id)
+    except Rejected as e:
+        return busy_response(lot_id, e)
+
+def handle_process_mosaic(lot_id):
+    if request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream':
+        img_bytes, version = request.get_data(), request.args.get('version')
+    else:
+        data = request.get_json(silent=True) or {}
+        try:
+            img_bytes = base64.b64decode(data.get('mosaic') or '')
+        except ValueError:
+            return jsonify({'error': 'Invalid mosaic data'}), 400
+        version = data.get('version')
+    
+    if not img_bytes:
+        return jsonify({'error': 'No mosaic data provided'}), 400
+    
+    layout, error = lot_or_404(lot_id)
+    if error:
+        return error
+    try:
+        version = int(version)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Missing or invalid layout version'}), 400
+    if version != layout.version:
+        return jsonify({'error': 'Stale layout version', 'version': layout.version}), 409
+    
+    try:
+        result = process_mosaic_bytes(img_bytes, layout.mosaic(mosaic_margin))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    last_results[lot_id] = (time.time(), result)
+    return jsonify(result)
+
+@app.route('/api/admission', methods=['GET'])
+def admission_stats():
+    """Worker slots, queue depth and rejection counts of /api/process_frame"""
+    return jsonify(admission.stats())
+
+@app.route('/api/process_frames', methods=['POST'])
+@app.route('/api/lots/<lot_id>/process_frames', methods=['POST'])
+def process_frames_endpoint(lot_id=DEFAULT_LOT):
+    """Process a batch of frames in parallel, results are returned in request order
+
+    A batch runs up to one frame per admission slot at once and takes that
+    many slots (at most all of them), so it counts against the limit like the
+    same number of single frames and is rejected with 429 when the free slots
+    and the queue cannot hold it.
+    """
+    try:
+        frames = read_frame_batch()
+    except Exception as e:
+        return jsonify({'error': f'Invalid frame batch: {e}'}), 400
+    
+    if not frames:
+        return jsonify({'error': 'No frame data provided'}), 400
+    
+    if len(frames) > max_batch_size:
+        return jsonify({'error': f'Batch too large (max {max_batch_size} frames)'}), 413
+    
+    weight = min(len(frames), admission.workers)
+    try:
+        with admission.slot(weight):
+            return handle_process_frames(lot_id, frames, weight)
+    except Rejected as e:
+        return busy_response(lot_id, e)
+
+def handle_process_frames(lot_id, frames, parallel):
+    overlay = request.args.get('overlay', '1').lower() not in ('0', 'false', 'no')
+    layout, error = lot_or_404(lot_id)
+    if error:
+        return error
+    
+    # One task per admitted slot, each working through a contiguous run of frames
+    bounds = [len(frames) * i // parallel for i in range(parallel + 1)]
+    chunks = [frames[bounds[i]:bounds[i + 1]] for i in range(parallel)]
+    start = time.perf_counter()
+    runs = get_batch_executor().map(lambda chunk: [process_frame_bytes(frame, overlay, layout) for frame in chunk],
+                                    chunks)
+    results = [result for run in runs for result in run]
+    elapsed = time.perf_counter() - start
+    
+    return jsonify({
+        'results': [r if r else {'error': 'Failed to process frame'} for r in results],
+        'frames': len(frames),
+        'failed': sum(1 for r in results if not r),
+        'elapsed_ms': round(elapsed * 1000, 2)
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Per-stage frame processing times and the decode time saved by grayscale decoding"""
+    stages = frame_metrics.summary()
+    return jsonify({'stages': stages, 'decode_saved': decode_savings(stages)})
+
+def admin_denied():
+    if admin_token and not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return jsonify({'error': 'Admin token required'}), 403
+    return None
+
+@app.route('/api/admin/profile', methods=['POST'])
+def start_profile():
+    """Profile the next /api/process_frame requests: JSON {"requests": 100, "timeout": 60}"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        count, timeout = capture_limits(data.get('requests'), data.get('timeout'), 'requests')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        capture = profiler.start('process_frame', count, timeout, hooks=[(frame_metrics, 'tee')])
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'message': 'Profiling started', 'capture_id': capture.id}), 202
+
+@app.route('/api/admin/profile/<capture_id>', methods=['GET'])
+def get_profile(capture_id):
+    """Progress and per-stage wall/CPU time of a capture"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    capture = profiler.get(capture_id)
+    if capture is None:
+        return jsonify({'error': 'Unknown capture'}), 404
+    return jsonify(capture.status())
+
+@app.route('/api/admin/profile/<capture_id>/report', methods=['GET'])
+def download_profile(capture_id):
+    """Finished capture as a text report (sort, limit) or format=pstats for snakeviz"""
+    denied = admin_denied()
+    if denied:
+        return denied
+    capture = profiler.get(capture_id)
+    if capture is None:
+        return jsonify({'error': 'Unknown capture'}), 404
+    if capture.state == 'capturing':
+        return jsonify({'error': 'Capture is still running'}), 409
+    
+    if request.args.get('format') == 'pstats':
+        data = capture.pstats_bytes()
+        if data is None:
+            return jsonify({'error': 'No requests were captured'}), 404
+        return send_file(io.BytesIO(data), mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f'profile-{capture.id}.prof')
+    
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        return jsonify({'error': f"sort must be one of {', '.join(SORT_KEYS)}"}), 400
+    limit = request.args.get('limit', 50, type=int)
+    return send_file(io.BytesIO(capture.report(sort, limit).encode('utf-8')), mimetype='text/plain',
+                     as_attachment=True, download_name=f'profile-{capture.id}.txt')
+
+@app.route('/api/warmup', methods=['GET', 'POST'])
+def warmup_endpoint():
+    """Pre-load heavy modules and caches so the next real request is fast"""
+    elapsed = warm_up()
+    return jsonify({'message': 'Warm', 'elapsed_ms': round(elapsed * 1000, 2)})
+
+# Optionally pay the warm-up cost at import time instead of on the first request
+if os.environ.get('WARMUP_ON_IMPORT') == '1':
+    threading.Thread(target=warm_up, daemon=True).start()
+
 if __name__ == '__main__':
-    load_parking_positions()
     app.run(debug=True)
@@ -0,0 +1,265 @@
+"""
+Multi-lot registry
+Each lot has its own layout file and slot geometry/thresholds; compiled layouts
+are loaded lazily and kept under an LRU memory budget
+"""
+
+import json
+import math
+import os
+import pickle
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from detectors import DETECTORS, get_detector
+from pipeline import HALO
+
+DEFAULT_LOT = 'default'
+# detector None means the process default (DETECTOR env var)
+DEFAULT_CONFIG = {'slot_width': 107, 'slot_height': 48, 'threshold': 900, 'detector': None}
+
+lot_id_pattern = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class CompiledLayout:
+    """One lot's slots as NumPy arrays, with per-frame-shape geometry cached"""
+
+    def __init__(self, lot_id, positions, config, version):
+        self.lot_id = lot_id
+        self.positions = [tuple(pos) for pos in positions]
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.width = int(self.config['slot_width'])
+        self.height = int(self.config['slot_height'])
+        self.threshold = int(self.config['threshold'])
+        self._detector = None
+        self.version = version
+        self.origins = np.array(self.positions, np.int64).reshape(-1, 2)
+        self._corners = {}  # frame shape -> clipped (x1, y1, x2, y2) arrays
+        self._mosaics = {}  # margin -> MosaicLayout
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def nbytes(self):
+        return (self.origins.nbytes + sum(c.nbytes for c in self._corners.values()) + 64 * len(self.positions)
+                + getattr(self._detector, 'nbytes', 0)
+                + sum(m.nbytes for m in self._mosaics.values()))
+
+    @property
+    def detector(self):
+        """This lot's own detector instance, created on first use"""
+        if self._detector is None:
+            self._detector = get_detector(self.config['detector'])
+        return self._detector
+
+    def mosaic(self, margin=None):
+        """Packing of this layout's slot crops into one image (see MosaicLayout)"""
+        margin = HALO if margin is None else margin
+        mosaic = self._mosaics.get(margin)
+        if mosaic is None:
+            mosaic = self._mosaics[margin] = MosaicLayout(self, margin)
+        return mosaic
+
+    def corners(self, shape):
+        """Slot rectangles clipped to a frame of the given shape"""
+        corners = self._corners.get(shape[:2])
+        if corners is None:
+            rows, cols = shape[:2]
+            x1 = np.clip(self.origins[:, 0], 0, cols)
+            y1 = np.clip(self.origins[:, 1], 0, rows)
+            x2 = np.clip(self.origins[:, 0] + self.width, 0, cols)
+            y2 = np.clip(self.origins[:, 1] + self.height, 0, rows)
+            corners = self._corners[shape[:2]] = np.stack([x1, y1, x2, y2])
+        return corners
+
+    def count(self, img_pro):
+        """Non-zero pixels per slot from one integral image of a 0/255 mask"""
+        if not self.positions:
+            return np.zeros(0, np.int64)
+        x1, y1, x2, y2 = self.corners(img_pro.shape)
+        # 32-bit sums overflow past about 8.4 MP of 255s (4096x2160, say)
+        depth = cv2.CV_32S if img_pro.size * 255 < 2 ** 31 else cv2.CV_64F
+        ii = cv2.integral(img_pro, sdepth=depth)
+        sums = ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]
+        return sums.astype(np.int64) // 255
+
+    def occupied(self, counts):
+        return counts >= self.threshold
+
+
+class MosaicLayout:
+    """A layout's slot crops, each with margin pixels of context, packed into one image
+
+    Every tile is the frame rectangle starting at sources[i], tile_width x
+    tile_height, drawn at targets[i] in the mosaic (parts outside the frame
+    left black). Tiles fill a near-square grid in slot order, and layout is
+    the CompiledLayout of the mosaic itself. With the default margin of HALO
+    pixels the adaptive chain gives each slot the same mask as on the whole
+    frame.
+    """
+
+    def __init__(self, layout, margin):
+        self.margin = margin
+        self.version = layout.version
+        self.tile_width = layout.width + 2 * margin
+        self.tile_height = layout.height + 2 * margin
+        count = len(layout)
+        self.columns = max(1, math.ceil(math.sqrt(count * self.tile_height / self.tile_width)))
+        rows = math.ceil(count / self.columns)
+        self.width = self.columns * self.tile_width
+        self.height = rows * self.tile_height
+        index = np.arange(count)
+        self.sources = layout.origins - margin
+        self.targets = np.stack([index % self.columns * self.tile_width,
+                                 index // self.columns * self.tile_height], axis=1)
+        self.layout = CompiledLayout(layout.lot_id, (self.targets + margin).tolist(), layout.config, layout.version)
+
+    @property
+    def nbytes(self):
+        return self.sources.nbytes + self.targets.nbytes + self.layout.nbytes
+
+    def describe(self):
+        """JSON form for clients: tiles are [source x, source y, target x, target y]"""
+        return {
+            'margin': self.margin,
+            'tile_width': self.tile_width,
+            'tile_height': self.tile_height,
+            'columns': self.columns,
+            'width': self.width,
+            'height': self.height,
+            'tiles': np.hstack([self.sources, self.targets]).tolist()
+        }
+
+
+class LotRegistry:
+    """Lots stored as <root>/<lot_id>/CarParkPos and lot.json
+
+    The default lot keeps using the top-level CarParkPos so existing layouts
+    and routes are unaffected.
+    """
+
+    def __init__(self, root='lots', budget_bytes=64 * 1024 * 1024, default_positions='CarParkPos'):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.default_positions = default_positions
+        self._cache = OrderedDict()  # lot_id -> (file key, CompiledLayout)
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def _paths(self, lot_id):
+        if lot_id == DEFAULT_LOT:
+            return self.default_positions, os.path.join(self.root, DEFAULT_LOT, 'lot.json')
+        if not lot_id_pattern.match(lot_id):
+            raise ValueError('Invalid lot id')
+        lot_dir = os.path.join(self.root, lot_id)
+        return os.path.join(lot_dir, 'CarParkPos'), os.path.join(lot_dir, 'lot.json')
+
+    def exists(self, lot_id):
+        positions_path, config_path = self._paths(lot_id)
+        return lot_id == DEFAULT_LOT or os.path.exists(positions_path) or os.path.exists(config_path)
+
+    def list_lots(self):
+        lots = {DEFAULT_LOT}
+        if os.path.isdir(self.root):
+            lots.update(name for name in os.listdir(self.root)
+                        if lot_id_pattern.match(name) and os.path.isdir(os.path.join(self.root, name)))
+        return sorted(lots)
+
+    def get(self, lot_id):
+        """Compiled layout for a lot, reloaded if its files changed on disk"""
+        positions_path, config_path = self._paths(lot_id)
+        key = (_file_key(positions_path), _file_key(config_path))
+        with self._lock:
+            entry = self._cache.get(lot_id)
+            if entry is not None and entry[0] == key:
+                self._cache.move_to_end(lot_id)
+                return entry[1]
+
+        positions, config = _read_positions(positions_path), _read_config(config_path)
+        layout = CompiledLayout(lot_id, positions, config, version=_layout_version(positions, config))
+        with self._lock:
+            self.loads += 1
+            self._cache[lot_id] = (key, layout)
+            self._cache.move_to_end(lot_id)
+            self._evict()
+        return layout
+
+    def save_positions(self, lot_id, positions):
+        positions_path, _ = self._paths(lot_id)
+        os.makedirs(os.path.dirname(positions_path) or '.', exist_ok=True)
+        with open(positions_path, 'wb') as f:
+            pickle.dump([tuple(pos) for pos in positions], f)
+        self.invalidate(lot_id)
+
+    def save_config(self, lot_id, config):
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown lot settings: {', '.join(sorted(unknown))}")
+        _, config_path = self._paths(lot_id)
+        if config.get('detector') is not None and config['detector'] not in DETECTORS:
+            raise ValueError(f"Unknown detector '{config['detector']}' (choose from {', '.join(DETECTORS)})")
+        merged = dict(_read_config(config_path),
+                      **{k: v if k == 'detector' else int(v) for k, v in config.items()})
+        # Only once the settings are valid, so a rejected update leaves no empty lot behind
+        os.makedirs(os.path.dirname(config_path), exist_ok=True)
+        with open(config_path, 'w') as f:
+            json.dump(merged, f)
+        self.invalidate(lot_id)
+
+    def invalidate(self, lot_id):
+        with self._lock:
+            self._cache.pop(lot_id, None)
+
+    def _evict(self):
+        total = sum(layout.nbytes for _, layout in self._cache.values())
+        while total > self.budget_bytes and len(self._cache) > 1:
+            _, (_, layout) = self._cache.popitem(last=False)
+            total -= layout.nbytes
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'loaded_lots': len(self._cache),
+                'loaded_bytes': sum(layout.nbytes for _, layout in self._cache.values()),
+                'budget_bytes': self.budget_bytes,
+                'loads': self.loads,
+                'evictions': self.evictions
+            }
+
+
+def _file_key(path):
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def _layout_version(positions, config):
+    """Digest of a lot's slots and settings, the same in every process and instance"""
+    data = json.dumps([[[int(v) for v in pos] for pos in positions], config], sort_keys=True)
+    return zlib.crc32(data.encode())
+
+
+def _read_positions(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return []
+
+
+def _read_config(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
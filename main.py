@@ -1,10 +1,15 @@
+import argparse
+import json
+import sys
+import time
+
 import cv2
 import pickle
 import cvzone
-import numpy as np
 
-# Video feed
-cap = cv2.VideoCapture('carPark.mp4')
+from metrics import StageMetrics
+from detectors import DETECTORS, get_detector
+from lots import CompiledLayout
 
 with open('CarParkPos', 'rb') as f:
     posList = pickle.load(f)
@@ -12,7 +17,7 @@ with open('CarParkPos', 'rb') as f:
 width, height = 107, 48
 
 
-def checkParkingSpace(imgPro):
+def checkParkingSpace(imgPro, img=None):
     spaceCounter = 0
 
     for pos in posList:
@@ -31,27 +36,110 @@ def checkParkingSpace(imgPro):
             color = (0, 0, 255)
             thickness = 2
 
-        cv2.rectangle(img, pos, (pos[0] + width, pos[1] + height), color, thickness)
-        cvzone.putTextRect(img, str(count), (x, y + height - 3), scale=1,
-                           thickness=2, offset=0, colorR=color)
-
-    cvzone.putTextRect(img, f'Free: {spaceCounter}/{len(posList)}', (100, 50), scale=3,
-                           thickness=5, offset=20, colorR=(0,200,0))
-while True:
-
-    if cap.get(cv2.CAP_PROP_POS_FRAMES) == cap.get(cv2.CAP_PROP_FRAME_COUNT):
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-    success, img = cap.read()
-    imgGray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    imgBlur = cv2.GaussianBlur(imgGray, (3, 3), 1)
-    imgThreshold = cv2.adaptiveThreshold(imgBlur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                         cv2.THRESH_BINARY_INV, 25, 16)
-    imgMedian = cv2.medianBlur(imgThreshold, 5)
-    kernel = np.ones((3, 3), np.uint8)
-    imgDilate = cv2.dilate(imgMedian, kernel, iterations=1)
-
-    checkParkingSpace(imgDilate)
-    cv2.imshow("Image", img)
-    # cv2.imshow("ImageBlur", imgBlur)
-    # cv2.imshow("ImageThres", imgMedian)
-    cv2.waitKey(10)
\ No newline at end of file
+        if img is not None:
+            cv2.rectangle(img, pos, (pos[0] + width, pos[1] + height), color, thickness)
+            cvzone.putTextRect(img, str(count), (x, y + height - 3), scale=1,
+                               thickness=2, offset=0, colorR=color)
+
+    if img is not None:
+        cvzone.putTextRect(img, f'Free: {spaceCounter}/{len(posList)}', (100, 50), scale=3,
+                               thickness=5, offset=20, colorR=(0,200,0))
+    return spaceCounter
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Car parking space detection')
+    parser.add_argument('--video', default='carPark.mp4', help='Video file or camera index')
+    parser.add_argument('--headless', action='store_true',
+                        help='Run without a display window (no imshow/waitKey)')
+    parser.add_argument('--max-fps', type=float, default=0,
+                        help='Cap the processing rate (0 = as fast as possible)')
+    parser.add_argument('--max-frames', type=int, default=0,
+                        help='Stop after this many frames (0 = run until interrupted)')
+    parser.add_argument('--summary-every', type=float, default=0,
+                        help='Write an occupancy summary every N seconds (0 = off)')
+    parser.add_argument('--summary-file', default='-',
+                        help="Where summaries go ('-' for stdout)")
+    parser.add_argument('--detector', default=None, choices=sorted(DETECTORS),
+                        help='Detector backend (default: DETECTOR env var or adaptive)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    source = int(args.video) if args.video.isdigit() else args.video
+    cap = cv2.VideoCapture(source)
+    metrics = StageMetrics()
+    detector = get_detector(args.detector)
+    layout = CompiledLayout('default', posList, {'slot_width': width, 'slot_height': height}, version=0)
+    summary_out = sys.stdout if args.summary_file == '-' else open(args.summary_file, 'a')
+
+    frames = 0
+    start = time.perf_counter()
+    next_summary = start + args.summary_every
+    frame_interval = 1.0 / args.max_fps if args.max_fps > 0 else 0
+    next_frame = start
+
+    try:
+        while not args.max_frames or frames < args.max_frames:
+
+            with metrics.stage('decode'):
+                if cap.get(cv2.CAP_PROP_POS_FRAMES) == cap.get(cv2.CAP_PROP_FRAME_COUNT):
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                success, img = cap.read()
+            if not success:
+                break
+
+            with metrics.stage('preprocess'):
+                imgGray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                imgDilate = detector.mask(imgGray, layout)
+
+            with metrics.stage('detect'):
+                free = checkParkingSpace(imgDilate, None if args.headless else img)
+            frames += 1
+
+            now = time.perf_counter()
+            if args.summary_every and now >= next_summary:
+                summary_out.write(json.dumps({
+                    'time': time.time(),
+                    'frame': frames,
+                    'free_spaces': free,
+                    'total_spaces': len(posList),
+                    'occupied_spaces': len(posList) - free
+                }) + '\n')
+                summary_out.flush()
+                next_summary = now + args.summary_every
+
+            if not args.headless:
+                with metrics.stage('display'):
+                    cv2.imshow("Image", img)
+                    cv2.waitKey(10)
+
+            if frame_interval:
+                next_frame += frame_interval
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame = time.perf_counter()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        elapsed = time.perf_counter() - start
+        cap.release()
+        if summary_out is not sys.stdout:
+            summary_out.close()
+        print_throughput(frames, elapsed, metrics)
+
+
+def print_throughput(frames, elapsed, metrics):
+    """Print frame count, overall FPS and per-stage timings"""
+    print(f"Frames: {frames}  Elapsed: {elapsed:.2f}s  FPS: {frames / elapsed if elapsed else 0:.1f}",
+          file=sys.stderr)
+    for name, stats in metrics.summary().items():
+        print(f"  {name:<10} {stats['mean_wall_ms']:>8.2f} ms wall  {stats['mean_cpu_ms']:>8.2f} ms cpu",
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Per-stage wall and CPU time accounting
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageMetrics:
+    """Accumulates call count, wall time and thread CPU time per named stage"""
+
+    def __init__(self):
+        self.stages = {}
+        self.tee = None  # a profile capture that also receives every stage (see profiling.py)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            self.add(name, wall, cpu)
+            tee = self.tee
+            if tee is not None:
+                tee.add_stage(name, wall, cpu)
+
+    def add(self, name, wall, cpu=0.0):
+        with self._lock:
+            totals = self.stages.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += wall
+            totals[2] += cpu
+
+    def summary(self):
+        """Stage name -> count, total and mean wall/CPU milliseconds"""
+        with self._lock:
+            return {
+                name: {
+                    'count': count,
+                    'wall_ms': round(wall * 1000, 3),
+                    'cpu_ms': round(cpu * 1000, 3),
+                    'mean_wall_ms': round(wall * 1000 / count, 3) if count else 0.0,
+                    'mean_cpu_ms': round(cpu * 1000 / count, 3) if count else 0.0
+                }
+                for name, (count, wall, cpu) in self.stages.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
@@ -0,0 +1,39 @@
+"""
+Slot overlay drawing
+One implementation for the live views, index.py and video export, so every
+annotated frame looks the same wherever it was rendered
+"""
+
+import cv2
+
+
+def put_text_rect(img, text, pos, scale=1, thickness=2, offset=0, colorR=(255, 255, 255)):
+    """Simple text rendering function to replace cvzone"""
+    x, y = pos
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    (text_width, text_height), baseline = cv2.getTextSize(text, font, scale, thickness)
+    cv2.rectangle(img, (x - offset, y - text_height - offset),
+                  (x + text_width + offset, y + offset), colorR, -1)
+    cv2.putText(img, text, (x, y), font, scale, (0, 0, 0), thickness)
+
+
+def check_parking_space(img_pro, img, layout):
+    """Count every slot on the mask img_pro and draw slots, counts and the free counter on img
+
+    Returns (img, free spaces, total spaces, per-slot occupied flags).
+    """
+    counts = layout.count(img_pro)
+    occupied = layout.occupied(counts)
+    width, height = layout.width, layout.height
+
+    for pos, count, taken in zip(layout.positions, counts.tolist(), occupied.tolist()):
+        x, y = pos
+        color, thickness = ((0, 0, 255), 2) if taken else ((0, 255, 0), 5)
+        cv2.rectangle(img, pos, (x + width, y + height), color, thickness)
+        put_text_rect(img, str(count), (x, y + height - 3), scale=1,
+                      thickness=2, offset=0, colorR=color)
+
+    free = len(layout) - int(occupied.sum())
+    put_text_rect(img, f'Free: {free}/{len(layout)}', (100, 50), scale=3,
+                  thickness=5, offset=20, colorR=(0, 200, 0))
+    return img, free, len(layout), occupied
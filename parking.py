@@ -5,6 +5,7 @@ import cvzone
 import numpy as np
 import base64
 import os
+from pipeline import preprocess
 
 app = Flask(__name__)
 
@@ -63,12 +64,7 @@ def process_frame(frame_data):
         
         # Process the image
         img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        img_blur = cv2.GaussianBlur(img_gray, (3, 3), 1)
-        img_threshold = cv2.adaptiveThreshold(img_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                           cv2.THRESH_BINARY_INV, 25, 16)
-        img_median = cv2.medianBlur(img_threshold, 5)
-        kernel = np.ones((3, 3), np.uint8)
-        img_dilate = cv2.dilate(img_median, kernel, iterations=1)
+        img_dilate = preprocess(img_gray)
         
         processed_img, free_spaces, total_spaces = check_parking_space(img_dilate, img.copy())
         
@@ -0,0 +1,72 @@
+"""
+Shared preprocessing chain: GaussianBlur -> adaptiveThreshold -> medianBlur -> dilate
+Large frames are split into horizontal bands and processed on a thread pool
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+kernel = np.ones((3, 3), np.uint8)
+
+# Rows of context each band needs above and below so its core rows match the
+# whole-frame result: GaussianBlur 3x3 (1) + adaptiveThreshold 25x25 (12)
+# + medianBlur 5 (2) + dilate 3x3 (1)
+HALO = 1 + 12 + 2 + 1
+
+# Frames with at least this many pixels use the banded path
+tile_min_pixels = int(os.environ.get('TILE_MIN_PIXELS', 1920 * 1080))
+tile_threads = int(os.environ.get('PREPROCESS_THREADS', os.cpu_count() or 1))
+min_band_rows = 64
+
+_executor = None
+
+
+def preprocess_serial(img_gray):
+    """Run the full chain on a grayscale image"""
+    img_blur = cv2.GaussianBlur(img_gray, (3, 3), 1)
+    img_threshold = cv2.adaptiveThreshold(img_blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                          cv2.THRESH_BINARY_INV, 25, 16)
+    img_median = cv2.medianBlur(img_threshold, 5)
+    return cv2.dilate(img_median, kernel, iterations=1)
+
+
+def preprocess_tiled(img_gray, executor, bands):
+    """Run the chain on horizontal bands with halo rows and stitch the masks
+
+    The output is bit-identical to preprocess_serial: every band keeps the
+    real image edges it touches and gets HALO rows of context elsewhere.
+    """
+    rows = img_gray.shape[0]
+    bands = max(1, min(bands, rows // min_band_rows))
+    if bands == 1:
+        return preprocess_serial(img_gray)
+
+    edges = np.linspace(0, rows, bands + 1).astype(int)
+    out = np.empty_like(img_gray)
+
+    def run(i):
+        top, bottom = edges[i], edges[i + 1]
+        halo_top, halo_bottom = max(0, top - HALO), min(rows, bottom + HALO)
+        mask = preprocess_serial(img_gray[halo_top:halo_bottom])
+        out[top:bottom] = mask[top - halo_top:bottom - halo_top]
+
+    for future in [executor.submit(run, i) for i in range(bands)]:
+        future.result()
+    return out
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=tile_threads, thread_name_prefix='preprocess')
+    return _executor
+
+
+def preprocess(img_gray):
+    """Preprocess a grayscale frame, banding it across threads when it is large"""
+    if tile_threads > 1 and img_gray.size >= tile_min_pixels:
+        return preprocess_tiled(img_gray, get_executor(), tile_threads)
+    return preprocess_serial(img_gray)
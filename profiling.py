@@ -0,0 +1,217 @@
+"""
+On-demand profiling of frame processing
+A capture profiles the next N frames of a stream (or N requests) with cProfile
+and per-stage wall/CPU timers, then switches itself off. Hot paths only test
+Profiler.active (or a hooked attribute) against None, so nothing is measured
+while no capture is running
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from metrics import StageMetrics
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+MAX_UNITS = 10000
+MAX_TIMEOUT = 600
+
+
+def capture_limits(units, timeout, unit_name='frames', default_units=100, default_timeout=60):
+    """Validated (units, timeout seconds) for a capture request; raises ValueError"""
+    try:
+        units = int(units) if units is not None else default_units
+        timeout = float(timeout) if timeout is not None else default_timeout
+    except (TypeError, ValueError):
+        raise ValueError(f'{unit_name} and timeout must be numbers')
+    if not 1 <= units <= MAX_UNITS:
+        raise ValueError(f'{unit_name} must be between 1 and {MAX_UNITS}')
+    if not 0 < timeout <= MAX_TIMEOUT:
+        raise ValueError(f'timeout must be between 0 and {MAX_TIMEOUT} seconds')
+    return units, timeout
+
+
+class ProfileCapture:
+    """Profile of the next units frames or requests, or whatever arrived within timeout seconds
+
+    Units are profiled one at a time (cProfile can only follow one at once on
+    newer Pythons); a unit that arrives while another is being profiled runs
+    unprofiled. Stage timings come from lap() in the profiled thread or from
+    StageMetrics objects whose tee is this capture.
+    """
+
+    def __init__(self, target, units, timeout):
+        self.id = uuid.uuid4().hex[:12]
+        self.target = target
+        self.units = units
+        self.timeout = timeout
+        self.state = 'capturing'
+        self.captured = 0
+        self.skipped = 0
+        self.started = time.time()
+        self.finished = None
+        self.metrics = StageMetrics()
+        self.on_finish = []
+        self._stats = None
+        self._lock = threading.Lock()
+        self._unit_lock = threading.Lock()
+        self._local = threading.local()
+
+    def begin(self):
+        """Start profiling a unit in this thread; False if it should run unprofiled"""
+        if self.state != 'capturing':
+            return False
+        if not self._unit_lock.acquire(blocking=False):
+            self.skipped += 1
+            return False
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, say) already owns the interpreter hook
+            self._unit_lock.release()
+            self.skipped += 1
+            return False
+        wall, cpu = time.perf_counter(), time.thread_time()
+        self._local.unit = (profile, wall, cpu)
+        self._local.mark = (wall, cpu)
+        return True
+
+    def lap(self, name):
+        """Time since the previous lap (or begin) becomes stage name"""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        mark = self._local.mark
+        self.metrics.add(name, wall - mark[0], cpu - mark[1])
+        self._local.mark = (wall, cpu)
+
+    def add_stage(self, name, wall, cpu):
+        """Stage timing from a teed StageMetrics; kept only for the unit being profiled in this thread"""
+        if getattr(self._local, 'unit', None) is not None:
+            self.metrics.add(name, wall, cpu)
+
+    def end(self):
+        profile, wall, cpu = self._local.unit
+        profile.disable()
+        self._local.unit = None
+        self.metrics.add('total', time.perf_counter() - wall, time.thread_time() - cpu)
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.captured += 1
+            done = self.captured >= self.units
+        self._unit_lock.release()
+        if done:
+            self.finish('done')
+
+    def run(self, fn, *args, **kwargs):
+        """Call fn, profiled as one unit if this capture still wants units"""
+        if not self.begin():
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.end()
+
+    def finish(self, state):
+        with self._lock:
+            if self.state != 'capturing':
+                return
+            self.state = state
+            self.finished = time.time()
+        for callback in self.on_finish:
+            callback(self)
+
+    def report(self, sort='cumulative', limit=50):
+        """Stage table followed by cProfile's listing, as text"""
+        out = io.StringIO()
+        out.write(f'Profile {self.id} of {self.target}: {self.captured} units, state {self.state}\n\n')
+        out.write(f"{'stage':<16} {'count':>7} {'wall ms':>10} {'cpu ms':>10} {'mean wall':>10} {'mean cpu':>10}\n")
+        for name, stage in self.metrics.summary().items():
+            out.write(f"{name:<16} {stage['count']:>7} {stage['wall_ms']:>10.1f} {stage['cpu_ms']:>10.1f} "
+                      f"{stage['mean_wall_ms']:>10.3f} {stage['mean_cpu_ms']:>10.3f}\n")
+        out.write('\n')
+        with self._lock:
+            if self._stats is not None:
+                self._stats.stream = out
+                self._stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def pstats_bytes(self):
+        """Raw profile for snakeviz or pstats.Stats, or None before any unit was captured"""
+        with self._lock:
+            if self._stats is None:
+                return None
+            fd, path = tempfile.mkstemp(suffix='.prof')
+            os.close(fd)
+            try:
+                self._stats.dump_stats(path)
+                with open(path, 'rb') as f:
+                    return f.read()
+            finally:
+                os.remove(path)
+
+    def status(self):
+        elapsed = (self.finished or time.time()) - self.started
+        return {
+            'id': self.id,
+            'target': self.target,
+            'state': self.state,
+            'units': self.units,
+            'captured': self.captured,
+            'skipped': self.skipped,
+            'timeout_s': self.timeout,
+            'elapsed_s': round(elapsed, 3),
+            'stages': self.metrics.summary()
+        }
+
+
+class Profiler:
+    """At most one capture at a time; active is None whenever nothing is being captured"""
+
+    def __init__(self, keep=10):
+        self.active = None
+        self.keep = keep
+        self.captures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, target, units, timeout, hooks=()):
+        """Start a capture; raises RuntimeError if one is running
+
+        hooks are (object, attribute) pairs set to the capture while it runs,
+        e.g. (stream, 'capture') or (frame_metrics, 'tee'), and back to None after.
+        """
+        with self._lock:
+            if self.active is not None:
+                raise RuntimeError(f'Capture {self.active.id} is still running')
+            capture = ProfileCapture(target, units, timeout)
+            for obj, attribute in hooks:
+                setattr(obj, attribute, capture)
+            capture.on_finish.append(lambda c: self._finished(c, hooks))
+            self.captures[capture.id] = capture
+            while len(self.captures) > self.keep:
+                self.captures.popitem(last=False)
+            self.active = capture
+        # Switches itself off even if no frame or request ever arrives
+        timer = threading.Timer(timeout, capture.finish, args=('expired',))
+        timer.daemon = True
+        timer.start()
+        return capture
+
+    def _finished(self, capture, hooks):
+        with self._lock:
+            for obj, attribute in hooks:
+                if getattr(obj, attribute) is capture:
+                    setattr(obj, attribute, None)
+            if self.active is capture:
+                self.active = None
+
+    def get(self, capture_id):
+        return self.captures.get(capture_id)
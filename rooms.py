@@ -0,0 +1,123 @@
+"""
+Socket.IO subscription rooms per stream and quality tier
+Each room has its own maximum emit rate, frames go out as binary attachments,
+and a client that has not acknowledged its previous frame is skipped
+"""
+
+import os
+import threading
+import time
+
+from frame_encoding import PROFILES, encode_frame
+
+# Maximum emits per second for each quality tier
+ROOM_RATES = {
+    'thumbnail': float(os.environ.get('ROOM_FPS_THUMBNAIL', 2)),
+    'preview': float(os.environ.get('ROOM_FPS_PREVIEW', 5)),
+    'full': float(os.environ.get('ROOM_FPS_FULL', 10))
+}
+DEFAULT_QUALITY = 'preview'
+
+
+def room_name(stream, quality):
+    return f'{stream}:{quality}'
+
+
+class RoomBroadcaster:
+    """Tracks room membership and per-client acks for one Socket.IO server
+
+    A frame is encoded once per room that is due, then emitted to each member
+    with an ack callback. Members still waiting for their previous ack are
+    skipped rather than queued, so a slow socket only ever has one frame in
+    flight; after ack_timeout seconds without an ack it is sent to again.
+    """
+
+    def __init__(self, socketio, rates=None, ack_timeout=5.0, event='detection_result'):
+        self.socketio = socketio
+        self.rates = dict(ROOM_RATES, **(rates or {}))
+        self.ack_timeout = ack_timeout
+        self.event = event
+        self._clients = {}  # sid -> client state
+        self._rooms = {}  # room -> room state
+        self._lock = threading.Lock()
+
+    def subscribe(self, sid, stream, quality=DEFAULT_QUALITY):
+        """Move a client into the room for a stream and tier; returns (old room, new room)"""
+        if quality not in PROFILES:
+            raise ValueError(f"Unknown quality '{quality}' (choose from {', '.join(PROFILES)})")
+        room = room_name(stream, quality)
+        with self._lock:
+            old = self._leave(sid)
+            self._clients[sid] = {'room': room, 'waiting_since': None, 'sent': 0, 'skipped': 0}
+            state = self._rooms.setdefault(room, {
+                'stream': stream, 'quality': quality, 'members': set(),
+                'interval': 1.0 / self.rates[quality], 'last_emit': 0.0, 'emits': 0
+            })
+            state['members'].add(sid)
+        return old, room
+
+    def unsubscribe(self, sid):
+        """Remove a client; returns the room it left, or None"""
+        with self._lock:
+            return self._leave(sid)
+
+    def _leave(self, sid):
+        client = self._clients.pop(sid, None)
+        if client is None:
+            return None
+        state = self._rooms.get(client['room'])
+        if state is not None:
+            state['members'].discard(sid)
+            if not state['members']:
+                del self._rooms[client['room']]
+        return client['room']
+
+    def publish(self, stream, img, result, seq):
+        """Emit a result to every room of the stream that is due, encoding each tier once"""
+        now = time.monotonic()
+        with self._lock:
+            due = []
+            for room, state in self._rooms.items():
+                if state['stream'] != stream or now - state['last_emit'] < state['interval']:
+                    continue
+                ready = []
+                for sid in state['members']:
+                    client = self._clients[sid]
+                    waiting = client['waiting_since']
+                    if waiting is not None and now - waiting < self.ack_timeout:
+                        client['skipped'] += 1
+                        continue
+                    client['waiting_since'] = now
+                    client['sent'] += 1
+                    ready.append(sid)
+                if ready:
+                    state['last_emit'] = now
+                    state['emits'] += 1
+                    due.append((state['quality'], ready))
+
+        for quality, sids in due:
+            payload = dict(result, seq=seq, quality=quality, image_format='jpeg',
+                           image=encode_frame(img, quality, 'jpeg'))
+            for sid in sids:
+                self.socketio.emit(self.event, payload, to=sid,
+                                   callback=lambda *args, sid=sid: self._ack(sid))
+        return len(due)
+
+    def _ack(self, sid):
+        with self._lock:
+            client = self._clients.get(sid)
+            if client is not None:
+                client['waiting_since'] = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                room: {
+                    'subscribers': len(state['members']),
+                    'max_fps': round(1.0 / state['interval'], 2),
+                    'emits': state['emits'],
+                    'frames_sent': sum(self._clients[sid]['sent'] for sid in state['members']),
+                    'frames_skipped': sum(self._clients[sid]['skipped'] for sid in state['members'])
+                }
+                for room, state in self._rooms.items()
+            }
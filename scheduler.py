@@ -0,0 +1,60 @@
+"""
+Deadline-based frame scheduling
+Frames are due every 1/target_fps seconds from the start of the stream; when
+processing falls behind, whole missed intervals are dropped so output stays current
+"""
+
+import time
+from collections import deque
+
+
+class FrameScheduler:
+    """Tracks frame deadlines, drops and achieved rate for one stream"""
+
+    def __init__(self, target_fps=10.0, window=30):
+        self.target_fps = target_fps
+        self.interval = 1.0 / target_fps
+        self.window = window
+        self.reset()
+
+    def reset(self):
+        self.next_deadline = time.perf_counter()
+        self.processed = 0
+        self.dropped = 0
+        self.lag = 0.0
+        self._ends = deque(maxlen=self.window)
+
+    def begin_frame(self):
+        """Return how many source frames to skip before reading the next one"""
+        behind = time.perf_counter() - self.next_deadline
+        self.lag = max(0.0, behind)
+        if behind < self.interval:
+            return 0
+        drop = int(behind // self.interval)
+        self.dropped += drop
+        self.next_deadline += drop * self.interval
+        return drop
+
+    def end_frame(self):
+        """Mark the current frame as done; returns seconds to wait until the next deadline"""
+        now = time.perf_counter()
+        self._ends.append(now)
+        self.processed += 1
+        self.next_deadline += self.interval
+        return max(0.0, self.next_deadline - now)
+
+    @property
+    def fps(self):
+        """Achieved rate over the last few frames"""
+        if len(self._ends) < 2:
+            return 0.0
+        return (len(self._ends) - 1) / max(self._ends[-1] - self._ends[0], 1e-6)
+
+    def stats(self):
+        return {
+            'target_fps': self.target_fps,
+            'achieved_fps': round(self.fps, 2),
+            'lag_ms': round(self.lag * 1000, 2),
+            'processed_frames': self.processed,
+            'dropped_frames': self.dropped
+        }
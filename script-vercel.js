@@ -1,10 +1,14 @@
 // Global variables
 let currentImageData = null;
+let currentImage = null;
+let currentFileSize = 0;
+let compiledLayout = null;
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
     setupEventListeners();
     loadParkingSpaces();
+    loadLayout();
 });
 
 // Setup event listeners
@@ -67,6 +71,9 @@ function uploadImage(file) {
     const reader = new FileReader();
     reader.onload = function(e) {
         currentImageData = e.target.result.split(',')[1]; // Remove data:image/...;base64, prefix
+        currentFileSize = file.size;
+        currentImage = new Image();
+        currentImage.src = e.target.result;
         
         // Update image info
         updateImageInfo(file);
@@ -134,6 +141,19 @@ function processImage() {
     processBtn.disabled = true;
     processBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Processing...';
     
+    if (useMosaic()) {
+        processMosaic(true)
+        .catch(error => {
+            console.error('Processing error:', error);
+            showMessage('Failed to process image.', 'error');
+        })
+        .finally(() => {
+            processBtn.disabled = false;
+            processBtn.innerHTML = '<i class="fas fa-play"></i> Process Image';
+        });
+        return;
+    }
+    
     fetch('/api/process_frame', {
         method: 'POST',
         headers: {
@@ -184,6 +204,99 @@ function updateDetectionResults(data) {
     document.getElementById('totalSpaces').textContent = data.total_spaces;
 }
 
+// Load the compiled slot layout and its mosaic packing
+function loadLayout() {
+    return fetch('/api/layout')
+    .then(response => response.json())
+    .then(data => {
+        compiledLayout = data.error ? null : data;
+    })
+    .catch(error => {
+        console.error('Error loading layout:', error);
+        compiledLayout = null;
+    });
+}
+
+// Send only the slot crops when their mosaic is smaller than the whole image
+function useMosaic() {
+    if (!compiledLayout || !compiledLayout.positions.length || !currentImage || !currentImage.complete) {
+        return false;
+    }
+    const mosaic = compiledLayout.mosaic;
+    return mosaic.width * mosaic.height < currentImage.naturalWidth * currentImage.naturalHeight;
+}
+
+// Pack each slot crop (plus margin) into one canvas as the server described
+function buildMosaic(img, mosaic) {
+    const canvas = document.createElement('canvas');
+    canvas.width = mosaic.width;
+    canvas.height = mosaic.height;
+    const ctx = canvas.getContext('2d');
+    ctx.fillStyle = '#000';
+    ctx.fillRect(0, 0, canvas.width, canvas.height);
+    
+    mosaic.tiles.forEach(([sx, sy, dx, dy]) => {
+        // Clip the source rectangle to the image; the rest of the tile stays black
+        const x0 = Math.max(sx, 0), y0 = Math.max(sy, 0);
+        const x1 = Math.min(sx + mosaic.tile_width, img.naturalWidth);
+        const y1 = Math.min(sy + mosaic.tile_height, img.naturalHeight);
+        if (x1 > x0 && y1 > y0) {
+            ctx.drawImage(img, x0, y0, x1 - x0, y1 - y0, dx + x0 - sx, dy + y0 - sy, x1 - x0, y1 - y0);
+        }
+    });
+    
+    return new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.9));
+}
+
+// Process the mosaic; a stale layout is refetched and the mosaic rebuilt once
+function processMosaic(retry) {
+    const layout = compiledLayout;
+    let sent = 0;
+    return buildMosaic(currentImage, layout.mosaic)
+    .then(blob => {
+        sent = blob.size;
+        return fetch(`/api/process_mosaic?version=${layout.version}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'image/jpeg',
+            },
+            body: blob
+        });
+    })
+    .then(response => {
+        if (response.status === 409 && retry) {
+            return loadLayout().then(() => useMosaic() ? processMosaic(false) : processImage());
+        }
+        return response.json().then(data => {
+            if (data.error) {
+                showMessage(data.error, 'error');
+                return;
+            }
+            data.image = drawOverlay(currentImage, layout, data.occupied);
+            updateDetectionResults(data);
+            showMessage(`Image processed successfully! Sent ${formatFileSize(sent)} of slot crops ` +
+                        `instead of ${formatFileSize(currentFileSize)}.`, 'success');
+        });
+    });
+}
+
+// Draw the slot rectangles locally, since only the crops went to the server
+function drawOverlay(img, layout, occupied) {
+    const canvas = document.createElement('canvas');
+    canvas.width = img.naturalWidth;
+    canvas.height = img.naturalHeight;
+    const ctx = canvas.getContext('2d');
+    ctx.drawImage(img, 0, 0);
+    
+    layout.positions.forEach(([x, y], i) => {
+        ctx.strokeStyle = occupied[i] ? 'rgb(255, 0, 0)' : 'rgb(0, 255, 0)';
+        ctx.lineWidth = occupied[i] ? 2 : 5;
+        ctx.strokeRect(x, y, layout.slot_width, layout.slot_height);
+    });
+    
+    return canvas.toDataURL('image/jpeg').split(',')[1];
+}
+
 // Load parking spaces count
 function loadParkingSpaces() {
     fetch('/api/parking_spaces')
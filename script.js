@@ -2,6 +2,7 @@
 let socket;
 let isConnected = false;
 let isDetectionRunning = false;
+let frameUrl = null;
 
 // Initialize the application
 document.addEventListener('DOMContentLoaded', function() {
@@ -18,6 +19,12 @@ function initializeSocket() {
         isConnected = true;
         updateConnectionStatus(true);
         console.log('Connected to server');
+        
+        // Small screens take the lighter, lower-rate room
+        const quality = window.innerWidth < 700 ? 'thumbnail' : 'preview';
+        socket.emit('subscribe', { stream: 'default', quality: quality }, function(reply) {
+            console.log('Subscribed:', reply);
+        });
     });
     
     socket.on('disconnect', function() {
@@ -26,8 +33,9 @@ function initializeSocket() {
         console.log('Disconnected from server');
     });
     
-    socket.on('detection_result', function(data) {
-        updateDetectionResults(data);
+    // Acknowledge each frame once it is shown; the server skips frames while one is unacknowledged
+    socket.on('detection_result', function(data, ack) {
+        updateDetectionResults(data, ack);
     });
     
     socket.on('status', function(data) {
@@ -237,15 +245,24 @@ function updateDetectionControls() {
 }
 
 // Update detection results
-function updateDetectionResults(data) {
+function updateDetectionResults(data, ack) {
     const detectionImage = document.getElementById('detectionImage');
     const videoPlaceholder = document.getElementById('videoPlaceholder');
     const freeSpaces = document.getElementById('freeSpaces');
     const occupiedSpaces = document.getElementById('occupiedSpaces');
     const totalSpacesDisplay = document.getElementById('totalSpacesDisplay');
     
-    // Update image
-    detectionImage.src = 'data:image/jpeg;base64,' + data.image;
+    // Update image (sent as a binary attachment)
+    if (frameUrl) {
+        URL.revokeObjectURL(frameUrl);
+    }
+    frameUrl = URL.createObjectURL(new Blob([data.image], { type: 'image/' + (data.image_format || 'jpeg') }));
+    detectionImage.onload = detectionImage.onerror = function() {
+        if (ack) {
+            ack();
+        }
+    };
+    detectionImage.src = frameUrl;
     detectionImage.style.display = 'block';
     videoPlaceholder.style.display = 'none';
     
@@ -0,0 +1,173 @@
+"""
+Random-access frame lookup for uploaded videos
+A seek index maps timestamps to frame numbers once per upload, and recently
+decoded frames are kept in an LRU cache so scrubbing back and forth is cheap
+"""
+
+import atexit
+import bisect
+import threading
+from collections import OrderedDict
+
+import cv2
+
+# Index builds still running; joined at exit so no thread is left inside the decoder
+_builds = set()
+
+
+class SeekIndex:
+    """Presentation timestamp (ms) of every frame, built by one grab() pass
+
+    Until the pass finishes, lookups fall back to frame = t * fps.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        probe = cv2.VideoCapture(path)
+        self.fps = probe.get(cv2.CAP_PROP_FPS) or 0.0
+        self.frame_count = int(probe.get(cv2.CAP_PROP_FRAME_COUNT))
+        probe.release()
+        self.timestamps = None
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def build(self):
+        """Grab every frame without converting it and record its timestamp"""
+        cap = cv2.VideoCapture(self.path)
+        timestamps = []
+        try:
+            while not self._stop.is_set() and cap.grab():
+                timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        finally:
+            cap.release()
+            _builds.discard(self)
+        if self._stop.is_set():
+            return
+        if timestamps:
+            self.frame_count = len(timestamps)
+            # Some backends report 0 for every frame; keep the fps estimate then
+            if timestamps[-1] > timestamps[0]:
+                self.timestamps = timestamps
+        self.ready.set()
+
+    def build_async(self):
+        _builds.add(self)
+        self._thread = threading.Thread(target=self.build, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Stop an unfinished build"""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    @property
+    def duration(self):
+        if self.timestamps:
+            return self.timestamps[-1] / 1000.0
+        return self.frame_count / self.fps if self.fps else 0.0
+
+    def frame_at(self, t):
+        """Frame number shown at t seconds (the last frame starting at or before t)"""
+        timestamps = self.timestamps
+        if timestamps:
+            frame = bisect.bisect_right(timestamps, t * 1000.0 + 1e-6) - 1
+        else:
+            frame = int(t * self.fps) if self.fps else 0
+        return max(0, min(frame, self.frame_count - 1))
+
+    def time_of(self, frame):
+        if self.timestamps:
+            return self.timestamps[frame] / 1000.0
+        return frame / self.fps if self.fps else 0.0
+
+
+class VideoScrubber:
+    """Decodes arbitrary frames of one video file with its own capture
+
+    A target a little ahead of the decoder is reached by grabbing forward,
+    anything else by seeking; decoded frames are cached up to budget_bytes.
+    """
+
+    def __init__(self, path, budget_bytes=256 * 1024 * 1024, forward_limit=30):
+        self.index = SeekIndex(path).build_async()
+        self.budget_bytes = budget_bytes
+        self.forward_limit = forward_limit
+        self._cap = cv2.VideoCapture(path)
+        self._position = 0  # frame number the next read() returns, None if unknown
+        self._cache = OrderedDict()  # frame number -> BGR frame
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.seeks = 0
+        self.forward_reads = 0
+        self.decoded = 0
+
+    def frame_at(self, t):
+        """Return (frame number, timestamp, BGR frame) for t seconds, or raises ValueError"""
+        index = self.index
+        if t < 0 or (index.duration and t > index.duration + 1.0 / max(index.fps, 1.0)):
+            raise ValueError(f't must be between 0 and {index.duration:.3f}')
+        frame_no = index.frame_at(t)
+        return frame_no, index.time_of(frame_no), self.frame(frame_no)
+
+    def frame(self, frame_no):
+        with self._lock:
+            img = self._cache.get(frame_no)
+            if img is not None:
+                self._cache.move_to_end(frame_no)
+                self.hits += 1
+                return img
+
+            ahead = frame_no - self._position if self._position is not None else -1
+            if 0 <= ahead <= self.forward_limit:
+                # Cheaper than a seek, which restarts decoding at the previous keyframe
+                for _ in range(ahead):
+                    self._cap.grab()
+                self.forward_reads += 1
+                self.decoded += ahead + 1
+            else:
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no)
+                self.seeks += 1
+                self.decoded += 1
+            success, img = self._cap.read()
+            if not success:
+                self._position = None  # the next lookup seeks
+                raise ValueError(f'Cannot decode frame {frame_no}')
+            self._position = frame_no + 1
+
+            self._cache[frame_no] = img
+            self._cache_bytes += img.nbytes
+            while self._cache_bytes > self.budget_bytes and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                self._cache_bytes -= old.nbytes
+            return img
+
+    def close(self):
+        self.index.close()
+        with self._lock:
+            self._cap.release()
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def stats(self):
+        index = self.index
+        return {
+            'indexed': index.ready.is_set(),
+            'frame_count': index.frame_count,
+            'duration': round(index.duration, 3),
+            'cached_frames': len(self._cache),
+            'cache_bytes': self._cache_bytes,
+            'hits': self.hits,
+            'seeks': self.seeks,
+            'forward_reads': self.forward_reads,
+            'decoded_frames': self.decoded
+        }
+
+
+@atexit.register
+def _stop_builds():
+    for index in list(_builds):
+        index.close()
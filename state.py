@@ -0,0 +1,365 @@
+"""
+State shared by the web workers of one host
+Slot layouts, the desired state of each stream (video, running, detector),
+which worker owns a stream's detector, and each stream's latest result.
+LocalState keeps them in this process; SQLiteState keeps them in an SQLite
+database in WAL mode so several worker processes (gunicorn -w N) agree
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+
+import cv2
+import numpy as np
+
+from frame_encoding import encode_frame
+from stream import ResultChannel, Snapshot
+
+# Desired state of a stream; uploaded and started change on every upload and start
+DEFAULT_STREAM = {'source': None, 'uploaded': None, 'running': False, 'started': None, 'detector': None}
+
+
+class LocalState:
+    """Everything in this process's memory; one worker, so it always owns every stream"""
+
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._layouts = {}  # lot -> (version, positions)
+        self._streams = {}
+        self._leases = {}  # stream -> (owner, expires)
+        self._results = {}  # stream -> (seq, timestamp, result)
+        self._frames = {}  # stream -> (seq, frame bytes)
+        self._frame_readers = {}  # stream -> time until which frames are wanted
+
+    def positions(self, lot):
+        """(version, positions) of a lot; version 0 and None when never stored"""
+        return self._layouts.get(lot, (0, None))
+
+    def positions_version(self, lot):
+        return self._layouts.get(lot, (0, None))[0]
+
+    def modify_positions(self, lot, change):
+        """Replace a lot's positions with change(current positions) atomically; returns the new list"""
+        with self._lock:
+            version, positions = self._layouts.get(lot, (0, None))
+            positions = [tuple(pos) for pos in change(list(positions or []))]
+            self._layouts[lot] = (version + 1, positions)
+            return positions
+
+    def stream(self, stream):
+        return dict(DEFAULT_STREAM, **self._streams.get(stream, {}))
+
+    def update_stream(self, stream, **changes):
+        """Merge changes into a stream's desired state; returns the previous state"""
+        with self._lock:
+            previous = self.stream(stream)
+            self._streams[stream] = dict(previous, **changes)
+            return previous
+
+    def acquire_lease(self, stream, owner, ttl):
+        """Take or renew ownership of a stream for ttl seconds; False if another owner holds it"""
+        with self._lock:
+            now = time.time()
+            current = self._leases.get(stream)
+            if current is not None and current[0] != owner and current[1] > now:
+                return False
+            self._leases[stream] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, stream, owner):
+        with self._lock:
+            if self._leases.get(stream, (None,))[0] == owner:
+                del self._leases[stream]
+
+    def lease_owner(self, stream):
+        current = self._leases.get(stream)
+        return current[0] if current is not None and current[1] > time.time() else None
+
+    def publish_result(self, stream, seq, timestamp, result):
+        self._results[stream] = (seq, timestamp, result)
+
+    def publish_frame(self, stream, seq, frame):
+        self._frames[stream] = (seq, frame)
+
+    def want_frames(self, stream, until):
+        """Ask the stream's owner to publish frames until the given time"""
+        self._frame_readers[stream] = until
+
+    def frames_wanted_until(self, stream):
+        return self._frame_readers.get(stream, 0.0)
+
+    def result_info(self, stream):
+        """(seq, timestamp) of the latest result, (0, None) if there is none"""
+        return self._results.get(stream, (0, None))[:2]
+
+    def latest_result(self, stream):
+        return self._results.get(stream)
+
+    def latest_frame(self, stream):
+        """(seq, frame bytes) of the newest published frame, or None"""
+        return self._frames.get(stream)
+
+
+class SQLiteState:
+    """The same state in an SQLite database in WAL mode, shared by the processes of one host
+
+    Readers never block the writer in WAL mode, so polling workers do not slow
+    down the worker publishing results. Each thread gets its own connection.
+    """
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # executescript commits by itself; IF NOT EXISTS makes concurrent setup safe
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS layouts (lot TEXT PRIMARY KEY, version INTEGER, positions TEXT);
+            CREATE TABLE IF NOT EXISTS streams (stream TEXT PRIMARY KEY, state TEXT);
+            CREATE TABLE IF NOT EXISTS leases (stream TEXT PRIMARY KEY, owner TEXT, expires REAL);
+            CREATE TABLE IF NOT EXISTS results (stream TEXT PRIMARY KEY, seq INTEGER, timestamp REAL,
+                                                result TEXT);
+            CREATE TABLE IF NOT EXISTS frames (stream TEXT PRIMARY KEY, seq INTEGER, frame BLOB);
+            CREATE TABLE IF NOT EXISTS frame_readers (stream TEXT PRIMARY KEY, until REAL);
+        """)
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            # Connections must not cross a fork
+            db = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+    def positions(self, lot):
+        row = self._db.execute('SELECT version, positions FROM layouts WHERE lot = ?', (lot,)).fetchone()
+        if row is None:
+            return 0, None
+        return row[0], [tuple(pos) for pos in json.loads(row[1])]
+
+    def positions_version(self, lot):
+        row = self._db.execute('SELECT version FROM layouts WHERE lot = ?', (lot,)).fetchone()
+        return row[0] if row else 0
+
+    def modify_positions(self, lot, change):
+        with self._transaction() as db:
+            row = db.execute('SELECT version, positions FROM layouts WHERE lot = ?', (lot,)).fetchone()
+            version, positions = (row[0], json.loads(row[1])) if row else (0, [])
+            positions = [tuple(pos) for pos in change([tuple(pos) for pos in positions])]
+            db.execute('INSERT OR REPLACE INTO layouts VALUES (?, ?, ?)', (lot, version + 1, json.dumps(positions)))
+            return positions
+
+    def stream(self, stream):
+        row = self._db.execute('SELECT state FROM streams WHERE stream = ?', (stream,)).fetchone()
+        return dict(DEFAULT_STREAM, **(json.loads(row[0]) if row else {}))
+
+    def update_stream(self, stream, **changes):
+        with self._transaction() as db:
+            row = db.execute('SELECT state FROM streams WHERE stream = ?', (stream,)).fetchone()
+            previous = dict(DEFAULT_STREAM, **(json.loads(row[0]) if row else {}))
+            db.execute('INSERT OR REPLACE INTO streams VALUES (?, ?)', (stream, json.dumps(dict(previous, **changes))))
+            return previous
+
+    def acquire_lease(self, stream, owner, ttl):
+        with self._transaction() as db:
+            now = time.time()
+            row = db.execute('SELECT owner, expires FROM leases WHERE stream = ?', (stream,)).fetchone()
+            if row is not None and row[0] != owner and row[1] > now:
+                return False
+            db.execute('INSERT OR REPLACE INTO leases VALUES (?, ?, ?)', (stream, owner, now + ttl))
+            return True
+
+    def release_lease(self, stream, owner):
+        with self._transaction() as db:
+            db.execute('DELETE FROM leases WHERE stream = ? AND owner = ?', (stream, owner))
+
+    def lease_owner(self, stream):
+        row = self._db.execute('SELECT owner FROM leases WHERE stream = ? AND expires > ?',
+                               (stream, time.time())).fetchone()
+        return row[0] if row else None
+
+    def publish_result(self, stream, seq, timestamp, result):
+        # Column names, since databases created by older versions also have a frame column
+        self._db.execute('INSERT OR REPLACE INTO results (stream, seq, timestamp, result) VALUES (?, ?, ?, ?)',
+                         (stream, seq, timestamp, json.dumps(result)))
+
+    def publish_frame(self, stream, seq, frame):
+        self._db.execute('INSERT OR REPLACE INTO frames VALUES (?, ?, ?)', (stream, seq, frame))
+
+    def want_frames(self, stream, until):
+        self._db.execute('INSERT OR REPLACE INTO frame_readers VALUES (?, ?)', (stream, until))
+
+    def frames_wanted_until(self, stream):
+        row = self._db.execute('SELECT until FROM frame_readers WHERE stream = ?', (stream,)).fetchone()
+        return row[0] if row else 0.0
+
+    def result_info(self, stream):
+        row = self._db.execute('SELECT seq, timestamp FROM results WHERE stream = ?', (stream,)).fetchone()
+        return tuple(row) if row else (0, None)
+
+    def latest_result(self, stream):
+        row = self._db.execute('SELECT seq, timestamp, result FROM results WHERE stream = ?',
+                               (stream,)).fetchone()
+        return None if row is None else (row[0], row[1], json.loads(row[2]))
+
+    def latest_frame(self, stream):
+        row = self._db.execute('SELECT seq, frame FROM frames WHERE stream = ?', (stream,)).fetchone()
+        return tuple(row) if row else None
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, so read-modify-write updates from different workers serialise"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def get_state(url=None):
+    """State backend from a URL: 'local' (default) or 'sqlite:///path/to/state.db'"""
+    url = url or 'local'
+    if url == 'local':
+        return LocalState()
+    if url.startswith('sqlite:///'):
+        return SQLiteState(url[len('sqlite:///'):])
+    raise ValueError(f"Unknown state backend '{url}' (use 'local' or 'sqlite:///path')")
+
+
+class SharedResultChannel(ResultChannel):
+    """Result channel whose snapshots also go to a shared backend
+
+    The owning worker publishes every result's counts, but encodes and stores
+    its frame as JPEG only while another worker has asked for frames in the
+    last demand_ttl seconds. Other workers read the newest result back,
+    decoding a frame once per published frame. Sequence numbers continue
+    from the backend's so they keep increasing when ownership moves to
+    another worker.
+    """
+
+    def __init__(self, backend, stream, demand_ttl=5.0, demand_check=0.5):
+        super().__init__()
+        self.backend = backend
+        self.stream = stream
+        self.demand_ttl = demand_ttl
+        self.demand_check = demand_check
+        self.frames_published = 0
+        self._remote = None
+        self._frame = None  # (frame seq, decoded frame) last read back
+        self._wanted_until = 0.0  # owner: readers' deadline, re-read every demand_check seconds
+        self._checked = 0.0
+        self._asked = 0.0  # reader: when this worker last renewed its demand
+
+    def publish(self, result):
+        if self._snapshot is None:
+            self._seq = max(self._seq, self.backend.result_info(self.stream)[0])
+        snapshot = super().publish(result)
+        frame = result.get('frame')
+        self.backend.publish_result(self.stream, snapshot.seq, snapshot.timestamp,
+                                    {key: value for key, value in result.items() if key != 'frame'})
+        if frame is not None and self._frames_wanted(snapshot.timestamp):
+            self.backend.publish_frame(self.stream, snapshot.seq, encode_frame(frame, 'full', 'jpeg'))
+            self.frames_published += 1
+        return snapshot
+
+    def _frames_wanted(self, now):
+        if now - self._checked >= self.demand_check:
+            self._checked = now
+            self._wanted_until = self.backend.frames_wanted_until(self.stream)
+        return now < self._wanted_until
+
+    def latest(self, frame=True):
+        seq = self.backend.result_info(self.stream)[0]
+        local = self._snapshot
+        if local is not None and local.seq == seq:
+            return local
+        if frame:
+            now = time.time()
+            if now - self._asked >= self.demand_ttl / 2:
+                self._asked = now
+                self.backend.want_frames(self.stream, now + self.demand_ttl)
+        remote = self._remote
+        if remote is not None and remote.seq == seq and (not frame or 'frame' in remote.result):
+            return remote
+        row = self.backend.latest_result(self.stream)
+        if row is None:
+            return None
+        seq, timestamp, result = row
+        if frame:
+            # The newest frame there is; it lags the counts only until the owner sees the demand
+            stored = self.backend.latest_frame(self.stream)
+            if stored is not None:
+                if self._frame is None or self._frame[0] != stored[0]:
+                    self._frame = (stored[0], cv2.imdecode(np.frombuffer(stored[1], np.uint8), cv2.IMREAD_COLOR))
+                result['frame'] = self._frame[1]
+        self._remote = Snapshot(seq, timestamp, MappingProxyType(result))
+        return self._remote
+
+
+class LeaseKeeper:
+    """Keeps this worker's claim on one stream and reconciles it every interval seconds
+
+    apply(owns) is called after each attempt to take or renew the lease; the
+    owner runs the stream's detector, everyone else keeps theirs stopped. A
+    worker that dies stops renewing and another takes over after ttl seconds.
+    """
+
+    def __init__(self, backend, stream, apply, ttl=5.0, interval=1.0):
+        self.backend = backend
+        self.stream = stream
+        self.owner = None
+        self.apply = apply
+        self.ttl = ttl
+        self.interval = interval
+        self.owns = False
+        self.pid = None
+        self._stop = threading.Event()
+
+    def tick(self):
+        self.owns = self.backend.acquire_lease(self.stream, self.owner, self.ttl)
+        self.apply(self.owns)
+        return self.owns
+
+    def start(self):
+        """Start the renewal thread in this process (again after a fork)"""
+        self.pid = os.getpid()
+        self.owner = f'{socket.gethostname()}:{self.pid}'
+        self.owns = False
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        stop = self._stop
+        while not stop.wait(self.interval):
+            try:
+                self.tick()
+            except sqlite3.Error as e:
+                # Could not renew: stop the detector rather than risk two owners
+                print(f'Lease renewal failed: {e}')
+                self.owns = False
+                self.apply(False)
+
+    def close(self):
+        self._stop.set()
+        if self.owns:
+            self.backend.release_lease(self.stream, self.owner)
+            self.owns = False
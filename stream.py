@@ -0,0 +1,320 @@
+"""
+Detection stream lifecycle and result publishing
+The worker thread owns the capture; request handlers only read published snapshots
+"""
+
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+import cv2
+
+from scheduler import FrameScheduler
+
+# Immutable view of one published result
+Snapshot = namedtuple('Snapshot', ['seq', 'timestamp', 'result'])
+
+
+def rewind_at_end(cap):
+    """Loop video files back to the first frame"""
+    if cap.get(cv2.CAP_PROP_POS_FRAMES) == cap.get(cv2.CAP_PROP_FRAME_COUNT):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+
+class ResultChannel:
+    """Single-producer result channel built on an atomic reference swap
+
+    The producer builds a complete snapshot and then replaces the reference in
+    one assignment, so readers never block it and never see a half-written result.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._seq = 0
+
+    def publish(self, result):
+        """Publish a new result (called from the worker thread only)"""
+        self._seq += 1
+        self._snapshot = Snapshot(self._seq, time.time(), MappingProxyType(dict(result)))
+        return self._snapshot
+
+    def latest(self, frame=True):
+        """Return the most recent snapshot, or None
+
+        frame=False tells channels that share results between processes that
+        the caller will not use the snapshot's frame.
+        """
+        return self._snapshot
+
+    def clear(self):
+        self._snapshot = None
+
+
+class _Worker:
+    """One run of the detection loop and the source it reads from"""
+
+    def __init__(self, source):
+        self.source = source
+        self.stop = threading.Event()
+        self.thread = None
+        self.stage = 'starting'
+        self.release_on_exit = False  # set when the controller gives up waiting for it
+
+
+class StreamController:
+    """Start, stop and swap the video source of one detection stream
+
+    Lifecycle calls are serialised with a lock and always join the worker
+    before touching the capture, so a source is never released mid-read. A
+    worker that does not stop in time (stuck in a read) is abandoned and
+    releases its own source when it finally returns.
+
+    A watchdog thread restarts the stream with exponential backoff when the
+    worker has died or no frame has been published for max_frame_age seconds,
+    reopening the source through the factory given to swap_source.
+    """
+
+    def __init__(self, detect, channel=None, target_fps=10.0, max_frame_age=5.0,
+                 backoff_initial=1.0, backoff_max=30.0, check_interval=1.0):
+        self.detect = detect
+        self.channel = channel or ResultChannel()
+        self.scheduler = FrameScheduler(target_fps)
+        self.max_frame_age = max_frame_age
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.check_interval = check_interval
+        self._lifecycle = threading.RLock()
+        self._worker = None
+        self._source = None
+        self._factory = None
+        self._wanted = False  # started and not stopped by a caller
+        self._watchdog = None
+        self._closed = threading.Event()
+        self._stage = 'idle'
+        self.started_time = None
+        self.last_frame_time = None
+        self.last_error = None
+        self.last_restart_reason = None
+        self.restarts = 0
+        self._backoff = backoff_initial
+        self._next_restart = 0.0
+        self.capture = None  # profile capture of the next frames (see profiling.py), None when idle
+
+    @property
+    def running(self):
+        worker = self._worker
+        return worker is not None and worker.thread.is_alive()
+
+    @property
+    def stage(self):
+        """Where the current worker is in its loop (an abandoned worker no longer reports)"""
+        worker = self._worker
+        return worker.stage if worker is not None else self._stage
+
+    @property
+    def wanted(self):
+        """Started and not stopped since, whether or not the worker is alive right now"""
+        return self._wanted
+
+    @property
+    def has_source(self):
+        return self._source is not None or self._factory is not None
+
+    def source_stats(self):
+        """Counters kept by the current source (a shared-memory ring's reader), or None"""
+        stats = getattr(self._source, 'stats', None)
+        return stats() if stats is not None else None
+
+    def start(self):
+        """Start the worker; returns False if it was already running"""
+        with self._lifecycle:
+            if not self.has_source:
+                raise RuntimeError('No video loaded')
+            self._wanted = True
+            self._ensure_watchdog()
+            if self.running:
+                return False
+            self._backoff = self.backoff_initial
+            self._start_worker()
+            return True
+
+    def stop(self, timeout=5.0):
+        """Signal the worker to stop and wait for it to exit"""
+        with self._lifecycle:
+            self._wanted = False
+            self._stop_worker(timeout)
+            self._stage = 'stopped'
+
+    def swap_source(self, source, resume=False, factory=None):
+        """Replace the capture source; the old one is released after the worker has stopped
+
+        factory, if given, opens a fresh copy of the source when the watchdog
+        restarts a failed or stalled stream.
+        """
+        with self._lifecycle:
+            was_running = self._wanted and self.running
+            self.stop()
+            old, self._source = self._source, source
+            self._factory = factory
+            if old is not None and old is not source:
+                old.release()
+            self.last_frame_time = None
+            self.last_error = None
+            if resume and was_running:
+                self.start()
+
+    def close(self):
+        self.swap_source(None)
+        self._closed.set()
+
+    def _start_worker(self):
+        if self._source is None:
+            self._source = self._factory()
+        worker = _Worker(self._source)
+        worker.thread = threading.Thread(target=self._run, args=(worker,), daemon=True)
+        self._worker = worker
+        self.started_time = time.time()
+        worker.thread.start()
+
+    def _stop_worker(self, timeout):
+        worker = self._worker
+        if worker is None:
+            return
+        worker.stop.set()
+        if worker.thread is not threading.current_thread():
+            worker.thread.join(timeout)
+        # Forgotten only after the join so health never sees a gap mid-restart
+        self._worker = None
+        if worker.thread.is_alive() and worker.thread is not threading.current_thread():
+            # Stuck inside the source: leave it the source and forget both
+            worker.release_on_exit = True
+            if self._source is worker.source:
+                self._source = None
+
+    def _fail(self, worker, message):
+        if not worker.stop.is_set():
+            worker.stage = 'failed'
+            self.last_error = message
+
+    def _run(self, worker):
+        cap, stop = worker.source, worker.stop
+        scheduler = self.scheduler
+        scheduler.reset()
+        try:
+            while not stop.is_set():
+                capture = self.capture
+                if capture is not None and not capture.begin():
+                    capture = None
+                try:
+                    # Skip frames we no longer have time for so output stays current
+                    worker.stage = 'grab'
+                    for _ in range(scheduler.begin_frame()):
+                        rewind_at_end(cap)
+                        cap.grab()
+                    if capture is not None:
+                        capture.lap('grab')
+
+                    worker.stage = 'read'
+                    rewind_at_end(cap)
+                    success, img = cap.read()
+                    if stop.is_set():
+                        break  # stopped or abandoned while blocked in the read
+                    if not success:
+                        self._fail(worker, 'Capture read failed')
+                        break
+                    if capture is not None:
+                        capture.lap('read')
+
+                    worker.stage = 'detect'
+                    result = self.detect(img)
+                    if stop.is_set():
+                        break
+                    if capture is not None:
+                        capture.lap('detect')
+                    self.channel.publish(result)
+                    self.last_frame_time = time.time()
+                    if self.last_frame_time - self.started_time > self.max_frame_age:
+                        # Healthy for a while: the next failure restarts quickly again
+                        self._backoff = self.backoff_initial
+                    if capture is not None:
+                        capture.lap('publish')
+                finally:
+                    if capture is not None:
+                        capture.end()
+
+                # Wait for the next deadline; wakes immediately on stop
+                worker.stage = 'wait'
+                stop.wait(scheduler.end_frame())
+        except Exception as e:
+            self._fail(worker, f'{type(e).__name__}: {e}')
+        finally:
+            if worker.release_on_exit:
+                cap.release()
+
+    def frame_age(self):
+        """Seconds since the last published frame (or since start if none yet)"""
+        last = self.last_frame_time or self.started_time
+        return None if last is None else time.time() - last
+
+    def problem(self):
+        """Why the stream is unhealthy, or None"""
+        if not self._wanted:
+            return None
+        if not self.running:
+            return f'Worker exited ({self.last_error or "no error recorded"})'
+        age = self.frame_age()
+        if age is not None and age > self.max_frame_age:
+            return f'No frame for {age:.1f}s (stuck in {self.stage})'
+        return None
+
+    def _ensure_watchdog(self):
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._watchdog = threading.Thread(target=self._watch, daemon=True)
+            self._watchdog.start()
+
+    def _watch(self):
+        while not self._closed.wait(self.check_interval):
+            with self._lifecycle:
+                problem = self.problem()
+                if problem is None or time.monotonic() < self._next_restart:
+                    continue
+                self.restart(problem)
+
+    def restart(self, reason='manual'):
+        """Stop the worker (abandoning it if stuck), reopen the source and start again"""
+        with self._lifecycle:
+            self._stop_worker(timeout=1.0)
+            if self._factory is not None:
+                old, self._source = self._source, None
+                if old is not None:
+                    old.release()
+            if not self.has_source:
+                return False
+            self.restarts += 1
+            self.last_restart_reason = reason
+            self._next_restart = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+            self._wanted = True
+            self._start_worker()
+            return True
+
+    def health(self):
+        problem = self.problem()
+        age = self.frame_age()
+        if not self._wanted:
+            state = 'stopped'
+        else:
+            state = 'running' if problem is None else 'unhealthy'
+        return {
+            'healthy': problem is None,
+            'state': state,
+            'stage': self.stage,
+            'frame_age_s': round(age, 3) if age is not None and self._wanted else None,
+            'max_frame_age_s': self.max_frame_age,
+            'problem': problem,
+            'last_error': self.last_error,
+            'restarts': self.restarts,
+            'last_restart_reason': self.last_restart_reason,
+            'next_restart_in_s': round(max(0.0, self._next_restart - time.monotonic()), 2) if problem else 0.0
+        }
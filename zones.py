@@ -0,0 +1,168 @@
+"""
+Zones and slot-state indexes
+Slots are grouped into named zones (rectangles on the lot image) and kept in
+sorted per-zone free/occupied lists that only change when a slot flips, so
+counts are O(1) and filtered or nearest-slot queries cost O(result size)
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+STATES = ('free', 'occupied', 'all')
+
+
+def parse_zones(data):
+    """Validate {"zones": {name: [[x1, y1, x2, y2], ...]}, "points": {name: [x, y]}}; raises ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object with zones and points')
+    zones, points = data.get('zones') or {}, data.get('points') or {}
+    if not isinstance(zones, dict) or not isinstance(points, dict):
+        raise ValueError('zones and points must be objects keyed by name')
+    try:
+        zones = {str(name): [[int(v) for v in rect] for rect in rects] for name, rects in zones.items()}
+        points = {str(name): [int(v) for v in point] for name, point in points.items()}
+    except (TypeError, ValueError):
+        raise ValueError('Zone rectangles and points must be lists of integers')
+    for name, rects in zones.items():
+        if not rects or any(len(rect) != 4 or rect[0] >= rect[2] or rect[1] >= rect[3] for rect in rects):
+            raise ValueError(f"Zone '{name}' needs one or more [x1, y1, x2, y2] rectangles with x1 < x2 and y1 < y2")
+    for name, point in points.items():
+        if len(point) != 2:
+            raise ValueError(f"Point '{name}' must be [x, y]")
+    return {'zones': zones, 'points': points}
+
+
+def load_zones(path):
+    try:
+        with open(path) as f:
+            return parse_zones(json.load(f))
+    except (OSError, ValueError):
+        return {'zones': {}, 'points': {}}
+
+
+def save_zones(path, definition):
+    # Replaced atomically so other workers never read a half-written file
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(definition, f)
+    os.replace(tmp, path)
+
+
+def _discard(items, value):
+    i = bisect.bisect_left(items, value)
+    if i < len(items) and items[i] == value:
+        del items[i]
+
+
+class ZoneIndex:
+    """Slot states of one layout, indexed by zone, state and distance to named points
+
+    A slot belongs to every zone with a rectangle containing its centre; zone
+    None is the whole lot. Every slot starts free and update() moves only the
+    slots whose state changed between the sorted lists.
+    """
+
+    def __init__(self, positions, slot_width, slot_height, definition=None):
+        definition = definition or {'zones': {}, 'points': {}}
+        self.positions = [tuple(pos) for pos in positions]
+        self.rects = definition['zones']
+        self.points = definition['points']
+        count = len(self.positions)
+        centres = np.array(self.positions, np.float64).reshape(-1, 2) + (slot_width / 2, slot_height / 2)
+
+        self.slot_zones = [[] for _ in range(count)]
+        self.members = {None: list(range(count))}
+        for name, rects in sorted(self.rects.items()):
+            inside = np.zeros(count, bool)
+            for x1, y1, x2, y2 in rects:
+                inside |= ((centres[:, 0] >= x1) & (centres[:, 0] < x2) &
+                           (centres[:, 1] >= y1) & (centres[:, 1] < y2))
+            self.members[name] = np.flatnonzero(inside).tolist()
+            for slot in self.members[name]:
+                self.slot_zones[slot].append(name)
+
+        # Slots ordered by distance from each point; free lists hold positions in that order
+        self.order, self.rank, self.distance = {}, {}, {}
+        for name, (x, y) in self.points.items():
+            distance = np.hypot(centres[:, 0] - x, centres[:, 1] - y)
+            order = np.argsort(distance, kind='stable')
+            self.order[name] = order.tolist()
+            self.rank[name] = np.argsort(order).tolist()
+            self.distance[name] = distance.tolist()
+
+        self.state = np.zeros(count, bool)
+        self.free = {zone: list(slots) for zone, slots in self.members.items()}
+        self.occupied = {zone: [] for zone in self.members}
+        self.nearest = {(point, zone): sorted(self.rank[point][slot] for slot in slots)
+                        for point in self.points for zone, slots in self.members.items()}
+        self.seq = None  # result the states come from, None before the first update
+        self.updated = None
+        self.flips = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def update(self, states, seq=None):
+        """Apply one result's per-slot occupied flags"""
+        states = np.asarray(states, dtype=bool)
+        with self._lock:
+            for slot in np.flatnonzero(states != self.state).tolist():
+                self._flip(slot, bool(states[slot]))
+            self.seq = seq
+            self.updated = time.time()
+
+    def _flip(self, slot, occupied):
+        source, target = (self.free, self.occupied) if occupied else (self.occupied, self.free)
+        for zone in self.slot_zones[slot] + [None]:
+            _discard(source[zone], slot)
+            bisect.insort(target[zone], slot)
+            for point, rank in self.rank.items():
+                if occupied:
+                    _discard(self.nearest[(point, zone)], rank[slot])
+                else:
+                    bisect.insort(self.nearest[(point, zone)], rank[slot])
+        self.state[slot] = occupied
+        self.flips += 1
+
+    def _check_zone(self, zone):
+        if zone not in self.members:
+            raise ValueError(f"Unknown zone '{zone}'")
+
+    def counts(self):
+        """Free, occupied and total slots of the lot and of every zone"""
+        with self._lock:
+            return {zone: {'free': len(self.free[zone]), 'occupied': len(self.occupied[zone]),
+                           'total': len(self.members[zone])}
+                    for zone in self.members}
+
+    def describe(self, slot):
+        x, y = self.positions[slot]
+        return {'slot': slot, 'x': x, 'y': y, 'occupied': bool(self.state[slot]), 'zones': self.slot_zones[slot]}
+
+    def slots(self, zone=None, state='free', after=-1, limit=50):
+        """One page of slots in slot order, starting after slot number after; returns (slots, next cursor)"""
+        self._check_zone(zone)
+        if state not in STATES:
+            raise ValueError(f"state must be one of {', '.join(STATES)}")
+        with self._lock:
+            items = {'free': self.free, 'occupied': self.occupied, 'all': self.members}[state][zone]
+            start = bisect.bisect_right(items, after)
+            page = items[start:start + limit]
+            more = start + limit < len(items)
+            return [self.describe(slot) for slot in page], page[-1] if more and page else None
+
+    def nearest_free(self, point, zone=None, limit=1):
+        """The limit free slots closest to a named point, optionally within one zone"""
+        self._check_zone(zone)
+        if point not in self.points:
+            raise ValueError(f"Unknown point '{point}'")
+        with self._lock:
+            order, distance = self.order[point], self.distance[point]
+            return [dict(self.describe(order[rank]), distance=round(distance[order[rank]], 1))
+                    for rank in self.nearest[(point, zone)][:limit]]